@@ -0,0 +1,5 @@
+"""
+Benchmarks for CIDR-Bottle on synthetic full-size routing tables.
+
+Run with `python -m benchmarks run` from the repository root, see `python -m benchmarks --help`.
+"""
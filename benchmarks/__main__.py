@@ -0,0 +1,120 @@
+import argparse
+import json
+import sys
+from typing import Any, Dict
+
+from cidr_man.cidr import Version
+
+from .suite import IMPLEMENTATIONS, compare, run
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _report(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float, file=None
+) -> int:
+    rows = compare(baseline, current, threshold)
+    width = max((len(row[0]) for row in rows), default=0)
+    for name, before, after, ratio, regressed in rows:
+        flag = "REGRESSED" if regressed else ""
+        print(
+            f"{name:<{width}}  {before:>12.4g}  {after:>12.4g}  {ratio:>6.2f}x  {flag}",
+            file=file,
+        )
+    regressions = sum(row[4] for row in rows)
+    print(
+        f"{regressions} of {len(rows)} results regressed by more than {threshold:.0%}",
+        file=file,
+    )
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark Bottle and FastBottle on synthetic full-size routing tables.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="fraction of the full table sizes (1M IPv4 and 200k IPv6 prefixes) to use",
+    )
+    run_parser.add_argument(
+        "--implementation",
+        choices=list(IMPLEMENTATIONS),
+        action="append",
+        help="only benchmark this implementation, may be repeated",
+    )
+    run_parser.add_argument(
+        "--version",
+        choices=[4, 6],
+        type=int,
+        action="append",
+        help="only benchmark this IP version, may be repeated",
+    )
+    run_parser.add_argument(
+        "--compressed", action="store_true", help="use path compressed tries"
+    )
+    run_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="best of this many runs for the non-mutating workloads",
+    )
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", help="write the results to this JSON file")
+    run_parser.add_argument(
+        "--compare", metavar="BASELINE", help="compare the results against a JSON file"
+    )
+    run_parser.add_argument("--threshold", type=float, default=0.1)
+
+    compare_parser = commands.add_parser(
+        "compare", help="compare two JSON result files"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="fraction by which a result may be slower (or larger) than its baseline",
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return _report(_load(args.baseline), _load(args.current), args.threshold)
+
+    versions = [Version.v4, Version.v6]
+    if args.version:
+        versions = [version for version in versions if int(version) in args.version]
+    results = run(
+        scale=args.scale,
+        implementations=args.implementation or list(IMPLEMENTATIONS),
+        versions=versions,
+        compressed=args.compressed,
+        repeat=args.repeat,
+        seed=args.seed,
+        log=lambda message: print(message, file=sys.stderr),
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        # keep stdout parseable when the results are written to it
+        report_file = sys.stdout if args.output else sys.stderr
+        return _report(_load(args.compare), results, args.threshold, report_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
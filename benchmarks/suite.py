@@ -0,0 +1,338 @@
+import copy
+import copyreg
+import gc
+import pickle
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from cidr_man import CIDR
+from cidr_man.cidr import Version
+
+from cidr_bottle import Bottle, FastBottle
+
+from .tables import SIZES, addresses, generate
+
+IMPLEMENTATIONS = {"FastBottle": FastBottle, "Bottle": Bottle}
+
+# number of queries (and deletes) per workload at scale 1
+QUERIES = 200_000
+
+# children() is measured on the largest subtrees at this prefix length, and on the root
+SUBTREE_LEN = {Version.v4: 8, Version.v6: 12}
+SUBTREES = 32
+
+ROOTS = {Version.v4: "0.0.0.0/0", Version.v6: "::/0"}
+
+# prefixes pickled and deep-copied at scale 1, fewer than a full table as the default reduce path is slow
+PICKLED = 50_000
+
+RESULT_T = Dict[str, Dict[str, Any]]
+
+
+class _DefaultReduce:
+    """
+    Pickles and deep-copies nodes the way Python handles slotted classes without a custom reduce,
+    a dict of every slot per node, recursing through the left, right and parent links.
+    """
+
+    __slots__ = ()
+
+    def __reduce_ex__(self, protocol):
+        return (
+            copyreg.__newobj__,
+            (type(self),),
+            {slot: getattr(self, slot) for slot in _slots(type(self))},
+        )
+
+    def __setstate__(self, state: Dict[str, Any]):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+
+class _DefaultFastBottle(_DefaultReduce, FastBottle):
+    __slots__ = ()
+
+
+class _DefaultBottle(_DefaultReduce, Bottle):
+    __slots__ = ()
+
+
+DEFAULT_REDUCE = {FastBottle: _DefaultFastBottle, Bottle: _DefaultBottle}
+
+_SLOTS: Dict[type, Tuple[str, ...]] = {}
+
+
+def _slots(cls: type) -> Tuple[str, ...]:
+    if cls not in _SLOTS:
+        _SLOTS[cls] = tuple(
+            slot
+            for klass in cls.__mro__
+            for slot in klass.__dict__.get("__slots__", ())
+        )
+    return _SLOTS[cls]
+
+
+def _timed(run: Callable[[], int], repeat: int = 1) -> Dict[str, Any]:
+    """Best of repeat runs, run returns the number of operations it did."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ops = run()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[1]:
+            best = (ops, seconds)
+    ops, seconds = best
+    return {
+        "ops": ops,
+        "seconds": seconds,
+        "ops_per_second": ops / seconds if seconds else None,
+    }
+
+
+def _subtrees(root: FastBottle, prefix_len: int, count: int) -> List[FastBottle]:
+    """The count nodes holding the most prefixes among the first nodes at or below prefix_len."""
+    frontier = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node._prefix_len >= prefix_len:
+            frontier.append(node)
+            continue
+        stack.extend(child for child in (node.left, node.right) if child is not None)
+    frontier.sort(key=len, reverse=True)
+    return frontier[:count]
+
+
+def _invalidate(nodes: Sequence[FastBottle]):
+    # children() results are cached, so they are dropped to measure the walk
+    for node in nodes:
+        node._changed = True
+        node._children = None
+
+
+def run_version(
+    name: str,
+    version: Version,
+    table: List[Tuple[CIDR, int]],
+    queries: int,
+    pickled: int,
+    compressed: bool,
+    repeat: int,
+) -> RESULT_T:
+    cls = IMPLEMENTATIONS[name]
+    rng = random.Random(f"{name}-{int(version)}")
+    hosts = addresses(version, table, queries)
+    sample = [prefix for prefix, _ in rng.sample(table, min(queries, len(table)))]
+    if cls is Bottle:
+        # Bottle is measured with its usual string inputs and outputs, parsing included
+        items = [(prefix.compressed, value) for prefix, value in table]
+        hosts = [host.compressed for host in hosts]
+        sample = [prefix.compressed for prefix in sample]
+        root = ROOTS[version]
+
+        def new():
+            return Bottle(prefix=root, compressed=compressed)
+
+        def bulk(aggregate: bool, klass: type = Bottle, source=None):
+            return klass.bulk_load(
+                items if source is None else source,
+                prefix=root,
+                aggregate=aggregate,
+                compressed=compressed,
+            )
+
+    else:
+        items = table
+        root = CIDR(ROOTS[version])
+
+        def new():
+            return FastBottle(prefix=root, compressed=compressed)
+
+        def bulk(aggregate: bool, klass: type = FastBottle, source=None):
+            return klass.from_sorted(
+                items if source is None else source,
+                prefix=root,
+                aggregate=aggregate,
+                compressed=compressed,
+            )
+
+    results: RESULT_T = {}
+    trie = new()
+
+    def insert():
+        for prefix, value in items:
+            trie.insert(prefix, value)
+        return len(items)
+
+    results["insert"] = _timed(insert)
+    results["bulk_load"] = _timed(lambda: bulk(False) and len(items), repeat)
+    results["bulk_aggregate"] = _timed(lambda: bulk(True) and len(items), repeat)
+
+    def get_exact():
+        for prefix in sample:
+            trie.get(prefix, exact=True)
+        return len(sample)
+
+    def get_lpm():
+        for host in hosts:
+            trie.get(host)
+        return len(hosts)
+
+    def get_covering():
+        for prefix in sample:
+            trie.get(prefix, covering=True)
+        return len(sample)
+
+    def contains():
+        for host in hosts:
+            trie.contains(host)
+        return len(hosts)
+
+    results["get_exact"] = _timed(get_exact, repeat)
+    results["get_lpm"] = _timed(get_lpm, repeat)
+    results["get_covering"] = _timed(get_covering, repeat)
+    results["contains"] = _timed(contains, repeat)
+
+    subtrees = _subtrees(trie, SUBTREE_LEN[version], SUBTREES)
+    path = []
+    for node in subtrees:
+        while node is not None:
+            path.append(node)
+            node = node.parent
+
+    def children():
+        _invalidate(path)
+        return sum(len(node.children()) for node in subtrees)
+
+    def children_root():
+        _invalidate((trie,))
+        return len(trie.children())
+
+    results["children"] = _timed(children, repeat)
+    results["children_root"] = _timed(children_root, repeat)
+
+    def delete():
+        for prefix in sample:
+            trie.delete(prefix)
+        return len(sample)
+
+    results["delete"] = _timed(delete)
+    del trie
+
+    # the custom reduce (a flat preorder state) against Python's default one for slotted classes
+    for suffix, klass in (("", cls), ("_default", DEFAULT_REDUCE[cls])):
+        pickled_trie = bulk(False, klass, items[:pickled])
+        dumped = pickle.dumps(pickled_trie, pickle.HIGHEST_PROTOCOL)
+        results["pickle_dumps" + suffix] = _timed(
+            lambda: pickle.dumps(pickled_trie, pickle.HIGHEST_PROTOCOL)
+            and len(pickled_trie),
+            repeat,
+        )
+        results["pickle_loads" + suffix] = _timed(
+            lambda: len(pickle.loads(dumped)), repeat
+        )
+        results["deepcopy" + suffix] = _timed(
+            lambda: len(copy.deepcopy(pickled_trie)), repeat
+        )
+        results["pickle_size" + suffix] = {
+            "prefixes": len(pickled_trie),
+            "bytes": len(dumped),
+            "bytes_per_prefix": len(dumped) / len(pickled_trie),
+        }
+        del pickled_trie, dumped
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        built = bulk(False)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    results["memory"] = {
+        "prefixes": len(built),
+        "peak_bytes": peak,
+        "bytes_per_prefix": peak / len(built),
+    }
+
+    # only the frozen copy is traced, the trie it is compiled from was allocated before
+    gc.collect()
+    tracemalloc.start()
+    try:
+        frozen = built.freeze()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    results["memory_frozen"] = {
+        "prefixes": len(frozen),
+        "peak_bytes": peak,
+        "retained_bytes": retained,
+        "bytes_per_prefix": peak / len(frozen),
+    }
+    return results
+
+
+def run(
+    scale: float = 1.0,
+    implementations: Sequence[str] = tuple(IMPLEMENTATIONS),
+    versions: Sequence[Version] = (Version.v4, Version.v6),
+    compressed: bool = False,
+    repeat: int = 1,
+    seed: int = 0,
+    log: Callable[[str], Any] = lambda message: None,
+) -> Dict[str, Any]:
+    """Run every workload, results are keyed by implementation/version/workload."""
+    results: RESULT_T = {}
+    queries = max(1, int(QUERIES * scale))
+    pickled = max(1, int(PICKLED * scale))
+    for version in versions:
+        size = max(1, int(SIZES[version] * scale))
+        log(f"generating {size} IPv{int(version)} prefixes")
+        table = generate(version, size, seed)
+        for name in implementations:
+            log(f"running {name} IPv{int(version)}")
+            for workload, result in run_version(
+                name, version, table, queries, pickled, compressed, repeat
+            ).items():
+                results[f"{name}/v{int(version)}/{workload}"] = result
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "scale": scale,
+            "seed": seed,
+            "compressed": compressed,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def _cost(result: Dict[str, Any]) -> float:
+    """Lower is better, seconds per operation or bytes per prefix."""
+    if "bytes_per_prefix" in result:
+        return result["bytes_per_prefix"]
+    return result["seconds"] / result["ops"]
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1
+) -> List[Tuple[str, float, float, float, bool]]:
+    """
+    (name, baseline cost, current cost, ratio, regressed) for every result in both runs,
+    a result regresses when it costs more than (1 + threshold) times its baseline.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = _cost(baseline["results"][name])
+        after = _cost(result)
+        ratio = after / before if before else float("inf")
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
@@ -0,0 +1,110 @@
+import random
+from typing import Dict, List, Tuple
+
+from cidr_man import CIDR
+from cidr_man.cidr import Version
+
+# approximate prefix length distributions of the IPv4 and IPv6 default-free zones
+LENGTHS = {
+    Version.v4: {
+        24: 0.595,
+        23: 0.095,
+        22: 0.115,
+        21: 0.045,
+        20: 0.045,
+        19: 0.035,
+        18: 0.015,
+        17: 0.01,
+        16: 0.0135,
+        15: 0.002,
+        14: 0.002,
+        13: 0.001,
+        12: 0.0005,
+        11: 0.0003,
+        10: 0.0001,
+        9: 0.0001,
+        8: 0.00001,
+    },
+    Version.v6: {
+        48: 0.47,
+        47: 0.02,
+        46: 0.04,
+        45: 0.01,
+        44: 0.08,
+        42: 0.02,
+        40: 0.07,
+        36: 0.04,
+        35: 0.01,
+        34: 0.01,
+        33: 0.02,
+        32: 0.15,
+        31: 0.005,
+        30: 0.005,
+        29: 0.035,
+        28: 0.005,
+        24: 0.005,
+        20: 0.002,
+        19: 0.003,
+    },
+}
+
+# full table sizes
+SIZES = {Version.v4: 1_000_000, Version.v6: 200_000}
+
+# prefixes are drawn from a pool of allocations of this length, so they cluster like real tables
+ALLOCATION_LEN = {Version.v4: 12, Version.v6: 19}
+ALLOCATIONS = {Version.v4: 2048, Version.v6: 4096}
+
+
+def _allocations(rng: random.Random, version: Version) -> List[int]:
+    length = ALLOCATION_LEN[version]
+    blocks = set()
+    while len(blocks) < ALLOCATIONS[version]:
+        if version == Version.v4:
+            # 1.0.0.0 to 223.255.255.255
+            block = rng.randrange(1 << (length - 8), 224 << (length - 8))
+        else:
+            # 2000::/3
+            block = 1 << (length - 3) | rng.getrandbits(length - 3)
+        blocks.add(block)
+    return sorted(blocks)
+
+
+def generate(version: Version, size: int, seed: int = 0) -> List[Tuple[CIDR, int]]:
+    """A deterministic synthetic table of size unique (prefix, value) pairs."""
+    rng = random.Random(f"{seed}-{int(version)}-{size}")
+    max_bits = 32 if version == Version.v4 else 128
+    blocks = _allocations(rng, version)
+    allocation_len = ALLOCATION_LEN[version]
+    lengths = list(LENGTHS[version])
+    weights = [LENGTHS[version][length] for length in lengths]
+    table: Dict[Tuple[int, int], None] = {}
+    while len(table) < size:
+        for length in rng.choices(lengths, weights, k=size - len(table)):
+            block = rng.choice(blocks)
+            if length <= allocation_len:
+                network = block >> (allocation_len - length)
+            else:
+                network = block << (length - allocation_len) | rng.getrandbits(
+                    length - allocation_len
+                )
+            table[(network << (max_bits - length), length)] = None
+    return [(CIDR(ip, version, length), i) for i, (ip, length) in enumerate(table)]
+
+
+def addresses(
+    version: Version, table: List[Tuple[CIDR, int]], count: int, seed: int = 0
+) -> List[CIDR]:
+    """Host addresses, mostly within the prefixes of table and some outside of it."""
+    rng = random.Random(f"{seed}-{int(version)}-addresses")
+    max_bits = 32 if version == Version.v4 else 128
+    result = []
+    for _ in range(count):
+        if rng.random() < 0.9:
+            prefix = rng.choice(table)[0]
+            host_bits = max_bits - prefix.prefix_len
+            ip = prefix.ip | rng.getrandbits(host_bits) if host_bits else prefix.ip
+        else:
+            ip = rng.getrandbits(max_bits)
+        result.append(CIDR(ip, version, max_bits))
+    return result
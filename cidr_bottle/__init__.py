@@ -1,2 +1,11 @@
 from .cidr_bottle import Bottle
-from .cidr_bottle_fast import FastBottle
+from .cidr_bottle_fast import FastBottle, Changes, Diff
+from .cidr_bottle_frozen import FrozenBottle
+from .cidr_bottle_mapped import MappedBottle
+from ._batch import BatchResult
+from .cidr_bottle_stats import Counters, Stats
+from .cidr_bottle_roa import RoaBottle, Roa, Validity
+from .cidr_bottle_parallel import ParallelBottle
+from .cidr_bottle_dual import DualBottle
+from .cidr_bottle_persistent import PersistentBottle
+from .cidr_bottle_journal import Journal, Entry, Op
@@ -0,0 +1,170 @@
+from typing import Any, List, NamedTuple, Tuple, Union
+
+from cidr_man.cidr import max_prefix, Version
+
+ADDRESSES_T = Union[Any, Tuple[Any, Any]]
+
+_ALL_BITS = 0xFFFFFFFFFFFFFFFF
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:  # pragma: no cover - depends on the environment
+        raise ImportError(
+            "batch operations require numpy, install it with `pip install cidr_bottle[numpy]`"
+        ) from e
+    return numpy
+
+
+class BatchResult(NamedTuple):
+    """
+    Result of a batch lookup.
+
+    index holds, for every query, the position of the matched node in nodes (or -1 when nothing matched).
+    ip is a uint32 array for IPv4 and a (high, low) pair of uint64 arrays for IPv6.
+    """
+
+    nodes: List[Any]
+    index: Any
+    ip: ADDRESSES_T
+    prefix_len: Any
+    exact: Any
+
+
+class FlatTrie(NamedTuple):
+    """Struct-of-arrays copy of a (sub-)trie in preorder, the first entry is the node it was built from."""
+
+    nodes: List[Any]
+    left: Any
+    right: Any
+    ip_high: Any
+    ip_low: Any
+    prefix_len: Any
+    passing: Any
+    version: Version
+
+
+def flatten(root) -> FlatTrie:
+    np = _numpy()
+    nodes = []
+    left = []
+    right = []
+    positions = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        positions[id(node)] = len(nodes)
+        nodes.append(node)
+        if node.right is not None:
+            stack.append(node.right)
+        if node.left is not None:
+            stack.append(node.left)
+    for node in nodes:
+        left.append(-1 if node.left is None else positions[id(node.left)])
+        right.append(-1 if node.right is None else positions[id(node.right)])
+    return FlatTrie(
+        nodes=nodes,
+        left=np.array(left, dtype=np.int64),
+        right=np.array(right, dtype=np.int64),
+        ip_high=np.array([node._ip >> 64 for node in nodes], dtype=np.uint64),
+        ip_low=np.array([node._ip & _ALL_BITS for node in nodes], dtype=np.uint64),
+        prefix_len=np.array([node._prefix_len for node in nodes], dtype=np.int64),
+        passing=np.array([node.passing for node in nodes], dtype=bool),
+        version=root._version,
+    )
+
+
+def _split_addresses(version: Version, addresses: ADDRESSES_T):
+    np = _numpy()
+    if version == Version.v4:
+        low = np.asarray(addresses).astype(np.uint64)
+        return np.zeros(low.shape, dtype=np.uint64), low
+    high, low = addresses
+    return np.asarray(high).astype(np.uint64), np.asarray(low).astype(np.uint64)
+
+
+def _leading_mask(bits):
+    """uint64 masks selecting the first `bits` (0-64) bits of a word."""
+    np = _numpy()
+    shift = np.clip(64 - bits, 0, 63).astype(np.uint64)
+    return np.where(bits <= 0, np.uint64(0), np.uint64(_ALL_BITS) << shift)
+
+
+def lookup(
+    flat: FlatTrie, addresses: ADDRESSES_T, prefix_lens=None, covering: bool = False
+) -> BatchResult:
+    """
+    Longest prefix match for a whole batch, advancing every query one node per step.
+    Semantics match FastBottle._find(prefix, covering=covering).
+    """
+    np = _numpy()
+    max_bits = max_prefix(flat.version)
+    offset = 128 - max_bits
+    high, low = _split_addresses(flat.version, addresses)
+    count = low.shape[0]
+    if prefix_lens is None:
+        lengths = np.full(count, max_bits, dtype=np.int64)
+    else:
+        lengths = np.broadcast_to(np.asarray(prefix_lens, dtype=np.int64), (count,))
+        # strip host bits, as CIDR does
+        high = high & _leading_mask(np.minimum(offset + lengths, 64))
+        low = low & _leading_mask(np.maximum(offset + lengths - 64, 0))
+
+    def matches(queries, nodes):
+        # compare the first (offset + prefix_len) bits of the queries with those of the nodes
+        bits = offset + flat.prefix_len[nodes]
+        high_mask = _leading_mask(np.minimum(bits, 64))
+        low_mask = _leading_mask(np.maximum(bits - 64, 0))
+        return (((high[queries] ^ flat.ip_high[nodes]) & high_mask) == 0) & (
+            ((low[queries] ^ flat.ip_low[nodes]) & low_mask) == 0
+        )
+
+    current = np.full(count, -1, dtype=np.int64)
+    most_recent_non_passing = np.full(count, -1, dtype=np.int64)
+    active = np.arange(count)
+    active = active[matches(active, np.zeros(count, dtype=np.int64))]
+    current[active] = 0
+    if not flat.passing[0]:
+        most_recent_non_passing[active] = 0
+    while active.size:
+        nodes = current[active]
+        positions = offset + flat.prefix_len[nodes]
+        deeper = lengths[active] > flat.prefix_len[nodes]
+        active, nodes, positions = active[deeper], nodes[deeper], positions[deeper]
+        if not active.size:
+            break
+        bit = np.where(
+            positions < 64,
+            high[active] >> np.clip(63 - positions, 0, 63).astype(np.uint64),
+            low[active] >> np.clip(127 - positions, 0, 63).astype(np.uint64),
+        ) & np.uint64(1)
+        children = np.where(bit == 1, flat.right[nodes], flat.left[nodes])
+        found = children >= 0
+        active, children = active[found], children[found]
+        if flat.nodes[0].compressed:
+            found = (flat.prefix_len[children] <= lengths[active]) & matches(
+                active, children
+            )
+            active, children = active[found], children[found]
+        current[active] = children
+        non_passing = ~flat.passing[children]
+        most_recent_non_passing[active[non_passing]] = children[non_passing]
+    index = current
+    if covering:
+        passing = np.zeros(count, dtype=bool)
+        passing[index >= 0] = flat.passing[index[index >= 0]]
+        index = np.where(passing, most_recent_non_passing, index)
+    matched = index >= 0
+    safe = np.where(matched, index, 0)
+    prefix_len = np.where(matched, flat.prefix_len[safe], 0).astype(np.uint8)
+    ip_high = np.where(matched, flat.ip_high[safe], np.uint64(0))
+    ip_low = np.where(matched, flat.ip_low[safe], np.uint64(0))
+    ip = ip_low.astype(np.uint32) if flat.version == Version.v4 else (ip_high, ip_low)
+    return BatchResult(
+        nodes=flat.nodes,
+        index=index,
+        ip=ip,
+        prefix_len=prefix_len,
+        exact=matched & (flat.prefix_len[safe] == lengths),
+    )
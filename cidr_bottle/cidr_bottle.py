@@ -1,15 +1,38 @@
+from functools import lru_cache
 from ipaddress import IPv4Network, IPv6Network, IPv6Address, IPv4Address
-from typing import Union, Optional, Any, Type
+from operator import eq
+from typing import Union, Optional, Any, Callable, Type, Iterable, Iterator, Tuple
 
 from cidr_man import CIDR
 
-from .cidr_bottle_fast import FastBottle
+from .cidr_bottle_fast import Changes, FastBottle
 
 
 PREFIX_UNION_T = Union[
     str, int, bytes, CIDR, IPv4Network, IPv6Network, IPv4Address, IPv6Address
 ]
 
+PARSE_CACHE_SIZE = 1 << 16
+
+# how node prefixes are returned for each input type, any other type gets the CIDR itself
+_CONVERSIONS = {
+    str: str,
+    int: int,
+    bytes: bytes,
+    IPv4Network: lambda prefix: IPv4Network(str(prefix)),
+    IPv4Address: lambda prefix: IPv4Network(str(prefix)),
+    IPv6Network: lambda prefix: IPv6Network(str(prefix)),
+    IPv6Address: lambda prefix: IPv6Network(str(prefix)),
+}
+
+_parse_cached = lru_cache(maxsize=PARSE_CACHE_SIZE, typed=True)(CIDR)
+
+
+def _parse(prefix: PREFIX_UNION_T) -> CIDR:
+    if isinstance(prefix, CIDR):
+        return prefix
+    return _parse_cached(prefix)
+
 
 class Bottle(FastBottle):
     """
@@ -19,11 +42,13 @@ class Bottle(FastBottle):
     Grab a bottle!
     """
 
+    __slots__ = ("_cls", "_converted")
+
     left: "Bottle"
     right: "Bottle"
     parent: "Bottle"
-    _prefix: CIDR
     _cls: Type
+    _converted: Any
     value: Any
     passing: bool
 
@@ -36,35 +61,56 @@ class Bottle(FastBottle):
         value: Optional[Any] = None,
         passing: Optional[bool] = True,
         cls: Optional[Type] = None,
+        compressed: bool = False,
     ):
-        super().__init__()
+        super().__init__(compressed=compressed)
         self.left = left
         self.right = right
         self.parent = parent
         if prefix is None:
             self._prefix = CIDR("0.0.0.0/0")
-        elif not isinstance(prefix, CIDR):
-            self._prefix = CIDR(prefix)
         else:
-            self._prefix = prefix
+            self._prefix = _parse(prefix)
         self._cls = cls if cls is not None else prefix.__class__
+        self._converted = None
         self.value = value
         self.passing = passing
+        self._count = 0 if passing else 1
+        for child in (left, right):
+            if child is not None:
+                self._count += child._count
 
     @property
     def prefix(self):
-        return self.__convert(self._prefix)
+        convert = _CONVERSIONS.get(self._cls)
+        if convert is None:
+            return self._prefix
+        if self._converted is None:
+            self._converted = convert(self._prefix)
+        return self._converted
 
     @prefix.setter
     def prefix(
         self,
         prefix: PREFIX_UNION_T,
     ):
-        if not isinstance(prefix, CIDR):
-            self._prefix = CIDR(prefix)
-        else:
-            self._prefix = prefix
+        self._prefix = _parse(prefix)
         self._cls = type(prefix)
+        self._converted = None
+
+    @staticmethod
+    def parse_cache_info():
+        """
+        Statistics (hits, misses, maxsize, currsize) of the LRU cache shared by all Bottles for parsing input prefixes,
+        the hit rate is hits / (hits + misses).
+        """
+        return _parse_cached.cache_info()
+
+    @staticmethod
+    def resize_parse_cache(maxsize: Optional[int] = PARSE_CACHE_SIZE):
+        """Replace the parse cache with an empty one holding up to maxsize prefixes (None for unbounded, 0 to disable it)."""
+        global _parse_cached
+        _parse_cached = lru_cache(maxsize=maxsize, typed=True)(CIDR)
 
     def get(
         self,
@@ -72,38 +118,65 @@ class Bottle(FastBottle):
         exact: Optional[bool] = False,
         covering: Optional[bool] = False,
     ) -> "Bottle":
-        if not isinstance(prefix, CIDR):
-            prefix = CIDR(prefix)
-        node = self._find(prefix, covering)
-        if exact and node.prefix != prefix:
-            raise KeyError("no exact match found")
-        return node
+        prefix = _parse(prefix)
+        return super().get(prefix, exact, covering)
 
     def insert(
         self,
         prefix: PREFIX_UNION_T,
         value=None,
+        aggregate: bool = False,
     ):
-        if not isinstance(prefix, CIDR):
-            prefix = CIDR(prefix)
-        node = self.set(prefix, value=value)
+        prefix = _parse(prefix)
+        node = self.set(prefix, value=value, aggregate=aggregate)
         node._cls = self._cls
 
+    @classmethod
+    def bulk_load(
+        cls,
+        items: Iterable[Tuple[PREFIX_UNION_T, Any]],
+        prefix: Optional[PREFIX_UNION_T] = None,
+        aggregate: bool = False,
+        compressed: bool = False,
+    ) -> "Bottle":
+        root = cls(prefix=prefix, compressed=compressed)
+        root._bulk_insert(
+            ((_parse(item), value) for item, value in items),
+            aggregate,
+        )
+        return root
+
     def delete(
         self,
         prefix: PREFIX_UNION_T,
     ):
-        if not isinstance(prefix, CIDR):
-            prefix = CIDR(prefix)
+        prefix = _parse(prefix)
         self.set(prefix, delete=True)
 
+    def apply_updates(
+        self,
+        announce: Iterable[Tuple[PREFIX_UNION_T, Any]] = (),
+        withdraw: Iterable[PREFIX_UNION_T] = (),
+    ) -> Changes:
+        changes = super().apply_updates(
+            [(_parse(prefix), value) for prefix, value in announce],
+            [_parse(prefix) for prefix in withdraw],
+        )
+        convert = _CONVERSIONS.get(self._cls)
+        if convert is None:
+            return changes
+        return Changes(
+            [(convert(prefix), value) for prefix, value in changes.added],
+            [(convert(prefix), value) for prefix, value in changes.removed],
+            [(convert(prefix), old, new) for prefix, old, new in changes.changed],
+        )
+
     def contains(
         self,
         prefix: PREFIX_UNION_T,
         exact: bool = False,
     ) -> bool:
-        if not isinstance(prefix, CIDR):
-            prefix = CIDR(prefix)
+        prefix = _parse(prefix)
         return super().contains(prefix, exact)
 
     def set(
@@ -111,47 +184,104 @@ class Bottle(FastBottle):
         prefix: PREFIX_UNION_T,
         value=None,
         delete=False,
+        aggregate=False,
     ):
-        if not isinstance(prefix, CIDR):
-            prefix = CIDR(prefix)
-        return super().set(prefix, value, delete)
+        prefix = _parse(prefix)
+        return super().set(prefix, value, delete, aggregate)
 
     def children(self):
-        return [self.__convert(child) for child in super().children()]
-
-    def __convert(self, prefix):
-        if self._cls is CIDR:
-            return prefix
-        elif self._cls is str:
-            return str(prefix)
-        elif self._cls is int:
-            return int(prefix)
-        elif self._cls is bytes:
-            return bytes(prefix)
-        elif self._cls in [IPv4Network, IPv4Address]:
-            return IPv4Network(str(prefix))
-        elif self._cls in [IPv6Network, IPv6Address]:
-            return IPv6Network(str(prefix))
-        return prefix
+        return [self.__convert_node(child) for child in super().children()]
+
+    def iter_children(
+        self,
+        max_depth: Optional[int] = None,
+        predicate: Optional[Callable[["Bottle"], bool]] = None,
+    ) -> Iterator[Any]:
+        for child in super().iter_children(max_depth, predicate):
+            yield self.__convert_node(child)
+
+    def overlapping(self, start: PREFIX_UNION_T, end: PREFIX_UNION_T):
+        return [
+            self.__convert_node(node)
+            for node in super().overlapping(_parse(start), _parse(end))
+        ]
+
+    def iter_range(self, start: PREFIX_UNION_T, end: PREFIX_UNION_T) -> Iterator[Any]:
+        for node in super().iter_range(_parse(start), _parse(end)):
+            yield self.__convert_node(node)
+
+    def successor(self, prefix: PREFIX_UNION_T) -> Optional["Bottle"]:
+        prefix = _parse(prefix)
+        return super().successor(prefix)
+
+    def predecessor(self, prefix: PREFIX_UNION_T) -> Optional["Bottle"]:
+        prefix = _parse(prefix)
+        return super().predecessor(prefix)
+
+    def summarize(
+        self, value_equal: Callable[[Any, Any], bool] = eq
+    ) -> Iterator[Tuple[Any, Any]]:
+        convert = _CONVERSIONS.get(self._cls)
+        for prefix, value in super().summarize(value_equal):
+            yield (prefix if convert is None else convert(prefix)), value
+
+    def gaps(self, count: bool = False):
+        convert = _CONVERSIONS.get(self._cls)
+        prefixes, addresses = super().gaps(count=True)
+        if convert is not None:
+            prefixes = [convert(prefix) for prefix in prefixes]
+        if count:
+            return prefixes, addresses
+        return prefixes
+
+    def iter_free(
+        self, min_len: Optional[int] = None, max_len: Optional[int] = None
+    ) -> Iterator[Any]:
+        convert = _CONVERSIONS.get(self._cls)
+        for prefix in super().iter_free(min_len, max_len):
+            yield prefix if convert is None else convert(prefix)
+
+    def __getstate__(self) -> tuple:
+        return super().__getstate__() + (self._cls,)
+
+    def __setstate__(self, state: tuple):
+        # set first, so the rebuilt nodes inherit it
+        self._cls = state[6]
+        self._converted = None
+        super().__setstate__(state)
+
+    def __convert_node(self, node: "Bottle"):
+        """A descendant's prefix as this node's prefix type, memoised on the descendant."""
+        convert = _CONVERSIONS.get(self._cls)
+        if convert is None:
+            # the node itself stands in for its prefix
+            return node
+        if node._cls is not self._cls:
+            return convert(node._prefix)
+        if node._converted is None:
+            node._converted = convert(node._prefix)
+        return node._converted
+
+    def _create_node(self, ip: int, prefix_len: int, parent: "Bottle") -> "Bottle":
+        node = super()._create_node(ip, prefix_len, parent)
+        node._cls = self._cls
+        node._converted = None
+        return node
 
     def __contains__(self, prefix: PREFIX_UNION_T) -> bool:
-        if not isinstance(prefix, CIDR):
-            prefix = CIDR(prefix)
+        prefix = _parse(prefix)
         return super().contains(prefix)
 
     def __getitem__(self, prefix: PREFIX_UNION_T) -> Optional["Bottle"]:
-        if not isinstance(prefix, CIDR):
-            prefix = CIDR(prefix)
+        prefix = _parse(prefix)
         return self.get(prefix)
 
     def __setitem__(self, prefix: PREFIX_UNION_T, value):
-        if not isinstance(prefix, CIDR):
-            prefix = CIDR(prefix)
+        prefix = _parse(prefix)
         return super().insert(prefix, value)
 
     def __delitem__(self, prefix: PREFIX_UNION_T):
-        if not isinstance(prefix, CIDR):
-            prefix = CIDR(prefix)
+        prefix = _parse(prefix)
         return super().set(prefix, delete=True)
 
     def _find(
@@ -160,6 +290,5 @@ class Bottle(FastBottle):
         create_if_missing: bool = False,
         covering: bool = False,
     ):
-        if not isinstance(prefix, CIDR):
-            prefix = CIDR(prefix)
+        prefix = _parse(prefix)
         return super()._find(prefix, create_if_missing, covering=covering)
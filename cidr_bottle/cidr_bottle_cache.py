@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple
+
+POLICIES = ("lru", "clock")
+
+# returned by QueryCache.get for keys that are not cached
+MISSING = object()
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class QueryCache:
+    """
+    Bounded cache of lookup results with LRU or CLOCK (second chance) eviction.
+
+    Every mutation of the trie bumps generation, the entries are dropped by the next lookup that sees a new generation,
+    so a result is never served from before an insert or delete.
+    """
+
+    __slots__ = (
+        "maxsize",
+        "policy",
+        "generation",
+        "hits",
+        "misses",
+        "_generation",
+        "_entries",
+        "_keys",
+        "_referenced",
+        "_hand",
+    )
+
+    def __init__(self, maxsize: int = 65536, policy: str = "lru"):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        if policy not in POLICIES:
+            raise ValueError(
+                f"unknown eviction policy {policy}, expected one of {POLICIES}"
+            )
+        self.maxsize = maxsize
+        self.policy = policy
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self._generation = self.generation
+        if self.policy == "lru":
+            self._entries = OrderedDict()
+        else:
+            # key -> (slot, value), the slots form the clock
+            self._entries = {}
+            self._keys = [None] * self.maxsize
+            self._referenced = bytearray(self.maxsize)
+            self._hand = 0
+
+    def get(self, key: Hashable) -> Any:
+        if self._generation != self.generation:
+            self.clear()
+        entries = self._entries
+        if key not in entries:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        if self.policy == "lru":
+            entries.move_to_end(key)
+            return entries[key]
+        slot, value = entries[key]
+        self._referenced[slot] = 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        if self._generation != self.generation:
+            self.clear()
+        entries = self._entries
+        if self.policy == "lru":
+            entries[key] = value
+            if len(entries) > self.maxsize:
+                entries.popitem(last=False)
+            return
+        if key in entries:
+            slot = entries[key][0]
+        elif len(entries) < self.maxsize:
+            slot = len(entries)
+        else:
+            # sweep the hand past recently used slots, giving each a second chance
+            referenced = self._referenced
+            while referenced[self._hand]:
+                referenced[self._hand] = 0
+                self._hand = (self._hand + 1) % self.maxsize
+            slot = self._hand
+            self._hand = (slot + 1) % self.maxsize
+            del entries[self._keys[slot]]
+        self._keys[slot] = key
+        self._referenced[slot] = 0
+        entries[key] = (slot, value)
+
+    def info(self) -> CacheInfo:
+        size = 0 if self._generation != self.generation else len(self._entries)
+        return CacheInfo(self.hits, self.misses, self.maxsize, size)
+
+    def __len__(self) -> int:
+        return self.info().currsize
+
+    def __repr__(self):
+        return f"{type(self).__name__}(maxsize={self.maxsize}, policy={self.policy!r})"
@@ -0,0 +1,168 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from cidr_man import CIDR
+from cidr_man.cidr import Version
+
+from ._batch import _numpy
+from .cidr_bottle_fast import FastBottle
+
+_ALL_BITS = 0xFFFFFFFFFFFFFFFF
+
+
+class DualBottle:
+    """
+    cidr_bottle.DualBottle holds an IPv4 and an IPv6 trie side by side and dispatches every call to the one matching the prefix,
+    so mixed-family tables need neither two roots nor a version check per prefix in the caller.
+
+    The batch methods split their input into one group per family, handle each group in bulk and return the results in input order.
+    """
+
+    __slots__ = ("v4", "v6")
+
+    v4: FastBottle
+    v6: FastBottle
+
+    def __init__(
+        self,
+        v4: Optional[FastBottle] = None,
+        v6: Optional[FastBottle] = None,
+        compressed: bool = False,
+    ):
+        if v4 is None:
+            v4 = FastBottle(prefix=CIDR("0.0.0.0/0"), compressed=compressed)
+        if v6 is None:
+            v6 = FastBottle(prefix=CIDR("::/0"), compressed=compressed)
+        if v4._version != Version.v4 or v6._version != Version.v6:
+            raise ValueError("incompatible network version")
+        self.v4 = v4
+        self.v6 = v6
+
+    def root(self, prefix: Union[CIDR, str]) -> FastBottle:
+        """The trie for the family of prefix."""
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        return self.v4 if prefix.version == Version.v4 else self.v6
+
+    def get(
+        self, prefix: Union[CIDR, str], exact: bool = False, covering: bool = False
+    ) -> Optional[FastBottle]:
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        return self.root(prefix).get(prefix, exact, covering)
+
+    def insert(
+        self, prefix: Union[CIDR, str], value: Any = None, aggregate: bool = False
+    ):
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        self.root(prefix).insert(prefix, value, aggregate)
+
+    def delete(self, prefix: Union[CIDR, str]):
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        self.root(prefix).delete(prefix)
+
+    def contains(self, prefix: Union[CIDR, str], exact: bool = False) -> bool:
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        return self.root(prefix).contains(prefix, exact)
+
+    def children(self) -> List[Any]:
+        """The children of both tries, IPv4 first."""
+        return self.v4.children() + self.v6.children()
+
+    def iter_children(self) -> Iterator[Any]:
+        yield from self.v4.iter_children()
+        yield from self.v6.iter_children()
+
+    def insert_many(
+        self, items: Iterable[Tuple[Union[CIDR, str], Any]], aggregate: bool = False
+    ):
+        """Insert (prefix, value) pairs of both families, loading each family's group in a single pass (see FastBottle.from_sorted)."""
+        groups: Dict[Version, List[Tuple[CIDR, Any]]] = {
+            Version.v4: [],
+            Version.v6: [],
+        }
+        for prefix, value in items:
+            if not isinstance(prefix, CIDR):
+                prefix = CIDR(prefix)
+            groups[prefix.version].append((prefix, value))
+        for version, group in groups.items():
+            if group:
+                self._roots[version]._bulk_insert(group, aggregate)
+
+    def get_many(
+        self, prefixes: Sequence[Union[CIDR, str]], covering: bool = False
+    ) -> List[Optional[FastBottle]]:
+        """Equivalent of [self.get(prefix, covering=covering) for prefix in prefixes], with a batch lookup (see FastBottle.get_many) per family."""
+        results: List[Optional[FastBottle]] = [None] * len(prefixes)
+        for positions, result in self._lookup(prefixes, covering):
+            nodes = result.nodes
+            for i, index in zip(positions, result.index.tolist()):
+                if index >= 0:
+                    results[i] = nodes[index]
+        return results
+
+    def contains_many(
+        self, prefixes: Sequence[Union[CIDR, str]], exact: bool = False
+    ) -> List[bool]:
+        """Equivalent of [self.contains(prefix, exact) for prefix in prefixes]."""
+        results = [False] * len(prefixes)
+        for positions, result in self._lookup(prefixes, False):
+            found = result.exact if exact else result.index >= 0
+            for i, contained in zip(positions, found.tolist()):
+                results[i] = contained
+        return results
+
+    def _lookup(self, prefixes: Sequence[Union[CIDR, str]], covering: bool):
+        """Yield (input positions, BatchResult) for each family present in prefixes."""
+        np = _numpy()
+        groups: Dict[Version, Tuple[List[int], List[int], List[int]]] = {
+            Version.v4: ([], [], []),
+            Version.v6: ([], [], []),
+        }
+        for i, prefix in enumerate(prefixes):
+            if not isinstance(prefix, CIDR):
+                prefix = CIDR(prefix)
+            positions, ips, prefix_lens = groups[prefix.version]
+            positions.append(i)
+            ips.append(prefix.ip)
+            prefix_lens.append(prefix.prefix_len)
+        for version, (positions, ips, prefix_lens) in groups.items():
+            if not positions:
+                continue
+            if version == Version.v4:
+                addresses = np.array(ips, dtype=np.uint32)
+            else:
+                addresses = (
+                    np.array([ip >> 64 for ip in ips], dtype=np.uint64),
+                    np.array([ip & _ALL_BITS for ip in ips], dtype=np.uint64),
+                )
+            yield positions, self._roots[version].get_many(
+                addresses, prefix_lens, covering
+            )
+
+    @property
+    def _roots(self) -> Dict[Version, FastBottle]:
+        return {Version.v4: self.v4, Version.v6: self.v6}
+
+    def __len__(self) -> int:
+        return len(self.v4) + len(self.v6)
+
+    def __bool__(self) -> bool:
+        return True
+
+    def __repr__(self):
+        return f"{type(self).__name__}(v4={self.v4!r}, v6={self.v6!r})"
+
+    def __contains__(self, prefix: Union[CIDR, str]) -> bool:
+        return self.contains(prefix)
+
+    def __getitem__(self, prefix: Union[CIDR, str]) -> Optional[FastBottle]:
+        return self.get(prefix)
+
+    def __setitem__(self, prefix: Union[CIDR, str], value):
+        self.insert(prefix, value)
+
+    def __delitem__(self, prefix: Union[CIDR, str]):
+        self.delete(prefix)
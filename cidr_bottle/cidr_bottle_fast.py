@@ -1,25 +1,134 @@
-from dataclasses import field
-from typing import Optional, Any, Type
+import copyreg
+import gc
+from contextlib import contextmanager
+from operator import eq
+from typing import (
+    Optional,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from cidr_man import CIDR
-from cidr_man.cidr import max_prefix
+from cidr_man.cidr import max_prefix, Version
+
+from ._batch import ADDRESSES_T, BatchResult, flatten, lookup
+from .cidr_bottle_cache import MISSING, QueryCache
+from .cidr_bottle_frozen import FrozenBottle
+from .cidr_bottle_journal import Entry, Journal, Op, collapse
+from .cidr_bottle_mapped import MappedBottle, dumps
+from .cidr_bottle_stats import (
+    EXPORT_HOOK_T,
+    Counters,
+    Stats,
+    collect,
+    instrument,
+    restore,
+)
+
+# counters and the original methods while instrumentation is enabled
+_instrumentation: Optional[Tuple[Counters, dict]] = None
+
+
+class Diff(NamedTuple):
+    """
+    Result of FastBottle.diff, every non-passing node of the left hand trie appears in exactly one field (in address order).
+
+    exact: (node, other node) pairs where the other trie holds the same prefix.
+    more_specific: nodes for which the other trie holds more specific prefixes, but not the prefix itself.
+    covering: (node, most specific covering other node) pairs where the other trie only holds a less specific prefix.
+    absent: nodes that do not overlap any prefix of the other trie.
+    """
+
+    exact: List[Tuple[Any, Any]]
+    more_specific: List[Any]
+    covering: List[Tuple[Any, Any]]
+    absent: List[Any]
+
+
+class Changes(NamedTuple):
+    """
+    Result of FastBottle.apply_updates, each field in address order.
+
+    added: (prefix, value) pairs for prefixes that were not held before.
+    removed: (prefix, old value) pairs for withdrawn prefixes.
+    changed: (prefix, old value, new value) triples for prefixes announced again with a different value.
+    """
+
+    added: List[Tuple[Any, Any]]
+    removed: List[Tuple[Any, Any]]
+    changed: List[Tuple[Any, Any, Any]]
+
+
+class _RootState:
+    """
+    What only the node it was set up on (usually the root) needs: a query cache, the flat copy used by batch lookups and a journal.
+    Nodes hold one of these, or None, rather than a slot for each.
+    """
+
+    __slots__ = ("cache", "flat", "journal")
+
+    def __init__(self):
+        self.cache: Optional[QueryCache] = None
+        self.flat = None
+        self.journal: Optional[Journal] = None
+
+    def invalidate(self) -> bool:
+        """Drop what a change to the trie makes stale, returning True once nothing is left."""
+        self.flat = None
+        if self.cache is not None:
+            self.cache.generation += 1
+            return False
+        return self.journal is None
 
 
 class FastBottle:
     """
     Similar to cidr_bottle.Bottle, cidr_bottle.FastBottle is a Patricia Trie specifically designed for parsing and validating routing tables.
     FastBottle however only supports cidr_man.CIDR objects as input to prefix fields.
+
+    With compressed=True intermediate passing nodes are only created where two prefixes diverge,
+    so a node's children may be more than one bit more specific than the node itself.
+
+    Nodes are slotted and keep their prefix as a plain (ip, prefix_len) pair; the cidr_man.CIDR is only built when read.
+    Every node also tracks the number of non-passing nodes in its subtree, so len(node) is O(1).
     """
 
-    _cls: Type
-    left: "FastBottle" = field(default=None)
-    right: "FastBottle" = field(default=None)
-    parent: "FastBottle" = field(default=None)
-    _prefix: CIDR = field(default_factory=CIDR)
-    value: Any = field(default=None)
-    passing: bool = field(default=True)
-    _children: Optional[list] = field(default=None)
-    _changed: bool = field(default=True)
+    __slots__ = (
+        "left",
+        "right",
+        "parent",
+        "_ip",
+        "_prefix_len",
+        "_version",
+        "value",
+        "passing",
+        "_children",
+        "_changed",
+        "compressed",
+        "_count",
+        "_root_state",
+    )
+
+    left: Optional["FastBottle"]
+    right: Optional["FastBottle"]
+    parent: Optional["FastBottle"]
+    _ip: int
+    _prefix_len: int
+    _version: Version
+    value: Any
+    passing: bool
+    _children: Optional[list]
+    _changed: bool
+    compressed: bool
+    _count: int
+    _root_state: Optional["_RootState"]
 
     def __init__(
         self,
@@ -29,18 +138,37 @@ class FastBottle:
         prefix: CIDR = None,
         value: Any = None,
         passing: bool = True,
+        compressed: bool = False,
     ):
         self.left = left
         self.right = right
         self.parent = parent
         if prefix is None:
-            self._prefix = CIDR("0.0.0.0/0")
+            self._ip = 0
+            self._prefix_len = 0
+            self._version = Version.v4
         else:
             self._prefix = prefix
         self.value = value
         self.passing = passing
         self._children = None
         self._changed = True
+        self.compressed = compressed
+        self._root_state = None
+        self._count = 0 if passing else 1
+        for child in (left, right):
+            if child is not None:
+                self._count += child._count
+
+    @property
+    def _prefix(self) -> CIDR:
+        return CIDR(self._ip, self._version, self._prefix_len)
+
+    @_prefix.setter
+    def _prefix(self, prefix: CIDR):
+        self._ip = prefix.ip
+        self._prefix_len = prefix.prefix_len
+        self._version = prefix.version
 
     @property
     def prefix(self):
@@ -53,11 +181,171 @@ class FastBottle:
     def get(
         self, prefix: CIDR, exact: bool = False, covering: bool = False
     ) -> "FastBottle":
-        node = self._find(prefix, covering=covering)
-        if exact and node._prefix != prefix:
+        return self._get(prefix.ip, prefix.prefix_len, exact, covering)
+
+    def get_int(
+        self,
+        version: int,
+        ip: int,
+        prefix_len: int,
+        exact: bool = False,
+        covering: bool = False,
+    ) -> "FastBottle":
+        """Equivalent of get(CIDR(ip, version, prefix_len), ...) without building a CIDR, host bits of ip are ignored."""
+        ip = self._check_int(version, ip, prefix_len)
+        return self._get(ip, prefix_len, exact, covering)
+
+    def _get(
+        self, ip: int, prefix_len: int, exact: bool, covering: bool
+    ) -> "FastBottle":
+        state = self._root_state
+        if state is None or state.cache is None:
+            return self._get_uncached(ip, prefix_len, exact, covering)
+        cache = state.cache
+        key = (ip, prefix_len, exact, covering)
+        node = cache.get(key)
+        if node is MISSING:
+            try:
+                node = self._get_uncached(ip, prefix_len, exact, covering)
+            except KeyError as e:
+                node = e
+            cache.put(key, node)
+        if isinstance(node, KeyError):
+            raise KeyError(*node.args)
+        return node
+
+    def _get_uncached(
+        self, ip: int, prefix_len: int, exact: bool, covering: bool
+    ) -> "FastBottle":
+        node = self._find_int(ip, prefix_len, covering=covering)
+        if exact and (node is None or node._ip != ip or node._prefix_len != prefix_len):
             raise KeyError("no exact match found")
         return node
 
+    def enable_cache(self, maxsize: int = 65536, policy: str = "lru"):
+        """
+        Cache the results of get (and contains) called on this node, evicting the least recently used ("lru") results
+        or with the CLOCK approximation of it ("clock"). Any change to the trie invalidates the cache.
+        """
+        self._state().cache = QueryCache(maxsize, policy)
+
+    def disable_cache(self):
+        if self._root_state is not None:
+            self._root_state.cache = None
+            self._release_state()
+
+    @property
+    def cache(self) -> Optional[QueryCache]:
+        return None if self._root_state is None else self._root_state.cache
+
+    def enable_journal(self, journal: Optional[Journal] = None) -> Journal:
+        """
+        Record every set, delete and aggregate promotion made through this node or any node below it (and bulk loads and
+        batch updates into them) in an append-only journal, see changes_since and replay.
+        """
+        if journal is None:
+            journal = Journal(self._version)
+        elif journal.version != self._version:
+            raise ValueError("incompatible network version")
+        self._state().journal = journal
+        return journal
+
+    def disable_journal(self) -> Optional[Journal]:
+        state = self._root_state
+        if state is None:
+            return None
+        journal, state.journal = state.journal, None
+        if state.cache is None:
+            self._root_state = None
+        return journal
+
+    @property
+    def journal(self) -> Optional[Journal]:
+        return None if self._root_state is None else self._root_state.journal
+
+    def changes_since(self, seq: int) -> List[Entry]:
+        """The journal entries after seq, e.g. those a replica that has replayed up to seq is missing."""
+        journal = self.journal
+        if journal is None:
+            raise ValueError("journal is not enabled")
+        return journal.changes_since(seq)
+
+    def replay(self, journal: Union[Journal, Iterable[Entry]]) -> Changes:
+        """
+        Bring this trie up to date with the entries of a journal (or changes_since) of another trie with the same contents
+        up to the first entry, applying them as a single batch (see apply_updates).
+        """
+        announce, withdraw = collapse(journal)
+        return self.apply_updates(announce, withdraw)
+
+    @staticmethod
+    def enable_instrumentation(hook: Optional[EXPORT_HOOK_T] = None) -> Counters:
+        """
+        Count the nodes visited by lookups, the nodes created by inserts, children() cache hits and misses and aggregation steps
+        of every trie until disable_instrumentation. Counters.export() passes a snapshot of the counters to hook.
+        Instrumentation swaps in counting versions of the hot paths, so there is no overhead while it is disabled.
+        """
+        global _instrumentation
+        if _instrumentation is not None:
+            counters = _instrumentation[0]
+            if hook is not None:
+                counters.hook = hook
+            return counters
+        counters = Counters(hook)
+        _instrumentation = (counters, instrument(FastBottle, counters))
+        return counters
+
+    @staticmethod
+    def disable_instrumentation() -> Optional[Counters]:
+        """Restore the uninstrumented hot paths, returning the final counters."""
+        global _instrumentation
+        if _instrumentation is None:
+            return None
+        counters, originals = _instrumentation
+        restore(FastBottle, originals)
+        _instrumentation = None
+        return counters
+
+    @staticmethod
+    def instrumentation() -> Optional[Counters]:
+        return None if _instrumentation is None else _instrumentation[0]
+
+    def stats(self) -> Stats:
+        """Node counts, estimated memory use and depth histogram of this subtree, in a single walk."""
+        return collect(self)
+
+    def insert_int(
+        self,
+        version: int,
+        ip: int,
+        prefix_len: int,
+        value: Any = None,
+        aggregate: bool = False,
+    ):
+        """Equivalent of insert(CIDR(ip, version, prefix_len), ...) without building a CIDR."""
+        ip = self._check_int(version, ip, prefix_len)
+        self._set(ip, prefix_len, value=value, aggregate=aggregate)
+
+    def contains_int(
+        self, version: int, ip: int, prefix_len: int, exact: bool = False
+    ) -> bool:
+        try:
+            return self.get_int(version, ip, prefix_len, exact) is not None
+        except KeyError:
+            return False
+
+    def _check_int(self, version: int, ip: int, prefix_len: int) -> int:
+        """Validate an integer prefix, returning the ip without its host bits."""
+        if version != self._version:
+            raise ValueError("incompatible network version")
+        max_bits = max_prefix(self._version)
+        if not 0 <= prefix_len <= max_bits:
+            raise ValueError(f"invalid prefix length {prefix_len}")
+        if ip < 0 or ip >> max_bits:
+            raise ValueError(f"invalid IPv{int(version)} address {ip}")
+        host_bits = max_bits - prefix_len
+        return ip >> host_bits << host_bits
+
     def insert(self, prefix: CIDR, value: Any = None, aggregate: bool = False):
         self.set(prefix, value=value, aggregate=aggregate)
 
@@ -66,80 +354,892 @@ class FastBottle:
 
     def contains(self, prefix: CIDR, exact: bool = False) -> bool:
         try:
-            self.get(prefix, exact)
-            return True
+            return self.get(prefix, exact) is not None
         except KeyError:
             return False
 
+    def get_many(
+        self, addresses: ADDRESSES_T, prefix_lens=None, covering: bool = False
+    ) -> BatchResult:
+        """
+        Batch equivalent of get for a numpy uint32 array of IPv4 addresses or a (high, low) pair of uint64 arrays of IPv6 addresses.
+        prefix_lens optionally turns each address into an (ip, prefix_len) query.
+        """
+        state = self._state()
+        if state.flat is None:
+            state.flat = flatten(self)
+        return lookup(state.flat, addresses, prefix_lens, covering)
+
+    def contains_many(
+        self, addresses: ADDRESSES_T, prefix_lens=None, exact: bool = False
+    ):
+        result = self.get_many(addresses, prefix_lens)
+        if exact:
+            return result.exact
+        return result.index >= 0
+
     def set(
         self, prefix: CIDR, value=None, delete=False, aggregate=False
     ) -> "FastBottle":
-        self._changed = True
-        if prefix.version != self._prefix.version:
+        if prefix.version != self._version:
             raise ValueError("incompatible network version")
-        if prefix.prefix_len < self._prefix.prefix_len:
+        return self._set(prefix.ip, prefix.prefix_len, value, delete, aggregate)
+
+    def _set(
+        self, ip: int, prefix_len: int, value=None, delete=False, aggregate=False
+    ) -> "FastBottle":
+        if prefix_len < self._prefix_len:
             raise ValueError("network is less specific than node")
-        node = self._find(prefix, not delete)
+        node = self._find_int(ip, prefix_len, not delete)
         if delete:
-            if node._prefix != prefix:
+            if (
+                node is None
+                or node.passing
+                or node._ip != ip
+                or node._prefix_len != prefix_len
+            ):
+                prefix = CIDR(ip, self._version, prefix_len)
                 raise KeyError(
                     f"attempting to delete non-existent key {prefix.compressed}"
                 )
-            left, right = node.parent._prefix.subnets()
-            if node._prefix == left:
-                node.parent.left = None
-            else:
-                node.parent.right = None
-            node.parent = None
+            # descendants are kept, the node only passes through to them from now on
+            node.passing = True
+            node.value = None
+            node._invalidate(-1)
+            self._prune(node)
+            journal = self._find_journal()
+            if journal is not None:
+                journal.record(Op.DELETE, ip, prefix_len)
         else:
+            if node is None:
+                raise ValueError("network is not within node")
             node.value = value
-            node.passing = False
-            parent = node.parent
-            if aggregate and parent.passing:
-                while None not in (parent.left, parent.right) and not (
-                    parent.left.passing or parent.right.passing
-                ):
-                    parent.passing = False
-                    if parent.value is None:
-                        parent.value = node.value
-                    if parent.parent is not None:
-                        parent = parent.parent
-                    else:
-                        break
+            if node.passing:
+                node.passing = False
+                node._invalidate(1)
+            steps = self._aggregate(node) if aggregate else 0
+            journal = self._find_journal()
+            if journal is not None:
+                journal.record(Op.SET, ip, prefix_len, value)
+                _record_promotions(journal, node, steps)
         return node
 
-    def children(self):
-        if self._changed:
-            descendants = {}
-            node = self
-            passed = {}
-            while True:
-                prefix = (node._prefix.ip, node._prefix.prefix_len)
-                if not node.passing and prefix not in descendants:
-                    descendants[prefix] = node
-                if prefix in passed and node.prefix in self.prefix:
-                    node = node.parent
-                elif (
-                    node.left is not None
-                    and (node.left._prefix.ip, node.left._prefix.prefix_len)
-                    not in passed
-                ):
-                    node = node.left
-                elif (
-                    node.right is not None
-                    and (node.right._prefix.ip, node.right._prefix.prefix_len)
-                    not in passed
+    def apply_updates(
+        self,
+        announce: Iterable[Tuple[CIDR, Any]] = (),
+        withdraw: Iterable[CIDR] = (),
+    ) -> Changes:
+        """
+        Apply a batch of withdrawals and announcements (with their values), e.g. from BGP UPDATEs, in a single walk in address order.
+        Withdrawals are applied before announcements, so a prefix in both ends up announced, and withdrawing a prefix that is
+        not held is a no-op. The whole batch is validated before the trie is changed.
+        """
+        with _gc_paused():
+            return self._apply_updates(announce, withdraw)
+
+    def _apply_updates(
+        self, announce: Iterable[Tuple[CIDR, Any]], withdraw: Iterable[CIDR]
+    ) -> Changes:
+        max_bits = max_prefix(self._version)
+        root_shift = max_bits - self._prefix_len
+        updates = {}
+
+        def key(prefix: CIDR) -> Tuple[int, int]:
+            if prefix.version != self._version:
+                raise ValueError("incompatible network version")
+            if prefix.prefix_len < self._prefix_len:
+                raise ValueError("network is less specific than node")
+            if prefix.ip >> root_shift != self._ip >> root_shift:
+                raise ValueError("network is not within node")
+            return prefix.ip, prefix.prefix_len
+
+        for prefix in withdraw:
+            updates[key(prefix)] = (False, None)
+        for prefix, value in announce:
+            updates[key(prefix)] = (True, value)
+        changes = Changes([], [], [])
+        journal = self._find_journal()
+        # path from self to the most recently updated node, with the change in non-passing nodes below each
+        # and whether anything below it changed, applied to each node once the walk leaves it
+        path = [self]
+        deltas = [0]
+        dirty = [False]
+
+        def leave():
+            node = path.pop()
+            delta = deltas.pop()
+            if dirty.pop():
+                node._count += delta
+                node._changed = True
+                if node._root_state is not None:
+                    node._release_state()
+                deltas[-1] += delta
+                dirty[-1] = True
+                # the nodes below have been left already, so one step prunes whole chains
+                self._unlink_passing(node)
+
+        for ip, prefix_len in sorted(updates):
+            is_announce, value = updates[(ip, prefix_len)]
+            pushed, created = self._descend(
+                path, ip, prefix_len, is_announce, leave, count_created=True
+            )
+            deltas.extend([0] * pushed)
+            dirty.extend([False] * (pushed - created) + [True] * created)
+            node = path[-1]
+            held = (
+                not node.passing and node._ip == ip and node._prefix_len == prefix_len
+            )
+            prefix = CIDR(ip, self._version, prefix_len)
+            if is_announce:
+                if not held:
+                    changes.added.append((prefix, value))
+                    node.passing = False
+                    deltas[-1] += 1
+                    dirty[-1] = True
+                elif node.value != value:
+                    changes.changed.append((prefix, node.value, value))
+                else:
+                    node.value = value
+                    continue
+                node.value = value
+                if journal is not None:
+                    journal.record(Op.SET, ip, prefix_len, value)
+            elif held:
+                changes.removed.append((prefix, node.value))
+                node.passing = True
+                node.value = None
+                deltas[-1] -= 1
+                dirty[-1] = True
+                if journal is not None:
+                    journal.record(Op.DELETE, ip, prefix_len)
+        while len(path) > 1:
+            leave()
+        if dirty[0]:
+            self._count += deltas[0]
+            self._changed = True
+            if self._root_state is not None:
+                self._release_state()
+            if self.parent is not None:
+                self.parent._invalidate(deltas[0])
+        return changes
+
+    def _prune(self, node: "FastBottle"):
+        """Remove the passing nodes left without a purpose from node upwards, stopping at self."""
+        while node is not self:
+            node = self._unlink_passing(node)
+            if node is None:
+                break
+
+    def _unlink_passing(self, node: "FastBottle") -> Optional["FastBottle"]:
+        """Remove node if it is a passing node without a purpose, returning its former parent (or None if it was kept)."""
+        if not node.passing:
+            return None
+        if node.left is None and node.right is None:
+            replacement = None
+        elif self.compressed and (node.left is None or node.right is None):
+            # a passing node is only needed where two prefixes diverge
+            replacement = node.left if node.left is not None else node.right
+        else:
+            return None
+        parent = node.parent
+        if replacement is not None:
+            replacement.parent = parent
+        if parent.left is node:
+            parent.left = replacement
+        else:
+            parent.right = replacement
+        node.parent = None
+        return parent
+
+    def compact(self) -> int:
+        """
+        Remove every passing node of this subtree that leads to no non-passing node (or, with path compression,
+        that does not sit where two prefixes diverge), returning the number of nodes removed.
+        """
+        removed = _drop_dead(self)
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._root_state is not None:
+                node._release_state()
+            for child in (node.left, node.right):
+                if child is None:
+                    continue
+                removed += _drop_dead(child)
+                while (
+                    self.compressed
+                    and child.passing
+                    and (child.left is None or child.right is None)
                 ):
-                    node = node.right
-                elif node.parent is not None and node.parent.prefix in self.prefix:
-                    passed[prefix] = True
-                    node = node.parent
+                    # only one side leads to non-passing nodes, so splice the node out
+                    removed += 1
+                    grandchild = child.left if child.left is not None else child.right
+                    grandchild.parent = node
+                    child.parent = child.left = child.right = None
+                    if node.left is child:
+                        node.left = grandchild
+                    else:
+                        node.right = grandchild
+                    child = grandchild
+                    removed += _drop_dead(child)
+                stack.append(child)
+        if removed:
+            self._invalidate()
+        return removed
+
+    def freeze(self, strides: Optional[Sequence[int]] = None) -> "FrozenBottle":
+        """Compile this (sub-)trie into an immutable multibit-stride lookup table."""
+        return FrozenBottle(self, strides)
+
+    def dump(self, path: str):
+        """Write this (sub-)trie to a binary snapshot, see FastBottle.load."""
+        with open(path, "wb") as f:
+            f.write(dumps(self))
+
+    def dumps(self) -> bytes:
+        return dumps(self)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """
+        Load a binary snapshot. With mmap=True a read-only MappedBottle serving lookups directly from the memory-mapped file is returned,
+        otherwise the snapshot is rebuilt into a new trie.
+        """
+        if mmap:
+            return MappedBottle.open(path)
+        with open(path, "rb") as f:
+            return cls.loads(f.read())
+
+    @classmethod
+    def loads(cls, data: bytes) -> "FastBottle":
+        return MappedBottle(data).to_bottle(cls)
+
+    @classmethod
+    def from_sorted(
+        cls,
+        items: Iterable[Tuple[CIDR, Any]],
+        prefix: CIDR = None,
+        aggregate: bool = False,
+        compressed: bool = False,
+    ) -> "FastBottle":
+        """
+        Build a new trie from (prefix, value) pairs in a single pass.
+        Pairs are sorted into address order first if they are not already.
+        """
+        root = cls(prefix=prefix, compressed=compressed)
+        root._bulk_insert(items, aggregate)
+        return root
+
+    def _bulk_insert(self, items: Iterable[Tuple[CIDR, Any]], aggregate: bool = False):
+        with _gc_paused():
+            try:
+                items = list(items)
+                keys = [(prefix.ip, prefix.prefix_len) for prefix, _ in items]
+                if any(keys[i] > keys[i + 1] for i in range(len(keys) - 1)):
+                    items = [
+                        items[i]
+                        for i in sorted(range(len(items)), key=keys.__getitem__)
+                    ]
+                root_shift = max_prefix(self._version) - self._prefix_len
+                journal = self._find_journal()
+                # path from self to the most recently inserted node, shared with the next insert
+                path = [self]
+                for prefix, value in items:
+                    ip = prefix.ip
+                    prefix_len = prefix.prefix_len
+                    if prefix.version != self._version:
+                        raise ValueError("incompatible network version")
+                    if prefix_len < self._prefix_len:
+                        raise ValueError("network is less specific than node")
+                    if ip >> root_shift != self._ip >> root_shift:
+                        raise ValueError("network is not within node")
+                    self._descend(path, ip, prefix_len, True)
+                    node = path[-1]
+                    node.value = value
+                    node.passing = False
+                    steps = self._aggregate(node) if aggregate else 0
+                    if journal is not None:
+                        journal.record(Op.SET, ip, prefix_len, value)
+                        _record_promotions(journal, node, steps)
+            finally:
+                # counts are fixed up in one pass rather than along the path of every insert
+                self._recount()
+
+    def _descend(
+        self,
+        path: List["FastBottle"],
+        ip: int,
+        prefix_len: int,
+        create: bool,
+        leave: Optional[Callable[[], Any]] = None,
+        count_created: bool = False,
+    ) -> Tuple[int, int]:
+        """
+        Move path (the nodes from self down to the last one reached, shared between calls in address order) to (ip, prefix_len):
+        drop the nodes that do not cover it (with leave, which pops the last node, when given), then append the nodes below
+        down to it, or down to the closest one when it is missing and create is False.
+        Returns the number of nodes appended and, with count_created (which costs a second lookup in the compressed layout),
+        how many of them, the last ones, were created.
+        """
+        if leave is None:
+            leave = path.pop
+        max_bits = max_prefix(self._version)
+        node = path[-1]
+        while len(path) > 1:
+            shift = max_bits - node._prefix_len
+            if node._prefix_len <= prefix_len and node._ip >> shift == ip >> shift:
+                break
+            leave()
+            node = path[-1]
+        if self.compressed:
+            top = node
+            if count_created:
+                # the existing nodes first, so the ones created below them can be told apart
+                found = node = top._find_compressed(ip, prefix_len)
+                if create and node._prefix_len != prefix_len:
+                    node = found._find_compressed(ip, prefix_len, True)
+            else:
+                node = top._find_compressed(ip, prefix_len, create)
+                found = node
+            branch = []
+            while node is not found:
+                branch.append(node)
+                node = node.parent
+            created = len(branch)
+            while node is not top:
+                branch.append(node)
+                node = node.parent
+            path.extend(reversed(branch))
+            return len(branch), created
+        create_node = self._create_node
+        shift_bit = max_bits - node._prefix_len
+        max_shift = max_bits - prefix_len
+        pushed = created = 0
+        while shift_bit > max_shift:
+            shift_bit -= 1
+            if ip >> shift_bit & 1:
+                child = node.right
+                if child is None and create:
+                    child = node.right = create_node(
+                        node._ip | 1 << shift_bit, node._prefix_len + 1, node
+                    )
+                    created += 1
+            else:
+                child = node.left
+                if child is None and create:
+                    child = node.left = create_node(
+                        node._ip, node._prefix_len + 1, node
+                    )
+                    created += 1
+            if child is None:
+                break
+            node = child
+            path.append(node)
+            pushed += 1
+        return pushed, created
+
+    @staticmethod
+    def _aggregate(node: "FastBottle") -> int:
+        """Merge complete pairs of siblings into their parents upwards from node, returning the number of steps taken."""
+        steps = 0
+        parent = node.parent
+        if parent is not None and parent.passing:
+            while (
+                None not in (parent.left, parent.right)
+                and not (parent.left.passing or parent.right.passing)
+                and parent.left._prefix_len
+                == parent.right._prefix_len
+                == parent._prefix_len + 1
+            ):
+                steps += 1
+                if parent.passing:
+                    parent.passing = False
+                    parent._invalidate(1)
+                if parent.value is None:
+                    parent.value = node.value
+                if parent.parent is not None:
+                    parent = parent.parent
                 else:
                     break
-            self._children = list(descendants.values())
+        return steps
+
+    def _find_journal(self) -> Optional[Journal]:
+        """The journal of the closest node from this one up to the root that has one enabled."""
+        node = self
+        while node is not None:
+            if node._root_state is not None and node._root_state.journal is not None:
+                return node._root_state.journal
+            node = node.parent
+        return None
+
+    def _state(self) -> "_RootState":
+        """The state attached to this node, attaching an empty one first if there is none."""
+        if self._root_state is None:
+            self._root_state = _RootState()
+        return self._root_state
+
+    def _release_state(self):
+        """Drop what a change below this node makes stale from its state, and the state itself once it holds nothing."""
+        if self._root_state.invalidate():
+            self._root_state = None
+
+    def _invalidate(self, delta: int = 0):
+        """Mark this node and every ancestor as changed, adjusting their non-passing counts by delta."""
+        node = self
+        while node is not None:
+            node._changed = True
+            node._count += delta
+            if node._root_state is not None:
+                node._release_state()
+            node = node.parent
+
+    def _recount(self):
+        """Recompute the non-passing counts of this subtree after a bulk change and pass the difference on to the ancestors."""
+        before = self._count
+        order = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            left, right = node.left, node.right
+            if left is not None:
+                stack.append(left)
+            if right is not None:
+                stack.append(right)
+        # children always come after their parent, so reversed this is a post-order
+        for node in reversed(order):
+            count = 0 if node.passing else 1
+            if node.left is not None:
+                count += node.left._count
+            if node.right is not None:
+                count += node.right._count
+            if count != node._count:
+                node._count = count
+                node._changed = True
+                if node._root_state is not None:
+                    node._release_state()
+        self._changed = True
+        if self._root_state is not None:
+            self._release_state()
+        if self.parent is not None:
+            self.parent._invalidate(self._count - before)
+
+    def children(self):
+        if self._changed:
+            # not self.iter_children(), which subclasses may override to convert the nodes
+            self._children = list(FastBottle.iter_children(self))
             self._changed = False
         return self._children
 
+    def walk(
+        self,
+        max_depth: Optional[int] = None,
+        predicate: Optional[Callable[["FastBottle"], bool]] = None,
+    ) -> Iterator["FastBottle"]:
+        """
+        Lazily yield this node and every descendant (passing or not) in address order.
+        max_depth limits how many bits more specific than this node a descendant may be,
+        and a node for which predicate returns False is skipped along with its descendants.
+        """
+        limit = None if max_depth is None else self._prefix_len + max_depth
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if limit is not None and node._prefix_len > limit:
+                continue
+            if predicate is not None and not predicate(node):
+                continue
+            yield node
+            if node.right is not None:
+                stack.append(node.right)
+            if node.left is not None:
+                stack.append(node.left)
+
+    def iter_children(
+        self,
+        max_depth: Optional[int] = None,
+        predicate: Optional[Callable[["FastBottle"], bool]] = None,
+    ) -> Iterator["FastBottle"]:
+        """Lazy equivalent of children(), accepting the same pruning options as walk()."""
+        for node in self.walk(max_depth, predicate):
+            if not node.passing:
+                yield node
+
+    def overlapping(self, start: CIDR, end: CIDR) -> List["FastBottle"]:
+        """
+        The non-passing nodes (including less specific ones) sharing at least one address with the range
+        from the first address of start to the last address of end, in address order.
+        """
+        return list(self._range(start, end, True))
+
+    def iter_range(self, start: CIDR, end: CIDR) -> Iterator["FastBottle"]:
+        """
+        Lazily yield the non-passing nodes lying entirely within the range from the first address of start
+        to the last address of end, in address order. Only the subtrees intersecting the range are visited.
+        """
+        return self._range(start, end, False)
+
+    def _range(
+        self, start: CIDR, end: CIDR, overlapping: bool
+    ) -> Iterator["FastBottle"]:
+        if start.version != self._version or end.version != self._version:
+            raise ValueError("incompatible network version")
+        max_bits = max_prefix(self._version)
+        first = start.ip
+        last = end.ip | (1 << max_bits - end.prefix_len) - 1
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._ip > last:
+                # everything left on the stack comes later in address order
+                break
+            node_last = node._ip | (1 << max_bits - node._prefix_len) - 1
+            if node_last < first:
+                continue
+            if not node.passing and (
+                overlapping or (node._ip >= first and node_last <= last)
+            ):
+                yield node
+            if node.right is not None:
+                stack.append(node.right)
+            if node.left is not None:
+                stack.append(node.left)
+
+    def successor(self, prefix: CIDR) -> Optional["FastBottle"]:
+        """
+        The first non-passing node after prefix in address order (which puts a prefix's more specifics right after it),
+        whether or not prefix itself is held.
+        """
+        if prefix.version != self._version:
+            raise ValueError("incompatible network version")
+        max_bits = max_prefix(self._version)
+        key = (prefix.ip, prefix.prefix_len)
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if (node._ip, node._prefix_len) > key:
+                if not node.passing:
+                    return node
+            elif node._ip | (1 << max_bits - node._prefix_len) - 1 < key[0]:
+                # the whole subtree comes before prefix
+                continue
+            if node.right is not None:
+                stack.append(node.right)
+            if node.left is not None:
+                stack.append(node.left)
+        return None
+
+    def predecessor(self, prefix: CIDR) -> Optional["FastBottle"]:
+        """The last non-passing node before prefix in address order, whether or not prefix itself is held."""
+        if prefix.version != self._version:
+            raise ValueError("incompatible network version")
+        key = (prefix.ip, prefix.prefix_len)
+        # address order backwards: the right subtree, the left subtree and then the node itself
+        stack = [(self, False)]
+        while stack:
+            node, visited = stack.pop()
+            if visited:
+                if not node.passing:
+                    return node
+                continue
+            if (node._ip, node._prefix_len) >= key:
+                # and so is every descendant
+                continue
+            stack.append((node, True))
+            if node.left is not None:
+                stack.append((node.left, False))
+            if node.right is not None:
+                stack.append((node.right, False))
+        return None
+
+    def union(self, other: "FastBottle") -> "FastBottle":
+        """New trie holding the prefixes of either trie, values are taken from this one where both hold a prefix."""
+        return self._combine(
+            other,
+            (
+                ((node or other_node)._prefix, (node or other_node).value)
+                for node, other_node in _merge(self, other)
+            ),
+        )
+
+    def intersection(self, other: "FastBottle") -> "FastBottle":
+        """New trie holding the prefixes present in both tries, with the values from this one."""
+        return self._combine(
+            other,
+            (
+                (node._prefix, node.value)
+                for node, other_node in _merge(self, other)
+                if node is not None and other_node is not None
+            ),
+        )
+
+    def difference(self, other: "FastBottle") -> "FastBottle":
+        """New trie holding the prefixes of this trie that other does not hold exactly."""
+        return self._combine(
+            other,
+            (
+                (node._prefix, node.value)
+                for node, other_node in _merge(self, other)
+                if other_node is None
+            ),
+        )
+
+    def symmetric_difference(self, other: "FastBottle") -> "FastBottle":
+        """New trie holding the prefixes present in exactly one of the tries."""
+        return self._combine(
+            other,
+            (
+                ((node or other_node)._prefix, (node or other_node).value)
+                for node, other_node in _merge(self, other)
+                if node is None or other_node is None
+            ),
+        )
+
+    def summarize(
+        self, value_equal: Callable[[Any, Any], bool] = eq
+    ) -> Iterator[Tuple[CIDR, Any]]:
+        """
+        Yield the fewest (prefix, value) pairs, in address order, that cover the same addresses as this trie in a single post-order pass:
+        prefixes within a less specific prefix of an equal value are dropped, and halves of a prefix that are entirely covered
+        by equal values are merged into it (taking the value of the lower half).
+        Longest-prefix matches against the summary give a value equal to that of the original trie for every address.
+        Values are compared with ==, pass value_equal=lambda a, b: True to summarize only the address space.
+        """
+        entries: List[Tuple[int, int, Any]] = []
+        _summarize(self, MISSING, value_equal, entries)
+        for ip, prefix_len, value in entries:
+            yield CIDR(ip, self._version, prefix_len), value
+
+    def aggregate(self, value_equal: Callable[[Any, Any], bool] = eq) -> "FastBottle":
+        """New trie (rooted at this node's prefix) holding the summary of this trie, see summarize."""
+        root = self._create_node(self._ip, self._prefix_len, None)
+        # FastBottle's own summary, as subclasses may convert the prefixes it yields
+        root._bulk_insert(FastBottle.summarize(self, value_equal))
+        return root
+
+    def gaps(self, count: bool = False):
+        """
+        The fewest prefixes, in address order, covering the addresses of this node that no non-passing descendant covers,
+        e.g. the unannounced parts of an allocation. With count=True a (prefixes, number of uncovered addresses) pair is returned.
+        """
+        max_bits = max_prefix(self._version)
+        prefixes = []
+        addresses = 0
+        for ip, prefix_len in self._free(None):
+            prefixes.append(CIDR(ip, self._version, prefix_len))
+            addresses += 1 << max_bits - prefix_len
+        if count:
+            return prefixes, addresses
+        return prefixes
+
+    def iter_free(
+        self, min_len: Optional[int] = None, max_len: Optional[int] = None
+    ) -> Iterator[CIDR]:
+        """
+        Lazily yield the gaps of this node in address order, leaving out those more specific than max_len
+        and splitting those less specific than min_len into prefixes of min_len (e.g. min_len=max_len=24 gives every free /24).
+        """
+        if min_len is not None and max_len is not None and min_len > max_len:
+            raise ValueError("min_len is more specific than max_len")
+        max_bits = max_prefix(self._version)
+        for ip, prefix_len in self._free(max_len):
+            if max_len is not None and prefix_len > max_len:
+                continue
+            if min_len is not None and prefix_len < min_len:
+                step = 1 << max_bits - min_len
+                for sub_ip in range(ip, ip + (1 << max_bits - prefix_len), step):
+                    yield CIDR(sub_ip, self._version, min_len)
+            else:
+                yield CIDR(ip, self._version, prefix_len)
+
+    def _free(self, max_len: Optional[int]) -> Iterator[Tuple[int, int]]:
+        """Yield the gaps of this node as (ip, prefix_len) pairs, not looking for any below max_len."""
+        if self._count == (0 if self.passing else 1):
+            yield self._ip, self._prefix_len
+            return
+        max_bits = max_prefix(self._version)
+        # nodes still to look into and free blocks, the next in address order on top
+        stack: List[Any] = [self]
+        while stack:
+            item = stack.pop()
+            if type(item) is tuple:
+                yield item
+                continue
+            node = item
+            if node is not self and not node.passing:
+                continue
+            half_len = node._prefix_len + 1
+            if max_len is not None and half_len > max_len:
+                continue
+            half_shift = max_bits - half_len
+            items = []
+            for child, half_ip in (
+                (node.left, node._ip),
+                (node.right, node._ip | 1 << half_shift),
+            ):
+                if child is None or child._count == 0:
+                    items.append((half_ip, half_len))
+                    continue
+                # with path compression the child may be more specific than the half, leaving free blocks beside its path
+                after = []
+                for prefix_len in range(half_len, child._prefix_len):
+                    shift = max_bits - prefix_len
+                    block_ip = child._ip >> shift << shift
+                    if child._ip >> shift - 1 & 1:
+                        items.append((block_ip, prefix_len + 1))
+                    else:
+                        after.append((block_ip | 1 << shift - 1, prefix_len + 1))
+                items.append(child)
+                items.extend(reversed(after))
+            stack.extend(reversed(items))
+
+    def diff(self, other: "FastBottle") -> Diff:
+        """
+        Classify every prefix of this trie against other (see Diff), e.g. allocations against announcements.
+        Both tries are walked once, side by side, in address order.
+        """
+        result = Diff([], [], [], [])
+        max_bits = max_prefix(self._version)
+        # parallel columns per node of this trie, rather than a container per node, to keep the cyclic GC out of the walk
+        nodes = []
+        exact = []
+        more_specific = bytearray()
+        covering = []
+        open_nodes = []
+        open_others = []
+        for node, other_node in _merge(self, other):
+            current = node if node is not None else other_node
+            ip = current._ip
+            # in address order, an open node that does not cover the current one will not cover any later ones either
+            while open_nodes:
+                top = nodes[open_nodes[-1]]
+                shift = max_bits - top._prefix_len
+                if top._ip >> shift == ip >> shift:
+                    break
+                closed = open_nodes.pop()
+                if open_nodes and (exact[closed] is not None or more_specific[closed]):
+                    more_specific[open_nodes[-1]] = 1
+            while open_others:
+                shift = max_bits - open_others[-1]._prefix_len
+                if open_others[-1]._ip >> shift == ip >> shift:
+                    break
+                open_others.pop()
+            if node is not None:
+                open_nodes.append(len(nodes))
+                nodes.append(node)
+                exact.append(other_node)
+                more_specific.append(0)
+                covering.append(open_others[-1] if open_others else None)
+            elif open_nodes:
+                more_specific[open_nodes[-1]] = 1
+            if other_node is not None:
+                open_others.append(other_node)
+        while open_nodes:
+            closed = open_nodes.pop()
+            if open_nodes and (exact[closed] is not None or more_specific[closed]):
+                more_specific[open_nodes[-1]] = 1
+        for i, node in enumerate(nodes):
+            if exact[i] is not None:
+                result.exact.append((node, exact[i]))
+            elif more_specific[i]:
+                result.more_specific.append(node)
+            elif covering[i] is not None:
+                result.covering.append((node, covering[i]))
+            else:
+                result.absent.append(node)
+        return result
+
+    def _combine(
+        self, other: "FastBottle", items: Iterable[Tuple[CIDR, Any]]
+    ) -> "FastBottle":
+        # the new root is the most specific prefix covering both roots
+        max_bits = max_prefix(self._version)
+        prefix_len = _common_prefix_len(
+            self._ip, other._ip, max_bits, min(self._prefix_len, other._prefix_len)
+        )
+        host_bits = max_bits - prefix_len
+        root = self._create_node(self._ip >> host_bits << host_bits, prefix_len, None)
+        root._bulk_insert(items)
+        return root
+
+    def __getstate__(self) -> tuple:
+        """
+        Flattened copy of this (sub-)trie: the ip, prefix length, passing flag and value of every node in preorder.
+        The shape is implied by the prefixes, so neither the child nor the parent links are stored.
+        """
+        ips = []
+        lengths = bytearray()
+        passing = bytearray()
+        values = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            ips.append(node._ip)
+            lengths.append(node._prefix_len)
+            passing.append(node.passing)
+            values.append(node.value)
+            if node.right is not None:
+                stack.append(node.right)
+            if node.left is not None:
+                stack.append(node.left)
+        return (
+            int(self._version),
+            self.compressed,
+            ips,
+            bytes(lengths),
+            bytes(passing),
+            values,
+        )
+
+    def __setstate__(self, state: tuple):
+        version, compressed, ips, lengths, passing, values = state[:6]
+        self.left = self.right = self.parent = None
+        self._ip = ips[0]
+        self._prefix_len = lengths[0]
+        self._version = Version(version)
+        self.value = values[0]
+        self.passing = bool(passing[0])
+        self._children = self._root_state = None
+        self._changed = True
+        self.compressed = compressed
+        self._count = 0
+        max_bits = max_prefix(self._version)
+        create_node = self._create_node
+        with _gc_paused():
+            # preorder, so a node's parent is the closest preceding node covering it
+            path = [self]
+            for i in range(1, len(ips)):
+                ip = ips[i]
+                prefix_len = lengths[i]
+                parent = path[-1]
+                while parent._prefix_len >= prefix_len or (
+                    parent._ip >> (max_bits - parent._prefix_len)
+                    != ip >> (max_bits - parent._prefix_len)
+                ):
+                    path.pop()
+                    parent = path[-1]
+                node = create_node(ip, prefix_len, parent)
+                node.passing = bool(passing[i])
+                node.value = values[i]
+                if ip >> (max_bits - parent._prefix_len - 1) & 1:
+                    parent.right = node
+                else:
+                    parent.left = node
+                path.append(node)
+            self._recount()
+
+    def __reduce__(self):
+        # pickle (and copy.deepcopy) would otherwise recurse through every left, right and parent link
+        return copyreg.__newobj__, (type(self),), self.__getstate__()
+
+    def __len__(self) -> int:
+        """Number of non-passing prefixes in this subtree, including this node."""
+        return self._count
+
+    def __bool__(self) -> bool:
+        # an empty (sub-)trie is still a node, len() must not make it falsy
+        return True
+
     def __str__(self):
         return self._prefix.compressed
 
@@ -158,33 +1258,59 @@ class FastBottle:
     def __delitem__(self, prefix: CIDR):
         self.set(prefix, delete=True)
 
-    def _create_node(self, prefix: CIDR, parent: "FastBottle") -> "FastBottle":
-        return self.__class__(parent=parent, prefix=prefix)
+    def _create_node(
+        self, ip: int, prefix_len: int, parent: "FastBottle"
+    ) -> "FastBottle":
+        # bypasses __init__ as this is the hottest allocation path
+        node = object.__new__(self.__class__)
+        node.left = node.right = node.value = node._children = node._root_state = None
+        node._count = 0
+        node.parent = parent
+        node._ip = ip
+        node._prefix_len = prefix_len
+        node._version = self._version
+        node.passing = node._changed = True
+        node.compressed = self.compressed
+        return node
 
     def _find(
         self, prefix: CIDR, create_if_missing: bool = False, covering: bool = False
     ):
-        shift_bit = max_bits = max_prefix(self._prefix.version)
-        max_shift = max_bits - prefix.prefix_len
-        ip = prefix.ip
-        mask = max_bits - self._prefix.prefix_len
-        if (self._prefix.ip >> mask) != (ip >> mask):
+        return self._find_int(prefix.ip, prefix.prefix_len, create_if_missing, covering)
+
+    def _find_int(
+        self,
+        ip: int,
+        prefix_len: int,
+        create_if_missing: bool = False,
+        covering: bool = False,
+    ):
+        if self.compressed:
+            return self._find_compressed(ip, prefix_len, create_if_missing, covering)
+        max_bits = max_prefix(self._version)
+        max_shift = max_bits - prefix_len
+        shift_bit = mask = max_bits - self._prefix_len
+        if (self._ip >> mask) != (ip >> mask):
             return None
         node = self
-        most_recent_non_passing = None
+        most_recent_non_passing = None if self.passing else self
         while shift_bit > max_shift and node is not None:
             shift_bit -= 1
             if ip >> shift_bit & 1:
                 if node.right is None:
                     if create_if_missing:
-                        node.right = self._create_node(node._prefix.right, node)
+                        node.right = self._create_node(
+                            node._ip | 1 << shift_bit, node._prefix_len + 1, node
+                        )
                     else:
                         break
                 node = node.right
             else:
                 if node.left is None:
                     if create_if_missing:
-                        node.left = self._create_node(node._prefix.left, node)
+                        node.left = self._create_node(
+                            node._ip, node._prefix_len + 1, node
+                        )
                     else:
                         break
                 node = node.left
@@ -193,3 +1319,187 @@ class FastBottle:
         if covering and node.passing:
             node = most_recent_non_passing
         return node
+
+    def _find_compressed(
+        self,
+        ip: int,
+        prefix_len: int,
+        create_if_missing: bool = False,
+        covering: bool = False,
+    ):
+        max_bits = max_prefix(self._version)
+        mask = max_bits - self._prefix_len
+        if (self._ip >> mask) != (ip >> mask):
+            return None
+        node = self
+        most_recent_non_passing = None if self.passing else self
+        while node._prefix_len < prefix_len:
+            go_right = ip >> (max_bits - node._prefix_len - 1) & 1
+            child = node.right if go_right else node.left
+            if child is not None:
+                child_len = child._prefix_len
+                common = _common_prefix_len(
+                    child._ip, ip, max_bits, min(child_len, prefix_len)
+                )
+                if common == child_len:
+                    node = child
+                    if not node.passing:
+                        most_recent_non_passing = node
+                    continue
+            if not create_if_missing:
+                break
+            target = self._create_node(ip, prefix_len, node)
+            if child is not None:
+                if common == prefix_len:
+                    # the new prefix covers the existing child, so slot it in between
+                    fork = target
+                else:
+                    # the prefixes diverge, so add a passing node at the branch bit
+                    host_bits = max_bits - common
+                    fork = self._create_node(ip >> host_bits << host_bits, common, node)
+                    target.parent = fork
+                    if ip >> (host_bits - 1) & 1:
+                        fork.right = target
+                    else:
+                        fork.left = target
+                child.parent = fork
+                fork._count = child._count
+                if child._ip >> (max_bits - common - 1) & 1:
+                    fork.right = child
+                else:
+                    fork.left = child
+            else:
+                fork = target
+            if go_right:
+                node.right = fork
+            else:
+                node.left = fork
+            node = target
+        if covering and node.passing:
+            node = most_recent_non_passing
+        return node
+
+
+def _merge(
+    a: FastBottle, b: FastBottle
+) -> Iterator[Tuple[Optional[FastBottle], Optional[FastBottle]]]:
+    """
+    Walk the non-passing nodes of two tries side by side in address order (preorder),
+    pairing up nodes with the same prefix and pairing the others with None.
+    """
+    if a._version != b._version:
+        raise ValueError("incompatible network version")
+    # FastBottle's own generator, so Bottle nodes are not converted to their prefix type
+    left = FastBottle.iter_children(a)
+    right = FastBottle.iter_children(b)
+    x = next(left, None)
+    y = next(right, None)
+    while x is not None and y is not None:
+        x_key = (x._ip, x._prefix_len)
+        y_key = (y._ip, y._prefix_len)
+        if x_key == y_key:
+            yield x, y
+            x = next(left, None)
+            y = next(right, None)
+        elif x_key < y_key:
+            yield x, None
+            x = next(left, None)
+        else:
+            yield None, y
+            y = next(right, None)
+    while x is not None:
+        yield x, None
+        x = next(left, None)
+    while y is not None:
+        yield None, y
+        y = next(right, None)
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Keep the cyclic GC from repeatedly scanning a trie while a bulk operation allocates many (parent linked) nodes,
+    it is only enabled again afterwards if it was before.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# summary states of a subtree, see _summarize
+_EMPTY = 0
+_FULL = 1
+_MIXED = 2
+
+
+def _summarize(
+    node: FastBottle,
+    inherited: Any,
+    value_equal: Callable[[Any, Any], bool],
+    entries: List[Tuple[int, int, Any]],
+) -> Tuple[int, Any]:
+    """
+    Append the summary of node's subtree to entries, given the value (or MISSING) covering it from above.
+    Returns whether none (_EMPTY), all (_FULL, with the value covering it) or only part (_MIXED) of node's prefix is covered.
+    """
+    start = len(entries)
+    covered = inherited
+    if not node.passing and (
+        inherited is MISSING or not value_equal(node.value, inherited)
+    ):
+        entries.append((node._ip, node._prefix_len, node.value))
+        covered = node.value
+    halves = []
+    for child in (node.left, node.right):
+        if child is None:
+            halves.append((_EMPTY, None) if covered is MISSING else (_FULL, covered))
+            continue
+        state, value = _summarize(child, covered, value_equal, entries)
+        if child._prefix_len != node._prefix_len + 1:
+            # with path compression the rest of the half is only covered from above
+            if covered is MISSING:
+                state = _EMPTY if state == _EMPTY else _MIXED
+            elif state == _FULL and not value_equal(value, covered):
+                state = _MIXED
+        halves.append((state, value))
+    (left, left_value), (right, right_value) = halves
+    if left == right == _FULL and value_equal(left_value, right_value):
+        # the halves merge into a single prefix for the whole node
+        del entries[start:]
+        if inherited is MISSING or not value_equal(left_value, inherited):
+            entries.append((node._ip, node._prefix_len, left_value))
+        return _FULL, left_value
+    if left == right == _EMPTY:
+        return _EMPTY, None
+    return _MIXED, None
+
+
+def _record_promotions(journal: Journal, node: FastBottle, steps: int):
+    """Record the parents aggregated by the steps FastBottle._aggregate took upwards from node."""
+    for _ in range(steps):
+        node = node.parent
+        journal.record(Op.PROMOTE, node._ip, node._prefix_len, node.value)
+
+
+def _drop_dead(node: FastBottle) -> int:
+    """Detach the children of node that hold no non-passing nodes, returning the number of nodes dropped."""
+    dropped = 0
+    for child in (node.left, node.right):
+        if child is not None and child._count == 0:
+            dropped += sum(1 for _ in child.walk())
+            child.parent = None
+            if node.left is child:
+                node.left = None
+            else:
+                node.right = None
+    return dropped
+
+
+def _common_prefix_len(a: int, b: int, max_bits: int, limit: int) -> int:
+    """Number of leading bits (up to limit) shared by two addresses."""
+    diff = (a ^ b) >> (max_bits - limit)
+    return limit - diff.bit_length()
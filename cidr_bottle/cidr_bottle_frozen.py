@@ -0,0 +1,402 @@
+from array import array
+from collections import deque
+from typing import Any, List, Optional, Sequence
+
+from cidr_man import CIDR
+from cidr_man.cidr import max_prefix, Version
+
+from ._batch import (
+    ADDRESSES_T,
+    BatchResult,
+    _leading_mask,
+    _numpy,
+    _split_addresses,
+)
+
+# poptrie style strides, a wide first level followed by levels of at most 6 bits so every node fits a 64 bit vector
+DEFAULT_STRIDES = {
+    Version.v4: (16, 6, 6, 4),
+    Version.v6: (16,) + (6,) * 18 + (4,),
+}
+
+MAX_STRIDE = 6
+
+if hasattr(int, "bit_count"):
+    _popcount = int.bit_count
+else:  # pragma: no cover - Python < 3.10
+
+    def _popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+def _popcount_many(np, values):
+    """The number of set bits of every uint64 in values, as int64."""
+    values = values - ((values >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    values = (values & np.uint64(0x3333333333333333)) + (
+        (values >> np.uint64(2)) & np.uint64(0x3333333333333333)
+    )
+    values = (values + (values >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((values * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
+
+
+class FrozenBottle:
+    """
+    cidr_bottle.FrozenBottle is an immutable multibit-stride lookup table compiled from a FastBottle (or Bottle).
+
+    The first level is a flat array indexed by the leading bits of the address. Below it every node is compressed
+    the poptrie way: a 64 bit vector marks the slots that lead to a child, a second one marks where each run of equal
+    results starts, and the popcount of the bits below a slot indexes the node's contiguous children or results.
+    A lookup costs a few array reads per level rather than one node per bit, while the memory follows the number
+    of distinct results per node instead of the number of slots.
+    Results are identical to FastBottle.get(..., covering=True).
+    """
+
+    __slots__ = (
+        "_version",
+        "_max_bits",
+        "_strides",
+        "_levels",
+        "_top",
+        "_vectors",
+        "_leafvecs",
+        "_base0",
+        "_base1",
+        "_leaves",
+        "_nodes",
+        "_lengths",
+        "_parents",
+        "_root_ip",
+        "_root_prefix_len",
+        "_root_result",
+        "_arrays",
+    )
+
+    def __init__(self, root, strides: Optional[Sequence[int]] = None):
+        self._version = root._version
+        self._max_bits = max_bits = max_prefix(self._version)
+        if strides is None:
+            strides = DEFAULT_STRIDES[self._version]
+        if sum(strides) != max_bits:
+            raise ValueError(f"strides must add up to {max_bits}")
+        if any(stride < 1 for stride in strides) or any(
+            stride > MAX_STRIDE for stride in strides[1:]
+        ):
+            raise ValueError(
+                f"strides after the first must be between 1 and {MAX_STRIDE} bits"
+            )
+        self._strides = tuple(strides)
+        self._levels = []
+        consumed = 0
+        for stride in self._strides:
+            consumed += stride
+            self._levels.append((max_bits - consumed, (1 << stride) - 1))
+        if max_bits == 128 and 64 not in (
+            max_bits - shift for shift, _ in self._levels
+        ):
+            raise ValueError("IPv6 strides must split the address at bit 64")
+        self._root_ip = root._ip
+        self._root_prefix_len = root._prefix_len
+        self._nodes = []
+        self._lengths = array("B")
+        self._parents = array("i")
+        self._collect(root)
+        # the root is the first node of the preorder walk
+        self._root_result = -1 if root.passing else 0
+        self._top = array("i", bytes(4 << self._strides[0]))
+        self._vectors = array("Q")
+        self._leafvecs = array("Q")
+        self._base0 = array("I")
+        self._base1 = array("I")
+        self._leaves = array("i")
+        self._build()
+        self._arrays = None
+
+    def _collect(self, root):
+        # preorder walk, keeping the nearest non-passing ancestor of every non-passing node
+        stack = [(root, -1)]
+        while stack:
+            node, parent = stack.pop()
+            if not node.passing:
+                frozen = root._create_node(node._ip, node._prefix_len, None)
+                frozen.value = node.value
+                frozen.passing = False
+                frozen._count = 1
+                self._parents.append(parent)
+                parent = len(self._nodes)
+                self._nodes.append(frozen)
+                self._lengths.append(node._prefix_len)
+            if node.right is not None:
+                stack.append((node.right, parent))
+            if node.left is not None:
+                stack.append((node.left, parent))
+
+    def _build(self):
+        nodes = self._nodes
+        lengths = self._lengths
+        items = sorted(
+            (
+                (nodes[result]._ip, lengths[result], result)
+                for result in range(len(nodes))
+            ),
+            key=lambda item: item[1],
+        )
+        # the first level, entries hold result + 1, 0 for no result or -(node + 1) for a compressed node
+        top = self._top
+        shift, mask = self._levels[0]
+        consumed = self._strides[0]
+        groups = {}
+        for item in items:
+            ip, prefix_len, result = item
+            index = ip >> shift & mask
+            if prefix_len <= consumed:
+                # shorter prefixes come first, so this range only holds less specific results
+                span = 1 << (consumed - prefix_len)
+                top[index : index + span] = array("i", [result + 1]) * span
+            else:
+                groups.setdefault(index, []).append(item)
+        # nodes are numbered breadth first, which keeps the children of every node contiguous
+        queue = deque()
+        for index in sorted(groups):
+            queue.append((1, top[index] - 1, groups[index]))
+            top[index] = -len(queue)
+        count = len(queue)
+        while queue:
+            level, default, items = queue.popleft()
+            shift, mask = self._levels[level]
+            consumed = self._max_bits - shift
+            size = mask + 1
+            leaves = None
+            groups = {}
+            for item in items:
+                ip, prefix_len, result = item
+                index = ip >> shift & mask
+                if prefix_len <= consumed:
+                    if leaves is None:
+                        leaves = [default] * size
+                    span = 1 << (consumed - prefix_len)
+                    leaves[index : index + span] = [result] * span
+                else:
+                    groups.setdefault(index, []).append(item)
+            vector = 0
+            for index in sorted(groups):
+                vector |= 1 << index
+                queue.append(
+                    (
+                        level + 1,
+                        default if leaves is None else leaves[index],
+                        groups[index],
+                    )
+                )
+            self._vectors.append(vector)
+            self._base1.append(count)
+            count += len(groups)
+            self._base0.append(len(self._leaves))
+            # one leaf per run of equal results, slots leading to children neither break nor start a run
+            free = ((1 << size) - 1) & ~vector
+            if leaves is None:
+                leafvec = free & -free
+                if leafvec:
+                    self._leaves.append(default)
+            else:
+                leafvec = 0
+                previous = None
+                for index in range(size):
+                    if free >> index & 1 and (
+                        previous is None or leaves[index] != previous
+                    ):
+                        leafvec |= 1 << index
+                        previous = leaves[index]
+                        self._leaves.append(previous)
+            self._leafvecs.append(leafvec)
+
+    def _lookup(self, ip: int, prefix_len: int) -> int:
+        if prefix_len < self._root_prefix_len:
+            shift = self._max_bits - self._root_prefix_len
+            if self._root_result >= 0 and ip >> shift == self._root_ip >> shift:
+                return self._root_result
+            return -1
+        shift, mask = self._levels[0]
+        entry = self._top[ip >> shift & mask]
+        if entry >= 0:
+            result = entry - 1
+        else:
+            node = -entry - 1
+            vectors = self._vectors
+            for shift, mask in self._levels[1:]:
+                bit = 1 << (ip >> shift & mask)
+                below = (bit << 1) - 1
+                vector = vectors[node]
+                if vector & bit:
+                    node = self._base1[node] + _popcount(vector & below) - 1
+                    continue
+                result = self._leaves[
+                    self._base0[node] + _popcount(self._leafvecs[node] & below) - 1
+                ]
+                # the last level never has children
+                break
+        while result >= 0 and self._lengths[result] > prefix_len:
+            result = self._parents[result]
+        return result
+
+    def get(self, prefix: CIDR, exact: bool = False):
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        if prefix.version != self._version:
+            raise ValueError("incompatible network version")
+        result = self._lookup(prefix.ip, prefix.prefix_len)
+        if exact and (
+            result < 0
+            or self._lengths[result] != prefix.prefix_len
+            or self._nodes[result]._ip != prefix.ip
+        ):
+            raise KeyError("no exact match found")
+        return self._nodes[result] if result >= 0 else None
+
+    def contains(self, prefix: CIDR, exact: bool = False) -> bool:
+        try:
+            return self.get(prefix, exact) is not None
+        except KeyError:
+            return False
+
+    def get_many(self, addresses: ADDRESSES_T, prefix_lens=None) -> BatchResult:
+        """Batch equivalent of get, see FastBottle.get_many for the input format."""
+        np = _numpy()
+        if self._arrays is None:
+            self._arrays = (
+                np.frombuffer(self._top, dtype=np.int32).astype(np.int64),
+                np.frombuffer(self._vectors, dtype=np.uint64),
+                np.frombuffer(self._leafvecs, dtype=np.uint64),
+                np.frombuffer(self._base0, dtype=np.uint32).astype(np.int64),
+                np.frombuffer(self._base1, dtype=np.uint32).astype(np.int64),
+                np.frombuffer(self._leaves, dtype=np.int32).astype(np.int64),
+                np.frombuffer(self._lengths, dtype=np.uint8).astype(np.int64),
+                np.frombuffer(self._parents, dtype=np.int32).astype(np.int64),
+                np.array([node._ip >> 64 for node in self._nodes], dtype=np.uint64),
+                np.array(
+                    [node._ip & 0xFFFFFFFFFFFFFFFF for node in self._nodes],
+                    dtype=np.uint64,
+                ),
+            )
+        (
+            top,
+            vectors,
+            leafvecs,
+            base0,
+            base1,
+            leaves,
+            lengths,
+            parents,
+            ip_high,
+            ip_low,
+        ) = self._arrays
+        offset = 128 - self._max_bits
+        high, low = _split_addresses(self._version, addresses)
+        count = low.shape[0]
+        if prefix_lens is None:
+            query_lens = np.full(count, self._max_bits, dtype=np.int64)
+        else:
+            query_lens = np.broadcast_to(
+                np.asarray(prefix_lens, dtype=np.int64), (count,)
+            )
+            high = high & _leading_mask(np.minimum(offset + query_lens, 64))
+            low = low & _leading_mask(np.maximum(offset + query_lens - 64, 0))
+        if not self._nodes:
+            # nothing to match, and no lengths or parents to index below
+            zeros = np.zeros(count, dtype=np.uint64)
+            return BatchResult(
+                nodes=self._nodes,
+                index=np.full(count, -1, dtype=np.int64),
+                ip=zeros.astype(np.uint32)
+                if self._version == Version.v4
+                else (zeros, zeros.copy()),
+                prefix_len=np.zeros(count, dtype=np.uint8),
+                exact=np.zeros(count, dtype=bool),
+            )
+        entry = top[self._fields(np, high, low, 0)]
+        result = np.where(entry > 0, entry - 1, -1)
+        active = np.flatnonzero(entry < 0)
+        node = -entry[active] - 1
+        one = np.uint64(1)
+        for level in range(1, len(self._levels)):
+            if not active.size:
+                break
+            bit = one << self._fields(np, high[active], low[active], level)
+            # wraps around to all ones for the last slot of a 6 bit stride
+            below = (bit << one) - one
+            vector = vectors[node]
+            inner = (vector & bit) != 0
+            leaf = ~inner
+            result[active[leaf]] = leaves[
+                base0[node[leaf]]
+                + _popcount_many(np, leafvecs[node[leaf]] & below[leaf])
+                - 1
+            ]
+            active = active[inner]
+            node = (
+                base1[node[inner]]
+                + _popcount_many(np, vector[inner] & below[inner])
+                - 1
+            )
+        while True:
+            safe = np.where(result >= 0, result, 0)
+            wider = (result >= 0) & (lengths[safe] > query_lens)
+            if not wider.any():
+                break
+            result = np.where(wider, parents[safe], result)
+        short = query_lens < self._root_prefix_len
+        if short.any():
+            root_bits = offset + self._root_prefix_len
+            root_high = np.uint64(self._root_ip >> 64)
+            root_low = np.uint64(self._root_ip & 0xFFFFFFFFFFFFFFFF)
+            inside = (
+                ((high ^ root_high) & _leading_mask(np.minimum(root_bits, 64))) == 0
+            ) & (((low ^ root_low) & _leading_mask(np.maximum(root_bits - 64, 0))) == 0)
+            result = np.where(short, np.where(inside, self._root_result, -1), result)
+        matched = result >= 0
+        safe = np.where(matched, result, 0)
+        prefix_len = np.where(matched, lengths[safe], 0)
+        ip_high_out = np.where(matched, ip_high[safe], np.uint64(0))
+        ip_low_out = np.where(matched, ip_low[safe], np.uint64(0))
+        return BatchResult(
+            nodes=self._nodes,
+            index=result,
+            ip=ip_low_out.astype(np.uint32)
+            if self._version == Version.v4
+            else (ip_high_out, ip_low_out),
+            prefix_len=prefix_len.astype(np.uint8),
+            exact=matched & (prefix_len == query_lens),
+        )
+
+    def _fields(self, np, high, low, level: int):
+        """The slot every address takes at level, as uint64."""
+        shift, mask = self._levels[level]
+        # strides never straddle the two words, shift is relative to the low word
+        if shift >= 64:
+            word = high >> np.uint64(shift - 64)
+        else:
+            word = low >> np.uint64(shift)
+        return word & np.uint64(mask)
+
+    def contains_many(
+        self, addresses: ADDRESSES_T, prefix_lens=None, exact: bool = False
+    ):
+        result = self.get_many(addresses, prefix_lens)
+        if exact:
+            return result.exact
+        return result.index >= 0
+
+    @property
+    def nodes(self) -> List[Any]:
+        return self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, prefix: CIDR) -> bool:
+        return self.contains(prefix)
+
+    def __getitem__(self, prefix: CIDR):
+        return self.get(prefix)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(prefixes={len(self)}, strides={self._strides})"
@@ -0,0 +1,209 @@
+import pickle
+import struct
+import sys
+from array import array
+from enum import IntEnum
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from cidr_man import CIDR
+from cidr_man.cidr import Version
+
+from .cidr_bottle_mapped import _column, _pad
+
+MAGIC = b"CBJL"
+FORMAT_VERSION = 1
+# magic, format version, ip version, sequence number before the first entry, entry count, size of the value blob
+HEADER = struct.Struct("<4sHBxQQQ")
+
+
+class Op(IntEnum):
+    SET = 0
+    DELETE = 1
+    # a passing node made non-passing by aggregation
+    PROMOTE = 2
+
+
+class Entry(NamedTuple):
+    seq: int
+    op: Op
+    prefix: CIDR
+    value: Any
+
+
+class Journal:
+    """
+    Append-only log of the changes made to a trie (see FastBottle.enable_journal), numbered from 1.
+
+    Entries record the resulting state of a prefix rather than the call that changed it: aggregate inserts are followed by
+    a PROMOTE entry per aggregated parent, so replaying a journal never depends on how the replica would aggregate.
+    """
+
+    __slots__ = ("version", "start", "_ops", "_ips", "_lens", "_values")
+
+    def __init__(self, version: Version = Version.v4, start: int = 0):
+        self.version = version
+        # sequence number of the last entry dropped by truncate (or that the journal was loaded after)
+        self.start = start
+        self._ops = bytearray()
+        self._ips: List[int] = []
+        self._lens = bytearray()
+        self._values: List[Any] = []
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the most recent entry."""
+        return self.start + len(self._ops)
+
+    def record(self, op: Op, ip: int, prefix_len: int, value: Any = None) -> int:
+        self._ops.append(op)
+        self._ips.append(ip)
+        self._lens.append(prefix_len)
+        self._values.append(value)
+        return self.start + len(self._ops)
+
+    def changes_since(self, seq: int) -> List[Entry]:
+        """The entries after seq, in order. Raises ValueError if some of them have been truncated."""
+        if seq < self.start:
+            raise ValueError(f"entries after {seq} have been truncated")
+        return list(self._entries(seq - self.start))
+
+    def truncate(self, seq: int):
+        """Drop the entries up to and including seq, e.g. once every replica has caught up with it."""
+        count = min(seq, self.seq) - self.start
+        if count <= 0:
+            return
+        del self._ops[:count]
+        del self._ips[:count]
+        del self._lens[:count]
+        del self._values[:count]
+        self.start += count
+
+    def dumps(self, since: Optional[int] = None) -> bytes:
+        """
+        Encode the entries after since (by default all of them) into the versioned binary journal format.
+
+        The header is followed by 8 byte aligned, little-endian columns: operations and prefix lengths (uint8),
+        ips (uint32 for IPv4, a high/low pair of uint64 for IPv6), value offsets (uint64, one more than the entry count)
+        and finally the blob of pickled values.
+        """
+        if since is None:
+            since = self.start
+        elif since < self.start:
+            raise ValueError(f"entries after {since} have been truncated")
+        first = since - self.start
+        ips = self._ips[first:]
+        if self.version == Version.v4:
+            ip_column = _column("I", ips)
+        else:
+            words = []
+            for ip in ips:
+                words.append(ip >> 64)
+                words.append(ip & 0xFFFFFFFFFFFFFFFF)
+            ip_column = _column("Q", words)
+        offsets = [0]
+        values = []
+        size = 0
+        for value in self._values[first:]:
+            if value is not None:
+                value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                values.append(value)
+                size += len(value)
+            offsets.append(size)
+        header = HEADER.pack(
+            MAGIC, FORMAT_VERSION, int(self.version), since, len(ips), size
+        )
+        return b"".join(
+            [
+                header,
+                _column("B", self._ops[first:]),
+                _column("B", self._lens[first:]),
+                ip_column,
+                _column("Q", offsets),
+            ]
+            + values
+        )
+
+    def dump(self, path: str, since: Optional[int] = None):
+        with open(path, "wb") as f:
+            f.write(self.dumps(since))
+
+    @classmethod
+    def loads(cls, data: bytes) -> "Journal":
+        """Decode a journal written by dumps, values are unpickled so only load journals from trusted sources."""
+        buffer = memoryview(data)
+        magic, format_version, version, start, count, size = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("not a cidr_bottle journal")
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"unsupported journal format version {format_version}")
+        journal = cls(Version(version), start)
+        offset = HEADER.size
+
+        def take(typecode: str, length: int) -> array:
+            nonlocal offset
+            end = offset + length * array(typecode).itemsize
+            column = array(typecode)
+            column.frombytes(buffer[offset:end])
+            if sys.byteorder != "little":
+                column.byteswap()
+            offset = end + _pad(end - offset)
+            return column
+
+        journal._ops = bytearray(take("B", count))
+        journal._lens = bytearray(take("B", count))
+        if journal.version == Version.v4:
+            journal._ips = take("I", count).tolist()
+        else:
+            words = take("Q", count * 2)
+            journal._ips = [
+                words[i] << 64 | words[i + 1] for i in range(0, count * 2, 2)
+            ]
+        offsets = take("Q", count + 1)
+        blob = buffer[offset : offset + size]
+        journal._values = [
+            None if begin == end else pickle.loads(blob[begin:end])
+            for begin, end in zip(offsets, offsets[1:])
+        ]
+        return journal
+
+    @classmethod
+    def load(cls, path: str) -> "Journal":
+        with open(path, "rb") as f:
+            return cls.loads(f.read())
+
+    def _entries(self, first: int = 0) -> Iterator[Entry]:
+        version = self.version
+        for i in range(first, len(self._ops)):
+            yield Entry(
+                self.start + i + 1,
+                Op(self._ops[i]),
+                CIDR(self._ips[i], version, self._lens[i]),
+                self._values[i],
+            )
+
+    def __iter__(self) -> Iterator[Entry]:
+        return self._entries()
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(start={self.start}, seq={self.seq})"
+
+
+def collapse(entries: Iterable[Entry]) -> Tuple[List[Tuple[CIDR, Any]], List[CIDR]]:
+    """
+    The (announce, withdraw) batch for FastBottle.apply_updates with the same effect as applying entries in order.
+    Every entry sets the whole state of its prefix, so only the last entry per prefix matters.
+    """
+    last = {}
+    for entry in entries:
+        last[entry.prefix] = entry
+    announce = []
+    withdraw = []
+    for prefix, entry in last.items():
+        if entry.op == Op.DELETE:
+            withdraw.append(prefix)
+        else:
+            announce.append((prefix, entry.value))
+    return announce, withdraw
@@ -0,0 +1,378 @@
+import mmap as _mmap
+import pickle
+import struct
+import sys
+from array import array
+from typing import Any, Iterator, List, Optional, Type
+
+from cidr_man import CIDR
+from cidr_man.cidr import max_prefix, Version
+
+MAGIC = b"CBTL"
+FORMAT_VERSION = 1
+# magic, format version, ip version, flags, node count, size of the value blob
+HEADER = struct.Struct("<4sHBBQQ")
+FLAG_COMPRESSED = 1
+
+
+def _pad(size: int) -> int:
+    return -size % 8
+
+
+def _column(typecode: str, values) -> bytes:
+    column = array(typecode, values)
+    if sys.byteorder != "little":
+        column.byteswap()
+    data = column.tobytes()
+    return data + bytes(_pad(len(data)))
+
+
+def dumps(root) -> bytes:
+    """
+    Encode a (sub-)trie into the versioned binary snapshot format.
+
+    The header is followed by 8 byte aligned, little-endian columns in preorder:
+    left, right and parent indices (int32, -1 for none), the prefix ip (uint32 for IPv4, a high/low pair of uint64 for IPv6),
+    prefix length and passing flag (uint8), value offsets (uint64, one more than the node count) and finally the blob of pickled values.
+    """
+    nodes = []
+    positions = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        positions[id(node)] = len(nodes)
+        nodes.append(node)
+        if node.right is not None:
+            stack.append(node.right)
+        if node.left is not None:
+            stack.append(node.left)
+    left = [-1 if node.left is None else positions[id(node.left)] for node in nodes]
+    right = [-1 if node.right is None else positions[id(node.right)] for node in nodes]
+    parent = [positions.get(id(node.parent), -1) for node in nodes]
+    parent[0] = -1
+    if root._version == Version.v4:
+        ips = _column("I", (node._ip for node in nodes))
+    else:
+        words = []
+        for node in nodes:
+            words.append(node._ip >> 64)
+            words.append(node._ip & 0xFFFFFFFFFFFFFFFF)
+        ips = _column("Q", words)
+    offsets = [0]
+    values = []
+    size = 0
+    for node in nodes:
+        if node.value is not None:
+            value = pickle.dumps(node.value, protocol=pickle.HIGHEST_PROTOCOL)
+            values.append(value)
+            size += len(value)
+        offsets.append(size)
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        int(root._version),
+        FLAG_COMPRESSED if root.compressed else 0,
+        len(nodes),
+        size,
+    )
+    return b"".join(
+        [
+            header,
+            _column("i", left),
+            _column("i", right),
+            _column("i", parent),
+            ips,
+            _column("B", (node._prefix_len for node in nodes)),
+            _column("B", (node.passing for node in nodes)),
+            _column("Q", offsets),
+        ]
+        + values
+    )
+
+
+class _Storage:
+    """The columns of a snapshot, as zero-copy views where the host byte order allows it."""
+
+    __slots__ = (
+        "version",
+        "max_bits",
+        "compressed",
+        "count",
+        "left",
+        "right",
+        "parent",
+        "ips",
+        "prefix_len",
+        "passing",
+        "offsets",
+        "values",
+        "_buffer",
+        "_offset",
+        "_views",
+        "_mmap",
+        "_file",
+    )
+
+    def __init__(self, buffer, mapped=None, file=None):
+        self._mmap = mapped
+        self._file = file
+        self._buffer = memoryview(buffer)
+        self._views = []
+        magic, format_version, version, flags, count, size = HEADER.unpack_from(
+            self._buffer
+        )
+        if magic != MAGIC:
+            raise ValueError("not a cidr_bottle snapshot")
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot format version {format_version}")
+        self.version = Version(version)
+        self.max_bits = max_prefix(self.version)
+        self.compressed = bool(flags & FLAG_COMPRESSED)
+        self.count = count
+        self._offset = HEADER.size
+        self.left = self._take("i", count)
+        self.right = self._take("i", count)
+        self.parent = self._take("i", count)
+        if self.version == Version.v4:
+            self.ips = self._take("I", count)
+        else:
+            self.ips = self._take("Q", count * 2)
+        self.prefix_len = self._take("B", count)
+        self.passing = self._take("B", count)
+        self.offsets = self._take("Q", count + 1)
+        self.values = self._buffer[self._offset : self._offset + size]
+        self._views.append(self.values)
+
+    def _take(self, typecode: str, count: int):
+        start = self._offset
+        end = start + count * array(typecode).itemsize
+        self._offset = end + _pad(end - start)
+        view = self._buffer[start:end]
+        self._views.append(view)
+        if sys.byteorder == "little":
+            column = view.cast(typecode)
+            self._views.append(column)
+            return column
+        column = array(typecode, view.tobytes())
+        column.byteswap()
+        return column
+
+    def ip(self, index: int) -> int:
+        if self.version == Version.v4:
+            return self.ips[index]
+        return self.ips[index * 2] << 64 | self.ips[index * 2 + 1]
+
+    def value(self, index: int) -> Any:
+        start = self.offsets[index]
+        end = self.offsets[index + 1]
+        if start == end:
+            return None
+        return pickle.loads(self.values[start:end])
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._buffer.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+
+
+class MappedBottle:
+    """
+    cidr_bottle.MappedBottle is a read-only view of a node in a binary snapshot (see FastBottle.dump).
+
+    Lookups are served directly from the snapshot's columns, so a memory-mapped snapshot is shared through the page cache
+    by every process that opens it, and opening it does not depend on the number of routes.
+    Values are unpickled when read, only open snapshots from trusted sources.
+    """
+
+    __slots__ = ("_storage", "_index")
+
+    def __init__(self, buffer, _index: int = 0):
+        if isinstance(buffer, _Storage):
+            self._storage = buffer
+        else:
+            self._storage = _Storage(buffer)
+        self._index = _index
+
+    @classmethod
+    def open(cls, path: str) -> "MappedBottle":
+        file = open(path, "rb")
+        try:
+            mapped = _mmap.mmap(file.fileno(), 0, access=_mmap.ACCESS_READ)
+        except BaseException:
+            file.close()
+            raise
+        return cls(_Storage(mapped, mapped, file))
+
+    def close(self):
+        self._storage.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _node(self, index: int) -> Optional["MappedBottle"]:
+        if index < 0:
+            return None
+        return MappedBottle(self._storage, index)
+
+    @property
+    def prefix(self) -> CIDR:
+        storage = self._storage
+        return CIDR(
+            storage.ip(self._index), storage.version, storage.prefix_len[self._index]
+        )
+
+    @property
+    def value(self) -> Any:
+        return self._storage.value(self._index)
+
+    @property
+    def passing(self) -> bool:
+        return bool(self._storage.passing[self._index])
+
+    @property
+    def left(self) -> Optional["MappedBottle"]:
+        return self._node(self._storage.left[self._index])
+
+    @property
+    def right(self) -> Optional["MappedBottle"]:
+        return self._node(self._storage.right[self._index])
+
+    @property
+    def parent(self) -> Optional["MappedBottle"]:
+        return self._node(self._storage.parent[self._index])
+
+    def get(
+        self, prefix: CIDR, exact: bool = False, covering: bool = False
+    ) -> Optional["MappedBottle"]:
+        storage = self._storage
+        index = self._find(prefix, covering)
+        if exact and (
+            index < 0
+            or storage.prefix_len[index] != prefix.prefix_len
+            or storage.ip(index) != prefix.ip
+        ):
+            raise KeyError("no exact match found")
+        return self._node(index)
+
+    def contains(self, prefix: CIDR, exact: bool = False) -> bool:
+        try:
+            return self.get(prefix, exact) is not None
+        except KeyError:
+            return False
+
+    def children(self) -> List["MappedBottle"]:
+        return list(self.iter_children())
+
+    def iter_children(self) -> Iterator["MappedBottle"]:
+        storage = self._storage
+        stack = [self._index]
+        while stack:
+            index = stack.pop()
+            if not storage.passing[index]:
+                yield MappedBottle(storage, index)
+            if storage.right[index] >= 0:
+                stack.append(storage.right[index])
+            if storage.left[index] >= 0:
+                stack.append(storage.left[index])
+
+    def to_bottle(self, cls: Optional[Type] = None):
+        """Rebuild a mutable trie (FastBottle unless cls is given) from this node's subtree."""
+        if cls is None:
+            from .cidr_bottle_fast import FastBottle as cls
+        storage = self._storage
+        root = cls(prefix=self.prefix, compressed=storage.compressed)
+        root.value = self.value
+        root.passing = self.passing
+        nodes = {self._index: root}
+        stack = [self._index]
+        while stack:
+            index = stack.pop()
+            node = nodes[index]
+            for child, side in (
+                (storage.left[index], "left"),
+                (storage.right[index], "right"),
+            ):
+                if child < 0:
+                    continue
+                new = root._create_node(
+                    storage.ip(child), storage.prefix_len[child], node
+                )
+                new.passing = bool(storage.passing[child])
+                new.value = storage.value(child)
+                setattr(node, side, new)
+                nodes[child] = new
+                stack.append(child)
+        root._recount()
+        return root
+
+    def _find(self, prefix: CIDR, covering: bool = False) -> int:
+        if prefix.version != self._storage.version:
+            raise ValueError("incompatible network version")
+        return self._lookup(prefix.ip, prefix.prefix_len, covering)
+
+    def _lookup(self, ip: int, prefix_len: int, covering: bool = False) -> int:
+        storage = self._storage
+        max_bits = storage.max_bits
+        index = self._index
+        node_len = storage.prefix_len[index]
+        mask = max_bits - node_len
+        if storage.ip(index) >> mask != ip >> mask:
+            return -1
+        left = storage.left
+        right = storage.right
+        lengths = storage.prefix_len
+        passing = storage.passing
+        # without path compression every child is exactly one bit more specific, so it always matches
+        compressed = storage.compressed
+        most_recent_non_passing = -1 if passing[index] else index
+        while node_len < prefix_len:
+            if ip >> (max_bits - node_len - 1) & 1:
+                child = right[index]
+            else:
+                child = left[index]
+            if child < 0:
+                break
+            if compressed:
+                child_len = lengths[child]
+                shift = max_bits - child_len
+                if child_len > prefix_len or storage.ip(child) >> shift != ip >> shift:
+                    break
+                node_len = child_len
+            else:
+                node_len += 1
+            index = child
+            if not passing[index]:
+                most_recent_non_passing = index
+        if covering and storage.passing[index]:
+            return most_recent_non_passing
+        return index
+
+    def __str__(self):
+        return self.prefix.compressed
+
+    def __repr__(self):
+        return f"{type(self).__name__}(prefix={self.prefix}, value={self.value}, passing={self.passing})"
+
+    def __contains__(self, prefix: CIDR) -> bool:
+        return self.contains(prefix)
+
+    def __getitem__(self, prefix: CIDR) -> Optional["MappedBottle"]:
+        return self.get(prefix)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, MappedBottle)
+            and other._storage is self._storage
+            and other._index == self._index
+        )
+
+    def __hash__(self):
+        return hash((id(self._storage), self._index))
@@ -0,0 +1,361 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from cidr_man import CIDR
+from cidr_man.cidr import max_prefix, Version
+
+from .cidr_bottle_fast import Diff, FastBottle
+from .cidr_bottle_mapped import MappedBottle, dumps
+
+# shard by /8 for IPv4 and /16 for IPv6
+DEFAULT_SHARD_LEN = {
+    Version.v4: 8,
+    Version.v6: 16,
+}
+
+# lookup results returned by the workers besides a node index:
+# the query is not within the shard, so it is answered from the top of the trie
+_OUTSIDE = -1
+# the query is within the shard, but no non-passing node of the shard covers it
+_UNCOVERED = -2
+
+# snapshots of the shards, handed to every worker once by the pool initializer
+_snapshots: Dict[int, bytes] = {}
+_views: Dict[int, MappedBottle] = {}
+
+
+def _initialise(snapshots: Dict[int, bytes]):
+    global _snapshots
+    _snapshots = snapshots
+    _views.clear()
+
+
+def _shard(key: int) -> MappedBottle:
+    view = _views.get(key)
+    if view is None:
+        view = _views[key] = MappedBottle(_snapshots[key])
+    return view
+
+
+def _get_job(key: int, queries: List[Tuple[int, int]], covering: bool) -> array:
+    shard = _shard(key)
+    storage = shard._storage
+    max_bits = storage.max_bits
+    root_len = storage.prefix_len[0]
+    root_ip = storage.ip(0)
+    mask = max_bits - root_len
+    results = array("i")
+    for ip, prefix_len in queries:
+        if prefix_len < root_len or ip >> mask != root_ip >> mask:
+            results.append(_OUTSIDE)
+            continue
+        index = shard._lookup(ip, prefix_len, covering)
+        results.append(_UNCOVERED if index < 0 else index)
+    return results
+
+
+def _children_job(key: int, ip: int, prefix_len: int) -> array:
+    shard = _shard(key)
+    node = shard._node(shard._lookup(ip, prefix_len))
+    return array("i", (child._index for child in node.iter_children()))
+
+
+def _diff_job(
+    key: int, other: bytes
+) -> Tuple[array, array, array, array, array, array]:
+    # rebuilt into tries, as diff walks the nodes' integer prefixes
+    this = _shard(key).to_bottle()
+    that = MappedBottle(other).to_bottle()
+    # to_bottle preserves the shape, so the preorder positions match the snapshots
+    these = {id(node): i for i, node in enumerate(this.walk())}
+    those = {id(node): i for i, node in enumerate(that.walk())}
+    result = this.diff(that)
+    return (
+        array("i", (these[id(node)] for node, _ in result.exact)),
+        array("i", (those[id(match)] for _, match in result.exact)),
+        array("i", (these[id(node)] for node in result.more_specific)),
+        array("i", (these[id(node)] for node, _ in result.covering)),
+        array("i", (those[id(match)] for _, match in result.covering)),
+        array("i", (these[id(node)] for node in result.absent)),
+    )
+
+
+class _Shards:
+    """The top of a trie (the nodes less specific than the shard length) and the subtries hanging off it, one per shard key."""
+
+    __slots__ = ("root", "shift", "frontier", "nodes", "fallback", "top")
+
+    def __init__(self, root: FastBottle, shard_len: int):
+        max_bits = max_prefix(root._version)
+        self.root = root
+        self.shift = max_bits - shard_len
+        self.frontier: Dict[int, FastBottle] = {}
+        self.nodes: Dict[int, List[FastBottle]] = {}
+        # the nearest non-passing node above every shard
+        self.fallback: Dict[int, Optional[FastBottle]] = {}
+        # the non-passing nodes above the shards, in preorder
+        self.top: List[FastBottle] = []
+        stack = [(root, None)]
+        while stack:
+            node, covering = stack.pop()
+            if node._prefix_len >= shard_len:
+                # the first nodes at or below the shard length start at unique shard keys,
+                # as their parents are less specific than the shard length
+                key = node._ip >> self.shift
+                self.frontier[key] = node
+                self.nodes[key] = list(node.walk())
+                self.fallback[key] = covering
+                continue
+            if not node.passing:
+                self.top.append(node)
+                covering = node
+            if node.right is not None:
+                stack.append((node.right, covering))
+            if node.left is not None:
+                stack.append((node.left, covering))
+
+    def key(self, prefix: CIDR) -> Optional[int]:
+        if self.shift > max_prefix(prefix.version) - prefix.prefix_len:
+            return None
+        key = prefix.ip >> self.shift
+        return key if key in self.frontier else None
+
+    def snapshots(self) -> Dict[int, bytes]:
+        return {key: dumps(node) for key, node in self.frontier.items()}
+
+
+class ParallelBottle:
+    """
+    cidr_bottle.ParallelBottle runs batches of lookups, children and diffs against a FastBottle (or Bottle) across a pool of processes.
+
+    The trie is split into shards by its top level sub-prefixes (the /8s for IPv4 and the /16s for IPv6 by default),
+    every shard is handed to the workers once, as a flat binary snapshot rather than a pickled graph of nodes,
+    and the work for each shard runs as a separate job. Results are the nodes of the original trie.
+    Changes made to the trie afterwards are not seen by the workers, create a new ParallelBottle instead.
+    """
+
+    def __init__(
+        self,
+        root: FastBottle,
+        shard_len: Optional[int] = None,
+        max_workers: Optional[int] = None,
+    ):
+        self._version = root._version
+        if shard_len is None:
+            shard_len = DEFAULT_SHARD_LEN[self._version]
+        if not 0 < shard_len <= max_prefix(self._version):
+            raise ValueError(f"invalid shard length {shard_len}")
+        self._shard_len = shard_len
+        self._shards = _Shards(root, shard_len)
+        self._executor = ProcessPoolExecutor(
+            max_workers,
+            initializer=_initialise,
+            initargs=(self._shards.snapshots(),),
+        )
+
+    @property
+    def root(self) -> FastBottle:
+        return self._shards.root
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_many(
+        self, prefixes: Sequence[CIDR], covering: bool = False
+    ) -> List[Optional[FastBottle]]:
+        """Equivalent of [root.get(prefix, covering=covering) for prefix in prefixes]."""
+        shards = self._shards
+        results: List[Optional[FastBottle]] = [None] * len(prefixes)
+        batches: Dict[int, Tuple[List[int], List[Tuple[int, int]]]] = {}
+        for i, prefix in enumerate(prefixes):
+            if prefix.version != self._version:
+                raise ValueError("incompatible network version")
+            key = shards.key(prefix)
+            if key is None:
+                # only reaches the top of the trie
+                results[i] = shards.root.get(prefix, covering=covering)
+                continue
+            positions, queries = batches.setdefault(key, ([], []))
+            positions.append(i)
+            queries.append((prefix.ip, prefix.prefix_len))
+        jobs = {
+            key: self._executor.submit(_get_job, key, queries, covering)
+            for key, (_, queries) in batches.items()
+        }
+        for key, job in jobs.items():
+            nodes = shards.nodes[key]
+            for i, index in zip(batches[key][0], job.result()):
+                if index >= 0:
+                    results[i] = nodes[index]
+                elif index == _UNCOVERED:
+                    results[i] = shards.fallback[key]
+                else:
+                    results[i] = shards.root.get(prefixes[i], covering=covering)
+        return results
+
+    def contains_many(
+        self, prefixes: Sequence[CIDR], exact: bool = False
+    ) -> List[bool]:
+        """Equivalent of [root.contains(prefix, exact) for prefix in prefixes]."""
+        return [
+            node is not None
+            and (
+                not exact
+                or (node._ip == prefix.ip and node._prefix_len == prefix.prefix_len)
+            )
+            for prefix, node in zip(prefixes, self.get_many(prefixes))
+        ]
+
+    def children(self, prefix: Optional[CIDR] = None) -> List[FastBottle]:
+        """Equivalent of root.get(prefix).children() (or root.children() without a prefix), collected from every shard below it."""
+        shards = self._shards
+        node = shards.root if prefix is None else shards.root.get(prefix)
+        if node is None:
+            return []
+        if node._prefix_len >= self._shard_len:
+            key = node._ip >> shards.shift
+            indices = self._executor.submit(
+                _children_job, key, node._ip, node._prefix_len
+            ).result()
+            return [shards.nodes[key][index] for index in indices]
+        # walk the top of the trie below node, with a job per shard it reaches
+        parts = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current._prefix_len >= self._shard_len:
+                key = current._ip >> shards.shift
+                parts.append(
+                    (
+                        key,
+                        self._executor.submit(
+                            _children_job, key, current._ip, current._prefix_len
+                        ),
+                    )
+                )
+                continue
+            if not current.passing:
+                parts.append(current)
+            if current.right is not None:
+                stack.append(current.right)
+            if current.left is not None:
+                stack.append(current.left)
+        result = []
+        for part in parts:
+            if isinstance(part, tuple):
+                key, job = part
+                nodes = shards.nodes[key]
+                result.extend(nodes[index] for index in job.result())
+            else:
+                result.append(part)
+        return result
+
+    def diff(self, other: FastBottle) -> Diff:
+        """Equivalent of root.diff(other), with other sharded the same way and sent along with the jobs."""
+        if other._version != self._version:
+            raise ValueError("incompatible network version")
+        shards = self._shards
+        theirs = _Shards(other, self._shard_len)
+        result = Diff([], [], [], [])
+        for node in shards.top:
+            _classify(result, node, other)
+        jobs = {}
+        for key, frontier in shards.frontier.items():
+            # the nearest non-passing node of other above the shard
+            fallback = None
+            if self._shard_len - 1 >= other._prefix_len:
+                fallback = other.get(
+                    CIDR(key << shards.shift, self._version, self._shard_len - 1),
+                    covering=True,
+                )
+            if key in theirs.frontier:
+                jobs[key] = (
+                    fallback,
+                    self._executor.submit(_diff_job, key, dumps(theirs.frontier[key])),
+                )
+                continue
+            for node in frontier.iter_children():
+                if fallback is None:
+                    result.absent.append(node)
+                else:
+                    result.covering.append((node, fallback))
+        for key, (fallback, job) in jobs.items():
+            nodes = shards.nodes[key]
+            other_nodes = theirs.nodes[key]
+            (
+                exact,
+                exact_other,
+                more_specific,
+                covering,
+                covering_other,
+                absent,
+            ) = job.result()
+            result.exact.extend(
+                (nodes[i], other_nodes[j]) for i, j in zip(exact, exact_other)
+            )
+            result.more_specific.extend(nodes[i] for i in more_specific)
+            result.covering.extend(
+                (nodes[i], other_nodes[j]) for i, j in zip(covering, covering_other)
+            )
+            for i in absent:
+                if fallback is None:
+                    result.absent.append(nodes[i])
+                else:
+                    result.covering.append((nodes[i], fallback))
+        for entries in result:
+            entries.sort(key=_address_order)
+        return result
+
+
+def _address_order(entry: Any) -> Tuple[int, int]:
+    node = entry[0] if isinstance(entry, tuple) else entry
+    return node._ip, node._prefix_len
+
+
+def _classify(result: Diff, node: FastBottle, other: FastBottle):
+    """Classify a single prefix against other (see Diff) with a couple of lookups, used for the few prefixes above the shards."""
+    max_bits = max_prefix(node._version)
+    ip = node._ip
+    prefix_len = node._prefix_len
+    shift = max_bits - prefix_len
+    if other._prefix_len > prefix_len:
+        # other is entirely within this prefix
+        if other._ip >> shift == ip >> shift and len(other):
+            result.more_specific.append(node)
+        else:
+            result.absent.append(node)
+        return
+    found = other._find_int(ip, prefix_len)
+    if found is not None:
+        if found._prefix_len == prefix_len:
+            if not found.passing:
+                result.exact.append((node, found))
+                return
+            # a passing node only counts its descendants
+            more_specific = len(found)
+        else:
+            # with path compression the next node down may already be within this prefix
+            if ip >> (max_bits - found._prefix_len - 1) & 1:
+                inside = found.right
+            else:
+                inside = found.left
+            more_specific = (
+                len(inside)
+                if inside is not None and inside._ip >> shift == ip >> shift
+                else 0
+            )
+        if more_specific:
+            result.more_specific.append(node)
+            return
+    covering = other.get(node._prefix, covering=True)
+    if covering is not None:
+        result.covering.append((node, covering))
+    else:
+        result.absent.append(node)
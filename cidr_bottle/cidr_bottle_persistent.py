@@ -0,0 +1,234 @@
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from cidr_man import CIDR
+from cidr_man.cidr import max_prefix
+
+from .cidr_bottle_fast import Changes, FastBottle, _RootState
+from .cidr_bottle_journal import Entry, Journal, collapse
+
+# the slots node classes add to FastBottle's
+_EXTRA_SLOTS: Dict[type, Tuple[str, ...]] = {}
+
+
+def _copy(node: FastBottle, parent: Optional[FastBottle]) -> FastBottle:
+    """A shallow copy of node under parent, sharing its children."""
+    cls = type(node)
+    copy = object.__new__(cls)
+    copy.left = node.left
+    copy.right = node.right
+    copy.parent = parent
+    copy._ip = node._ip
+    copy._prefix_len = node._prefix_len
+    copy._version = node._version
+    copy.value = node.value
+    copy.passing = node.passing
+    copy.compressed = node.compressed
+    copy._count = node._count
+    # the copy's subtree is about to change, and caches belong to the version they were built for
+    copy._children = copy._root_state = None
+    copy._changed = True
+    # while a journal carries on across versions
+    journal = node.journal
+    if journal is not None:
+        copy._root_state = _RootState()
+        copy._root_state.journal = journal
+    if cls is not FastBottle:
+        extra = _EXTRA_SLOTS.get(cls)
+        if extra is None:
+            extra = _EXTRA_SLOTS[cls] = tuple(
+                slot
+                for klass in cls.__mro__[: cls.__mro__.index(FastBottle)]
+                for slot in klass.__dict__.get("__slots__", ())
+            )
+        for slot in extra:
+            setattr(copy, slot, getattr(node, slot))
+    return copy
+
+
+def _copy_path(
+    root: FastBottle,
+    ip: int,
+    prefix_len: int,
+    copies: Dict[int, Tuple[FastBottle, FastBottle]],
+):
+    """
+    Replace every node of the (unpublished) root's trie that a lookup of (ip, prefix_len) passes through by a copy,
+    skipping the copies made so far (copies maps their ids to (copy, original)), so the write that follows only changes copies.
+    """
+    max_bits = max_prefix(root._version)
+    node = root
+    while node._prefix_len < prefix_len:
+        go_right = ip >> (max_bits - node._prefix_len - 1) & 1
+        child = node.right if go_right else node.left
+        if child is None:
+            return
+        # the same test as the compressed lookup, always true for the one bit steps of an uncompressed trie
+        shift = max_bits - child._prefix_len
+        if child._prefix_len > prefix_len or child._ip >> shift != ip >> shift:
+            return
+        if id(child) not in copies:
+            original = child
+            child = _copy(original, node)
+            copies[id(child)] = (child, original)
+            if go_right:
+                node.right = child
+            else:
+                node.left = child
+        node = child
+
+
+class PersistentBottle:
+    """
+    cidr_bottle.PersistentBottle keeps a FastBottle (or Bottle) as a series of immutable versions, so readers never wait for a writer.
+
+    A write copies the nodes on the paths from the root to the prefixes it touches, applies the change to the copies
+    (sharing every other node with the previous version) and publishes the new root with a single assignment.
+    snapshot() returns the current root, which no later write changes.
+
+    Parent links are only kept for the current version, older versions can be read top down but not walked upwards.
+    """
+
+    __slots__ = ("_root", "_lock")
+
+    _root: FastBottle
+
+    def __init__(
+        self,
+        root: Optional[FastBottle] = None,
+        prefix: Optional[CIDR] = None,
+        compressed: bool = False,
+    ):
+        if root is None:
+            root = FastBottle(prefix=prefix, compressed=compressed)
+        elif root.parent is not None:
+            raise ValueError("root must not have a parent")
+        self._root = root
+        # serialises writers, readers never take it
+        self._lock = Lock()
+
+    def snapshot(self) -> FastBottle:
+        """
+        The current version in O(1). Reads from it are safe from any thread without locking,
+        but it must not be changed itself: its nodes are shared with later versions.
+        """
+        return self._root
+
+    def get(
+        self, prefix: Union[CIDR, str], exact: bool = False, covering: bool = False
+    ) -> Optional[FastBottle]:
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        return self._root.get(prefix, exact, covering)
+
+    def contains(self, prefix: Union[CIDR, str], exact: bool = False) -> bool:
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        return self._root.contains(prefix, exact)
+
+    def children(self) -> List[Any]:
+        return self._root.children()
+
+    def set(
+        self,
+        prefix: Union[CIDR, str],
+        value: Any = None,
+        delete: bool = False,
+        aggregate: bool = False,
+    ) -> FastBottle:
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        with self._lock:
+            root, copies = self._writable([prefix])
+            node = root.set(prefix, value, delete, aggregate)
+            self._publish(root, copies)
+        return node
+
+    def insert(
+        self, prefix: Union[CIDR, str], value: Any = None, aggregate: bool = False
+    ):
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        with self._lock:
+            root, copies = self._writable([prefix])
+            root.insert(prefix, value, aggregate)
+            self._publish(root, copies)
+
+    def delete(self, prefix: Union[CIDR, str]):
+        self.set(prefix, delete=True)
+
+    def apply_updates(
+        self,
+        announce: Iterable[Tuple[Union[CIDR, str], Any]] = (),
+        withdraw: Iterable[Union[CIDR, str]] = (),
+    ) -> Changes:
+        """FastBottle.apply_updates, publishing the whole batch as a single new version."""
+        announce = [
+            (prefix if isinstance(prefix, CIDR) else CIDR(prefix), value)
+            for prefix, value in announce
+        ]
+        withdraw = [
+            prefix if isinstance(prefix, CIDR) else CIDR(prefix) for prefix in withdraw
+        ]
+        with self._lock:
+            root, copies = self._writable(
+                [prefix for prefix, _ in announce] + withdraw,
+            )
+            changes = root.apply_updates(announce, withdraw)
+            self._publish(root, copies)
+        return changes
+
+    def changes_since(self, seq: int) -> List[Entry]:
+        return self._root.changes_since(seq)
+
+    def replay(self, journal: Union[Journal, Iterable[Entry]]) -> Changes:
+        """FastBottle.replay, publishing the whole journal as a single new version."""
+        announce, withdraw = collapse(journal)
+        return self.apply_updates(announce, withdraw)
+
+    def _writable(
+        self, prefixes: List[CIDR]
+    ) -> Tuple[FastBottle, Dict[int, Tuple[FastBottle, FastBottle]]]:
+        """An unpublished copy of the current root in which the paths to prefixes are copies as well, and the copies made."""
+        root = _copy(self._root, None)
+        copies = {id(root): (root, self._root)}
+        for prefix in prefixes:
+            if prefix.version == root._version:
+                _copy_path(root, prefix.ip, prefix.prefix_len, copies)
+        return root, copies
+
+    def _publish(
+        self, root: FastBottle, copies: Dict[int, Tuple[FastBottle, FastBottle]]
+    ):
+        # readers never follow parent links, so the shared nodes are handed to the new version, which leaves
+        # the replaced nodes without cycles (and older versions free as soon as their last reader drops them)
+        for copy, original in copies.values():
+            original.parent = None
+            if copy.parent is None and copy is not root:
+                # pruned by the write
+                continue
+            for child in (copy.left, copy.right):
+                if child is not None:
+                    child.parent = copy
+        self._root = root
+
+    def __len__(self) -> int:
+        return len(self._root)
+
+    def __bool__(self) -> bool:
+        return True
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._root!r})"
+
+    def __contains__(self, prefix: Union[CIDR, str]) -> bool:
+        return self.contains(prefix)
+
+    def __getitem__(self, prefix: Union[CIDR, str]) -> Optional[FastBottle]:
+        return self.get(prefix)
+
+    def __setitem__(self, prefix: Union[CIDR, str], value):
+        self.insert(prefix, value)
+
+    def __delitem__(self, prefix: Union[CIDR, str]):
+        self.delete(prefix)
@@ -0,0 +1,197 @@
+from enum import Enum
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from cidr_man import CIDR
+from cidr_man.cidr import max_prefix
+
+from .cidr_bottle_fast import FastBottle
+
+
+class Validity(Enum):
+    """Route origin validation states (RFC 6811)."""
+
+    VALID = "valid"
+    INVALID = "invalid"
+    NOT_FOUND = "not-found"
+
+
+class Roa(NamedTuple):
+    """A validated ROA payload, the prefix is the node it is stored on."""
+
+    asn: int
+    max_length: int
+
+
+class RoaBottle(FastBottle):
+    """
+    cidr_bottle.RoaBottle is a FastBottle for route origin validation.
+
+    Every non-passing node holds a list of the Roa (origin asn, max length) entries for its prefix,
+    validating an announcement collects the entries of every covering prefix in a single walk from the root.
+    """
+
+    __slots__ = ()
+
+    def add(self, prefix: Union[CIDR, str], asn: int, max_length: Optional[int] = None):
+        """Add a ROA for prefix, max_length defaults to the length of the prefix."""
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        if max_length is None:
+            max_length = prefix.prefix_len
+        if not prefix.prefix_len <= max_length <= max_prefix(prefix.version):
+            raise ValueError(f"invalid max length {max_length} for {prefix.compressed}")
+        roa = Roa(asn, max_length)
+        node = self._find(prefix)
+        if (
+            node is not None
+            and not node.passing
+            and node._prefix_len == prefix.prefix_len
+            and node._ip == prefix.ip
+        ):
+            node.value.append(roa)
+        else:
+            self.insert(prefix, [roa])
+
+    def remove(
+        self, prefix: Union[CIDR, str], asn: int, max_length: Optional[int] = None
+    ):
+        """Remove a ROA added with add, the node is deleted along with its last ROA."""
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        if max_length is None:
+            max_length = prefix.prefix_len
+        node = self.get(prefix, exact=True)
+        roa = Roa(asn, max_length)
+        if node.passing or roa not in node.value:
+            raise KeyError(
+                f"attempting to remove non-existent ROA {prefix.compressed} AS{asn} (max length {max_length})"
+            )
+        node.value.remove(roa)
+        if not node.value:
+            self.delete(prefix)
+
+    @classmethod
+    def from_roas(
+        cls,
+        roas: Iterable[Tuple[CIDR, int, Optional[int]]],
+        prefix: CIDR = None,
+        compressed: bool = False,
+    ) -> "RoaBottle":
+        """Build a new RoaBottle from (prefix, asn, max_length) triples in a single pass, see FastBottle.from_sorted."""
+        entries = {}
+        for roa_prefix, asn, max_length in roas:
+            if not isinstance(roa_prefix, CIDR):
+                roa_prefix = CIDR(roa_prefix)
+            if max_length is None:
+                max_length = roa_prefix.prefix_len
+            if (
+                not roa_prefix.prefix_len
+                <= max_length
+                <= max_prefix(roa_prefix.version)
+            ):
+                raise ValueError(
+                    f"invalid max length {max_length} for {roa_prefix.compressed}"
+                )
+            entries.setdefault(roa_prefix, []).append(Roa(asn, max_length))
+        return cls.from_sorted(entries.items(), prefix=prefix, compressed=compressed)
+
+    def covering_roas(self, prefix: Union[CIDR, str]) -> Iterator[Tuple[CIDR, Roa]]:
+        """Yield (prefix, Roa) for every ROA covering prefix, least specific first."""
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        for node in self._covering([self], [], prefix):
+            for roa in node.value:
+                yield node._prefix, roa
+
+    def validate(self, prefix: Union[CIDR, str], origin_asn: Optional[int]) -> Validity:
+        """
+        Validate an announcement of prefix by origin_asn (None for an AS_SET or otherwise unknown origin).
+        Only ROAs covering the announced prefix count, a ROA for AS0 never validates a route.
+        """
+        if not isinstance(prefix, CIDR):
+            prefix = CIDR(prefix)
+        return _validity(
+            self._covering([self], [], prefix), prefix.prefix_len, origin_asn
+        )
+
+    def validate_many(
+        self, routes: Iterable[Tuple[Union[CIDR, str], Optional[int]]]
+    ) -> List[Validity]:
+        """
+        Validate a batch of (prefix, origin_asn) announcements, returning the states in input order.
+        Routes are visited in address order so that the walk down the trie is shared between neighbouring routes.
+        """
+        routes = [
+            (prefix if isinstance(prefix, CIDR) else CIDR(prefix), asn)
+            for prefix, asn in routes
+        ]
+        order = sorted(
+            range(len(routes)),
+            key=lambda i: (routes[i][0].ip, routes[i][0].prefix_len),
+        )
+        results = [Validity.NOT_FOUND] * len(routes)
+        # path from self to the deepest node reached for the previous route, and its non-passing subset
+        path = [self]
+        covering = []
+        for i in order:
+            prefix, asn = routes[i]
+            results[i] = _validity(
+                self._covering(path, covering, prefix), prefix.prefix_len, asn
+            )
+        return results
+
+    def _covering(
+        self, path: List[FastBottle], covering: List[FastBottle], prefix: CIDR
+    ) -> List[FastBottle]:
+        """
+        Non-passing nodes covering prefix, least specific first.
+        path and covering are reused from the previous (lower addressed) prefix, so only the part of the walk that differs is repeated.
+        """
+        if prefix.version != self._version:
+            raise ValueError("incompatible network version")
+        max_bits = max_prefix(self._version)
+        ip = prefix.ip
+        prefix_len = prefix.prefix_len
+        shift = max_bits - self._prefix_len
+        if prefix_len < self._prefix_len or self._ip >> shift != ip >> shift:
+            return []
+        node = path[-1]
+        while len(path) > 1:
+            shift = max_bits - node._prefix_len
+            if node._prefix_len <= prefix_len and node._ip >> shift == ip >> shift:
+                break
+            if covering and covering[-1] is node:
+                covering.pop()
+            path.pop()
+            node = path[-1]
+        if not covering and not self.passing:
+            covering.append(self)
+        while node._prefix_len < prefix_len:
+            if ip >> (max_bits - node._prefix_len - 1) & 1:
+                child = node.right
+            else:
+                child = node.left
+            if child is None:
+                break
+            shift = max_bits - child._prefix_len
+            if child._prefix_len > prefix_len or child._ip >> shift != ip >> shift:
+                break
+            node = child
+            path.append(node)
+            if not node.passing:
+                covering.append(node)
+        return covering
+
+
+def _validity(
+    covering: Iterable[FastBottle], prefix_len: int, origin_asn: Optional[int]
+) -> Validity:
+    state = Validity.NOT_FOUND
+    for node in covering:
+        state = Validity.INVALID
+        if origin_asn is None or origin_asn == 0:
+            continue
+        for roa in node.value:
+            if roa.asn == origin_asn and prefix_len <= roa.max_length:
+                return Validity.VALID
+    return state
@@ -0,0 +1,179 @@
+import sys
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from cidr_man.cidr import max_prefix
+
+EXPORT_HOOK_T = Callable[[Dict[str, Any]], Any]
+
+# methods of FastBottle replaced while instrumentation is enabled
+INSTRUMENTED = ("_find_int", "_create_node", "_set", "children", "_aggregate")
+
+
+class Stats(NamedTuple):
+    """
+    Shape of a (sub-)trie, as returned by FastBottle.stats.
+
+    bytes estimates the memory held by the nodes themselves (including their addresses and cached children lists),
+    values are not included. depths maps the distance from the node stats was called on to the number of nodes at it.
+    """
+
+    nodes: int
+    passing: int
+    non_passing: int
+    bytes: int
+    depths: Dict[int, int]
+
+
+def collect(root: Any) -> Stats:
+    nodes = passing = size = 0
+    depths: Dict[int, int] = {}
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        nodes += 1
+        passing += node.passing
+        depths[depth] = depths.get(depth, 0) + 1
+        size += sys.getsizeof(node)
+        if node._ip > 256:
+            # small ints are shared by the interpreter
+            size += sys.getsizeof(node._ip)
+        if node._children is not None:
+            size += sys.getsizeof(node._children)
+        for child in (node.left, node.right):
+            if child is not None:
+                stack.append((child, depth + 1))
+    return Stats(nodes, passing, nodes - passing, size, dict(sorted(depths.items())))
+
+
+class Counters:
+    """
+    Counters updated by the instrumented hot paths of every trie while instrumentation is enabled.
+
+    find_depths maps the number of nodes visited by a lookup (the depth it reached) to the number of lookups,
+    set_created maps the number of nodes created by an insert to the number of inserts.
+    """
+
+    __slots__ = (
+        "hook",
+        "finds",
+        "find_visits",
+        "find_depths",
+        "sets",
+        "nodes_created",
+        "set_created",
+        "children_hits",
+        "children_misses",
+        "aggregates",
+        "aggregate_steps",
+    )
+
+    def __init__(self, hook: Optional[EXPORT_HOOK_T] = None):
+        self.hook = hook
+        self.reset()
+
+    def reset(self):
+        self.finds = 0
+        self.find_visits = 0
+        self.find_depths: Dict[int, int] = {}
+        self.sets = 0
+        self.nodes_created = 0
+        self.set_created: Dict[int, int] = {}
+        self.children_hits = 0
+        self.children_misses = 0
+        self.aggregates = 0
+        self.aggregate_steps = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        snapshot = {}
+        for name in self.__slots__[1:]:
+            value = getattr(self, name)
+            snapshot[name] = (
+                dict(sorted(value.items())) if isinstance(value, dict) else value
+            )
+        return snapshot
+
+    def export(self, stats: Optional[Stats] = None) -> Dict[str, Any]:
+        """Snapshot of the counters (and optionally the stats of a trie) as a dict, which is also passed to the hook."""
+        snapshot = self.as_dict()
+        if stats is not None:
+            snapshot.update(stats._asdict())
+        if self.hook is not None:
+            self.hook(snapshot)
+        return snapshot
+
+    def __repr__(self):
+        return f"{type(self).__name__}(finds={self.finds}, sets={self.sets}, nodes_created={self.nodes_created})"
+
+
+def instrument(cls: type, counters: Counters) -> Dict[str, Any]:
+    """Replace the hot paths of cls with counting wrappers, returning the originals for restore."""
+    originals = {name: cls.__dict__[name] for name in INSTRUMENTED}
+    find_int = originals["_find_int"]
+    create_node = originals["_create_node"]
+    set_ = originals["_set"]
+    children = originals["children"]
+    aggregate = originals["_aggregate"].__func__
+
+    def _find_int(self, ip, prefix_len, create_if_missing=False, covering=False):
+        # the deepest node reached, its path gives both the visits and the covering node
+        node = find_int(self, ip, prefix_len, create_if_missing)
+        visited = 1
+        covering_node = None if self.passing else self
+        if node is not None:
+            # walked down again rather than up the parent links, which nodes shared between snapshots do not keep
+            max_bits = max_prefix(self._version)
+            current = self
+            while current is not node:
+                if node._ip >> (max_bits - current._prefix_len - 1) & 1:
+                    current = current.right
+                else:
+                    current = current.left
+                visited += 1
+                if not current.passing:
+                    covering_node = current
+        counters.finds += 1
+        counters.find_visits += visited
+        counters.find_depths[visited] = counters.find_depths.get(visited, 0) + 1
+        if covering and node is not None and node.passing:
+            return covering_node
+        return node
+
+    def _create_node(self, ip, prefix_len, parent):
+        counters.nodes_created += 1
+        return create_node(self, ip, prefix_len, parent)
+
+    def _set(self, *args, **kwargs):
+        before = counters.nodes_created
+        node = set_(self, *args, **kwargs)
+        created = counters.nodes_created - before
+        counters.sets += 1
+        counters.set_created[created] = counters.set_created.get(created, 0) + 1
+        return node
+
+    def _children(self):
+        if self._changed:
+            counters.children_misses += 1
+        else:
+            counters.children_hits += 1
+        return children(self)
+
+    def _aggregate(node):
+        steps = aggregate(node)
+        counters.aggregates += 1
+        counters.aggregate_steps += steps
+        return steps
+
+    for name, wrapper in (
+        ("_find_int", _find_int),
+        ("_create_node", _create_node),
+        ("_set", _set),
+        ("children", _children),
+        ("_aggregate", staticmethod(_aggregate)),
+    ):
+        setattr(cls, name, wrapper)
+    return originals
+
+
+def restore(cls: type, originals: Dict[str, Any]):
+    for name, method in originals.items():
+        setattr(cls, name, method)
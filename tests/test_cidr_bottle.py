@@ -1,3 +1,4 @@
+import pickle
 from ipaddress import IPv4Network
 
 import pytest
@@ -175,8 +176,9 @@ def test_delete():
     assert not root[CIDR("128.128.0.0/9")].passing
     del root[CIDR("128.128.0.0/9")]
     assert root[CIDR("128.0.0.0/1")].prefix == CIDR("128.0.0.0/1")
-    assert root[CIDR("128.128.0.0/9")].prefix == CIDR("128.0.0.0/8")
-    assert root[CIDR("128.128.0.0/9")].passing
+    # the passing nodes leading to the deleted /9 are pruned along with it
+    assert root[CIDR("128.128.0.0/9")].prefix == CIDR("128.0.0.0/1")
+    assert root.right.left is None and root.right.right is None
 
 
 def test_children():
@@ -188,3 +190,143 @@ def test_children():
             subnets.append(line.strip())
     result = [node.prefix.compressed for node in root.children()]
     assert set(result) == set(subnets)
+
+
+def test_compressed():
+    root = Bottle(prefix="0.0.0.0/0", compressed=True)
+    root.insert("198.51.100.0/24", 1)
+    root.insert("198.51.100.128/25", 2)
+    assert root.right.prefix == "198.51.100.0/24"
+    assert root.get("198.51.100.200/32").value == 2
+    assert root.get("198.51.100.0/25").value == 1
+
+
+def test_slots():
+    root = Bottle(prefix="0.0.0.0/0")
+    root.insert("192.0.2.0/24", 1)
+    assert not hasattr(root.get("192.0.2.0/24"), "__dict__")
+    assert root.get("192.0.2.0/25").prefix == "192.0.2.0/24"
+    assert root.get("192.0.2.0/23").prefix == "192.0.2.0/23"
+
+
+def test_bulk_load():
+    root = Bottle.bulk_load(
+        [("198.51.100.0/24", 1), (IPv4Network("192.0.2.0/24"), 2)],
+        prefix="0.0.0.0/0",
+    )
+    assert root.get("198.51.100.7/32").value == 1
+    assert root.get("192.0.2.0/24", exact=True).value == 2
+    assert isinstance(root.get("192.0.2.0/24").prefix, str)
+
+
+def test_iter_children():
+    root = Bottle(prefix="0.0.0.0/0")
+    root.insert("198.51.100.0/25")
+    root.insert("198.51.100.128/25")
+    children = root["198.51.100.0/24"].iter_children()
+    assert next(children) == "198.51.100.0/25"
+    assert next(children) == "198.51.100.128/25"
+    assert list(root.iter_children(max_depth=24)) == []
+
+
+def test_len():
+    root = Bottle(prefix="0.0.0.0/0")
+    root.insert("198.51.100.0/24")
+    root.insert("198.51.100.0/25")
+    assert len(root) == 2
+    assert len(root["198.51.100.0/25"]) == 1
+    del root["198.51.100.0/25"]
+    assert len(root) == 1
+
+
+def test_set_operations():
+    a = Bottle(prefix="198.51.100.0/24")
+    a.insert("198.51.100.0/25", "a")
+    b = Bottle(prefix="0.0.0.0/0")
+    b.insert("203.0.113.0/24", "b")
+    union = a.union(b)
+    assert union.prefix == "0.0.0.0/0"
+    assert union.children() == ["198.51.100.0/25", "203.0.113.0/24"]
+    assert a.diff(b).absent[0].prefix == "198.51.100.0/25"
+
+
+def test_summarize():
+    root = Bottle(prefix="0.0.0.0/0")
+    root.insert("198.51.100.0/25", "a")
+    root.insert("198.51.100.128/25", "a")
+    assert list(root.summarize()) == [("198.51.100.0/24", "a")]
+    assert root.aggregate().children() == ["198.51.100.0/24"]
+
+
+def test_ranges():
+    root = Bottle(prefix="0.0.0.0/0")
+    root.insert("192.0.2.0/24", "a")
+    root.insert("192.0.2.0/25", "b")
+    root.insert("198.51.100.0/24", "c")
+    assert root.overlapping("192.0.2.200", "198.51.100.0") == [
+        "192.0.2.0/24",
+        "198.51.100.0/24",
+    ]
+    assert list(root.iter_range("192.0.2.0", "192.0.2.127")) == ["192.0.2.0/25"]
+    assert root.successor("192.0.2.0/25").value == "c"
+    assert root.predecessor("192.0.2.0/25").value == "a"
+
+
+def test_gaps():
+    root = Bottle(prefix="198.51.100.0/24")
+    root.insert("198.51.100.0/25")
+    root.insert("198.51.100.128/26")
+    assert root.gaps(count=True) == (["198.51.100.192/26"], 64)
+    assert list(root.iter_free(min_len=27)) == [
+        "198.51.100.192/27",
+        "198.51.100.224/27",
+    ]
+
+
+def test_apply_updates():
+    root = Bottle(prefix="0.0.0.0/0")
+    root.insert("198.51.100.0/24", "a")
+    changes = root.apply_updates(
+        announce=[("192.0.2.0/24", "b")], withdraw=["198.51.100.0/24"]
+    )
+    assert changes.added == [("192.0.2.0/24", "b")]
+    assert changes.removed == [("198.51.100.0/24", "a")]
+    assert root.children() == ["192.0.2.0/24"]
+
+
+def test_pickle():
+    root = Bottle(prefix="198.51.100.0/24")
+    root.insert("198.51.100.0/25", "a")
+    restored = pickle.loads(pickle.dumps(root))
+    assert restored.prefix == "198.51.100.0/24"
+    assert restored.children() == ["198.51.100.0/25"]
+    assert restored["198.51.100.0/25"].value == "a"
+
+
+def test_parse_cache():
+    Bottle.resize_parse_cache(4)
+    try:
+        root = Bottle(prefix="0.0.0.0/0")
+        root.insert("198.51.100.0/24")
+        for _ in range(3):
+            assert "198.51.100.0/24" in root
+        info = Bottle.parse_cache_info()
+        assert info.maxsize == 4
+        assert info.hits >= 3
+        assert info.currsize == 2
+    finally:
+        Bottle.resize_parse_cache()
+
+
+def test_prefix_conversion():
+    root = Bottle(prefix=IPv4Network("198.51.100.0/24"))
+    root.insert("198.51.100.0/25")
+    node = root["198.51.100.0/25"]
+    assert node.prefix is node.prefix
+    assert root.children() == [IPv4Network("198.51.100.0/25")]
+    assert root.children()[0] is node.prefix
+    node.prefix = "198.51.100.0/26"
+    assert node.prefix == "198.51.100.0/26"
+    root = Bottle(prefix="198.51.100.0/24", cls=int)
+    root.insert("198.51.100.0/25")
+    assert root.children() == [int(CIDR("198.51.100.0/25"))]
@@ -0,0 +1,81 @@
+import pytest
+
+from cidr_man import CIDR
+
+from cidr_bottle import Bottle, FastBottle
+from cidr_bottle.cidr_bottle_cache import MISSING, QueryCache
+
+
+def test_lru_eviction():
+    cache = QueryCache(2, "lru")
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.info() == (3, 1, 2, 2)
+
+
+def test_clock_eviction():
+    cache = QueryCache(2, "clock")
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    # "a" was referenced, so it gets a second chance
+    cache.put("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    cache.put("c", 4)
+    assert cache.get("c") == 4
+    assert len(cache) == 2
+
+
+def test_generation():
+    cache = QueryCache(4)
+    cache.put("a", 1)
+    cache.generation += 1
+    assert len(cache) == 0
+    assert cache.get("a") is MISSING
+    with pytest.raises(ValueError):
+        QueryCache(4, "random")
+
+
+@pytest.mark.parametrize("policy", ["lru", "clock"])
+@pytest.mark.parametrize("compressed", [False, True])
+def test_cached_get(policy, compressed):
+    root = FastBottle(compressed=compressed)
+    root.enable_cache(16, policy)
+    root.insert(CIDR("192.0.2.0/24"), "a")
+    query = CIDR("192.0.2.1/32")
+    assert root.get(query, covering=True).value == "a"
+    assert root.get(query, covering=True).value == "a"
+    assert root.cache.info().hits == 1
+    with pytest.raises(KeyError):
+        root.get(query, exact=True)
+    with pytest.raises(KeyError):
+        root.get(query, exact=True)
+    root.insert(CIDR("192.0.2.0/25"), "b")
+    assert root.get(query, covering=True).value == "b"
+    assert root.contains_int(4, 0xC0000200, 25, exact=True)
+    # changes made through any node reach the cache on the root
+    root.get(CIDR("192.0.2.0/24")).delete(CIDR("192.0.2.0/25"))
+    assert root.get(query, covering=True).value == "a"
+    root._bulk_insert([(CIDR("192.0.2.0/26"), "c")])
+    assert root.get(query, covering=True).value == "c"
+    root.disable_cache()
+    assert root.cache is None
+    assert root.get(query, covering=True).value == "c"
+    # nodes without a cache or batch lookup copy hold no state at all
+    assert root._root_state is None
+
+
+def test_cached_bottle():
+    root = Bottle(prefix="0.0.0.0/0")
+    root.enable_cache()
+    root.insert("198.51.100.0/24")
+    assert "198.51.100.7" in root
+    assert "198.51.100.7" in root
+    assert root.cache.info().hits == 1
@@ -0,0 +1,71 @@
+import pytest
+
+from cidr_man import CIDR
+
+from cidr_bottle import Bottle, DualBottle, FastBottle
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_dispatch(compressed):
+    root = DualBottle(compressed=compressed)
+    root.insert("192.0.2.0/24", 4)
+    root[CIDR("2001:db8::/32")] = 6
+    assert root.get("192.0.2.1").value == 4
+    assert root["2001:db8::1"].value == 6
+    assert root.v4.compressed == root.v6.compressed == compressed
+    assert "2001:db8::/48" in root
+    assert not root.contains("2001:db8::/48", exact=True)
+    assert [node.value for node in root.children()] == [4, 6]
+    assert [node.value for node in root.iter_children()] == [4, 6]
+    assert len(root) == 2
+    del root["192.0.2.0/24"]
+    assert root.get("192.0.2.1", covering=True) is None
+    assert len(root) == 1
+    with pytest.raises(ValueError):
+        DualBottle(v4=FastBottle(prefix=CIDR("::/0")))
+
+
+def test_insert_many():
+    root = DualBottle(v4=Bottle(prefix="0.0.0.0/0"), v6=Bottle(prefix="::/0"))
+    root.insert_many(
+        [
+            ("2001:db8:1::/48", "b"),
+            ("192.0.2.128/25", "a"),
+            ("2001:db8::/48", "b"),
+            ("192.0.2.0/25", "a"),
+        ],
+        aggregate=True,
+    )
+    assert root.v4.children() == ["192.0.2.0/24", "192.0.2.0/25", "192.0.2.128/25"]
+    assert root.v6.children() == ["2001:db8::/47", "2001:db8::/48", "2001:db8:1::/48"]
+    root.insert("198.51.100.0/25", aggregate=True)
+    assert len(root) == 7
+
+
+def test_get_many():
+    pytest.importorskip("numpy")
+    root = DualBottle()
+    root.insert_many(
+        [
+            (CIDR("192.0.2.0/24"), 1),
+            (CIDR("192.0.2.128/25"), 2),
+            (CIDR("2001:db8::/32"), 3),
+        ]
+    )
+    queries = [
+        CIDR("2001:db8::1"),
+        CIDR("192.0.2.200"),
+        "198.51.100.1",
+        CIDR("192.0.2.0/24"),
+        CIDR("2001::/16"),
+    ]
+    for covering in (False, True):
+        assert root.get_many(queries, covering=covering) == [
+            root.get(query, covering=covering) for query in queries
+        ]
+    for exact in (False, True):
+        assert root.contains_many(queries, exact=exact) == [
+            root.contains(query, exact) for query in queries
+        ]
+    assert root.contains_many(queries, exact=True)[3]
+    assert root.get_many([]) == []
@@ -1,3 +1,6 @@
+import copy
+import pickle
+
 import pytest
 
 from cidr_man import CIDR
@@ -136,8 +139,9 @@ def test_delete():
     assert not root[CIDR("128.128.0.0/9")].passing
     del root[CIDR("128.128.0.0/9")]
     assert root[CIDR("128.0.0.0/1")].prefix == CIDR("128.0.0.0/1")
-    assert root[CIDR("128.128.0.0/9")].prefix == CIDR("128.0.0.0/8")
-    assert root[CIDR("128.128.0.0/9")].passing
+    # the passing nodes leading to the deleted /9 are pruned along with it
+    assert root[CIDR("128.128.0.0/9")].prefix == CIDR("128.0.0.0/1")
+    assert root.right.left is None and root.right.right is None
 
 
 def test_children():
@@ -154,7 +158,9 @@ def test_children():
     assert root._changed is True
     root.children()
     assert root._changed is False
-    result = [node.prefix.compressed for node in root.get(CIDR("14.99.56.0/21")).children()]
+    result = [
+        node.prefix.compressed for node in root.get(CIDR("14.99.56.0/21")).children()
+    ]
     assert set(result) == {"14.99.56.0/21", "14.99.58.0/24"}
 
 
@@ -180,3 +186,585 @@ def test_aggregate():
     assert root.get(CIDR("192.0.2.0/24")).value == "b"
     assert root.get(CIDR("192.0.3.0/24")).value == "c"
     assert root.get(CIDR("192.0.2.0/23")).value == "b"
+
+
+def test_compressed_insert():
+    root = FastBottle(prefix=CIDR("::/0"), compressed=True)
+    root.insert(CIDR("2001:db8::/48"), 1)
+    assert root.right is None
+    assert root.left.prefix == CIDR("2001:db8::/48")
+    assert root.left.left is None and root.left.right is None
+    root.insert(CIDR("2001:db8:1::/48"), 2)
+    fork = root.left
+    assert fork.prefix == CIDR("2001:db8::/47")
+    assert fork.passing
+    assert fork.left.prefix == CIDR("2001:db8::/48")
+    assert fork.right.prefix == CIDR("2001:db8:1::/48")
+    root.insert(CIDR("2001:db8::/32"), 3)
+    assert root.left.prefix == CIDR("2001:db8::/32")
+    assert root.left.left is fork
+    assert fork.parent is root.left
+
+
+def test_compressed_matches_uncompressed():
+    root = FastBottle()
+    compressed = FastBottle(compressed=True)
+    with open("tests/data/children_test_data") as f:
+        for line in f:
+            root.insert(CIDR(line.strip()), line.strip())
+            compressed.insert(CIDR(line.strip()), line.strip())
+    assert {node.prefix.compressed for node in root.children()} == {
+        node.prefix.compressed for node in compressed.children()
+    }
+    for query in ["14.99.58.7/32", "1.0.5.0/24", "1.0.131.0/24", "192.0.2.0/24"]:
+        expected = root.get(CIDR(query), covering=True)
+        found = compressed.get(CIDR(query), covering=True)
+        if expected is None:
+            assert found is None
+        else:
+            assert found.prefix == expected.prefix
+            assert found.value == expected.value
+    node = compressed.get(CIDR("14.99.56.0/21"))
+    assert {child.prefix.compressed for child in node.children()} == {
+        "14.99.56.0/21",
+        "14.99.58.0/24",
+    }
+
+
+def test_compressed_covering():
+    root = FastBottle(compressed=True)
+    root.insert(CIDR("192.0.2.128/26"))
+    assert root.get(CIDR("192.0.2.0/26"), covering=True) is None
+    assert root.get(CIDR("192.0.2.129/32")).prefix == CIDR("192.0.2.128/26")
+    assert root.get(CIDR("192.0.2.129/32"), covering=True).prefix == CIDR(
+        "192.0.2.128/26"
+    )
+    with pytest.raises(KeyError):
+        root.get(CIDR("192.0.2.0/24"), exact=True)
+
+
+def test_compressed_aggregate():
+    root = FastBottle(compressed=True)
+    root.insert(CIDR("192.0.3.0/24"), value="c", aggregate=True)
+    root.insert(CIDR("192.0.2.128/25"), value="a")
+    root.insert(CIDR("192.0.2.0/25"), value="b", aggregate=True)
+    assert not root.get(CIDR("192.0.2.0/23")).passing
+    assert root.get(CIDR("192.0.2.0/24")).value == "b"
+    assert root.get(CIDR("192.0.2.0/23")).value == "b"
+
+
+def test_compressed_delete():
+    root = FastBottle(compressed=True)
+    root.insert(CIDR("128.0.0.0/1"), 1)
+    root.insert(CIDR("128.128.0.0/9"), 1)
+    del root[CIDR("128.128.0.0/9")]
+    assert root[CIDR("128.128.0.0/9")].prefix == CIDR("128.0.0.0/1")
+    assert not root.contains(CIDR("128.128.0.0/9"), exact=True)
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_delete_intermediate(compressed):
+    root = FastBottle(compressed=compressed)
+    root.insert(CIDR("192.0.2.0/24"), 1)
+    root.insert(CIDR("192.0.2.0/26"), 2)
+    root.insert(CIDR("192.0.2.192/26"), 3)
+    nodes = len(list(root.walk()))
+    root.delete(CIDR("192.0.2.0/24"))
+    assert [node.value for node in root.children()] == [2, 3]
+    assert root.get(CIDR("192.0.2.0/24")).passing
+    assert len(list(root.walk())) == nodes
+    with pytest.raises(KeyError):
+        root.delete(CIDR("192.0.2.0/24"))
+    root.delete(CIDR("192.0.2.192/26"))
+    root.delete(CIDR("192.0.2.0/26"))
+    # nothing is left below the root
+    assert list(root.walk()) == [root]
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_apply_updates(compressed):
+    root = FastBottle(compressed=compressed)
+    root.insert(CIDR("192.0.2.0/24"), "a")
+    root.insert(CIDR("192.0.2.0/25"), "a")
+    root.insert(CIDR("198.51.100.0/24"), "a")
+    changes = root.apply_updates(
+        announce=[
+            (CIDR("203.0.113.0/24"), "b"),
+            (CIDR("192.0.2.0/25"), "b"),
+            (CIDR("198.51.100.0/24"), "a"),
+        ],
+        withdraw=[
+            CIDR("198.51.100.0/24"),
+            CIDR("192.0.2.0/24"),
+            CIDR("203.0.113.128/25"),
+        ],
+    )
+    assert changes.added == [(CIDR("203.0.113.0/24"), "b")]
+    assert changes.removed == [(CIDR("192.0.2.0/24"), "a")]
+    assert changes.changed == [(CIDR("192.0.2.0/25"), "a", "b")]
+    assert [(node.prefix, node.value) for node in root.children()] == [
+        (CIDR("192.0.2.0/25"), "b"),
+        (CIDR("198.51.100.0/24"), "a"),
+        (CIDR("203.0.113.0/24"), "b"),
+    ]
+    assert len(root) == 3
+    assert root.get(CIDR("192.0.2.128/25"), covering=True) is None
+    changes = root.apply_updates(withdraw=[CIDR("203.0.113.0/24")])
+    assert changes.removed == [(CIDR("203.0.113.0/24"), "b")]
+    assert root.get(CIDR("203.0.113.0/24"), covering=True) is None
+    # nothing is applied when any prefix of the batch is invalid
+    with pytest.raises(ValueError):
+        root.apply_updates(
+            announce=[(CIDR("203.0.113.0/24"), "c"), (CIDR("2001:db8::/32"), "c")]
+        )
+    assert len(root) == 2
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_apply_updates_duplicates(compressed):
+    root = FastBottle(compressed=compressed)
+    root.enable_cache()
+    root.apply_updates(
+        announce=[(CIDR("10.1.0.0/16"), 1), (CIDR("10.2.0.0/16"), 2)],
+    )
+    root.children()
+    generation = root.cache.generation
+    # re-announcing held prefixes with their values, or withdrawing unknown ones, changes nothing
+    changes = root.apply_updates(
+        announce=[(CIDR("10.1.0.0/16"), 1)], withdraw=[CIDR("10.3.0.0/16")]
+    )
+    assert changes == ([], [], [])
+    assert root.cache.generation == generation
+    assert not root._changed
+    changes = root.apply_updates(announce=[(CIDR("10.1.128.0/17"), 3)])
+    assert changes.added == [(CIDR("10.1.128.0/17"), 3)]
+    assert root.cache.generation == generation + 1
+    assert root._changed
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_compact(compressed):
+    root = FastBottle(compressed=compressed)
+    root.insert(CIDR("192.0.2.0/24"), 1)
+    root.insert(CIDR("198.51.100.0/24"), 2)
+    # passing nodes left behind by lookups that create their path
+    root._find(CIDR("203.0.113.0/24"), True)
+    root._find(CIDR("192.0.2.0/25"), True)
+    nodes = list(root.walk())
+    removed = root.compact()
+    assert removed == len(nodes) - len(list(root.walk())) > 0
+    assert [node.value for node in root.children()] == [1, 2]
+    assert root.get(CIDR("203.0.113.0/24"), covering=True) is None
+    assert root.compact() == 0
+
+
+def test_slots():
+    root = FastBottle()
+    root.insert(CIDR("192.0.2.0/24"), 1)
+    node = root.get(CIDR("192.0.2.0/24"))
+    assert not hasattr(node, "__dict__")
+    assert isinstance(node.prefix, CIDR)
+    assert node.prefix == CIDR("192.0.2.0/24")
+    node.prefix = CIDR("198.51.100.0/24")
+    assert str(node) == "198.51.100.0/24"
+
+
+def test_detached_root():
+    root = FastBottle(prefix=CIDR("10.0.0.0/8"))
+    root.insert(CIDR("10.1.0.0/16"), 1)
+    assert root.get(CIDR("10.1.2.0/24")).prefix == CIDR("10.1.0.0/16")
+    assert root.get(CIDR("10.2.0.0/16")).prefix == CIDR("10.0.0.0/14")
+    assert root.get(CIDR("11.0.0.0/16")) is None
+    assert not root.contains(CIDR("11.0.0.0/16"))
+    assert [node.prefix for node in root.children()] == [CIDR("10.1.0.0/16")]
+
+
+def test_get_many():
+    np = pytest.importorskip("numpy")
+    root = FastBottle()
+    root.insert(CIDR("192.0.2.0/24"), 1)
+    root.insert(CIDR("192.0.2.128/25"), 2)
+    addresses = np.array(
+        [int(CIDR(ip)) for ip in ["192.0.2.1", "192.0.2.200", "198.51.100.1"]],
+        dtype=np.uint32,
+    )
+    result = root.get_many(addresses, covering=True)
+    assert [result.nodes[i].value if i >= 0 else None for i in result.index] == [
+        1,
+        2,
+        None,
+    ]
+    assert list(result.prefix_len) == [24, 25, 0]
+    assert int(result.ip[1]) == CIDR("192.0.2.128/25").ip
+    assert not result.exact.any()
+    result = root.get_many(addresses, prefix_lens=[24, 25, 24])
+    assert list(result.exact) == [True, True, False]
+    assert result.nodes[result.index[2]].passing
+    assert list(root.contains_many(addresses, [24, 25, 24], exact=True)) == [
+        True,
+        True,
+        False,
+    ]
+
+
+def test_get_many_ipv6():
+    np = pytest.importorskip("numpy")
+    for compressed in (False, True):
+        root = FastBottle(prefix=CIDR("::/0"), compressed=compressed)
+        root.insert(CIDR("2001:db8::/32"), 1)
+        root.insert(CIDR("2001:db8:0:1::/64"), 2)
+        queries = [CIDR("2001:db8:0:1::1"), CIDR("2001:db8:ffff::1"), CIDR("2001::1")]
+        high = np.array([query.ip >> 64 for query in queries], dtype=np.uint64)
+        low = np.array([query.ip & (2**64 - 1) for query in queries], dtype=np.uint64)
+        result = root.get_many((high, low), covering=True)
+        for i, query in enumerate(queries):
+            expected = root.get(query, covering=True)
+            if expected is None:
+                assert result.index[i] == -1
+            else:
+                assert result.nodes[result.index[i]] is expected
+        assert int(result.ip[0][1]) == CIDR("2001:db8::/32").ip >> 64
+        assert list(root.contains_many((high, low))) == [True, True, True]
+
+
+def test_from_sorted():
+    with open("tests/data/children_test_data") as f:
+        lines = [line.strip() for line in f]
+    for compressed in (False, True):
+        expected = FastBottle(compressed=compressed)
+        for i, line in enumerate(lines):
+            expected.insert(CIDR(line), i)
+        root = FastBottle.from_sorted(
+            ((CIDR(line), i) for i, line in enumerate(lines)), compressed=compressed
+        )
+        assert {(node.prefix, node.value) for node in root.children()} == {
+            (node.prefix, node.value) for node in expected.children()
+        }
+        assert root.get(CIDR("14.99.58.7/32"), covering=True).prefix == CIDR(
+            "14.99.58.0/24"
+        )
+
+
+def test_from_sorted_aggregate():
+    root = FastBottle.from_sorted(
+        [
+            (CIDR("192.0.3.0/24"), "c"),
+            (CIDR("192.0.2.128/25"), "a"),
+            (CIDR("192.0.2.0/25"), "b"),
+        ],
+        aggregate=True,
+    )
+    # pairs are applied in address order, so the right hand /25 triggers the promotion
+    assert not root.get(CIDR("192.0.2.0/24")).passing
+    assert root.get(CIDR("192.0.2.0/24")).value == "a"
+    assert not root.get(CIDR("192.0.2.0/23")).passing
+    assert root.get(CIDR("192.0.2.0/23")).value == "c"
+
+
+def test_from_sorted_invalid():
+    with pytest.raises(ValueError):
+        FastBottle.from_sorted([(CIDR("2001:db8::/32"), 1)])
+    with pytest.raises(ValueError):
+        FastBottle.from_sorted(
+            [(CIDR("192.0.2.0/24"), 1)], prefix=CIDR("198.51.100.0/24")
+        )
+
+
+def test_iter_children():
+    root = FastBottle()
+    with open("tests/data/children_test_data") as f:
+        for line in f:
+            root.insert(CIDR(line.strip()))
+    children = root.iter_children()
+    assert next(children).prefix == root.children()[0].prefix
+    assert list(root.iter_children()) == root.children()
+    node = root.get(CIDR("1.0.0.0/16"))
+    shallow = list(node.iter_children(max_depth=4))
+    assert shallow
+    assert all(child._prefix_len <= 20 for child in shallow)
+    assert {child.prefix for child in shallow} == {
+        child.prefix for child in node.children() if child._prefix_len <= 20
+    }
+    pruned = list(
+        node.iter_children(
+            predicate=lambda n: not CIDR("1.0.128.0/17").contains(n.prefix)
+        )
+    )
+    assert pruned
+    assert not any(CIDR("1.0.128.0/17").contains(child.prefix) for child in pruned)
+
+
+def test_walk():
+    root = FastBottle(compressed=True)
+    root.insert(CIDR("192.0.2.0/25"), 1)
+    root.insert(CIDR("192.0.2.128/25"), 2)
+    nodes = list(root.walk())
+    assert [node.prefix for node in nodes] == [
+        CIDR("0.0.0.0/0"),
+        CIDR("192.0.2.0/24"),
+        CIDR("192.0.2.0/25"),
+        CIDR("192.0.2.128/25"),
+    ]
+    assert [node.passing for node in nodes] == [True, True, False, False]
+    assert [node.prefix for node in root.walk(max_depth=24)] == [
+        CIDR("0.0.0.0/0"),
+        CIDR("192.0.2.0/24"),
+    ]
+
+
+def test_len():
+    for compressed in (False, True):
+        root = FastBottle(compressed=compressed)
+        assert len(root) == 0
+        assert root
+        root.insert(CIDR("192.0.2.0/24"))
+        root.insert(CIDR("192.0.2.0/25"))
+        root.insert(CIDR("192.0.2.0/25"), "again")
+        root.insert(CIDR("198.51.100.0/24"))
+        assert len(root) == 3
+        assert len(root.get(CIDR("192.0.2.0/24"))) == 2
+        root.insert(CIDR("192.0.2.128/25"), aggregate=True)
+        assert len(root.get(CIDR("192.0.2.0/24"))) == 3
+        root.delete(CIDR("192.0.2.128/25"))
+        assert len(root) == 3
+        root._bulk_insert(
+            [(CIDR("203.0.113.0/25"), 1), (CIDR("203.0.113.128/25"), 2)], True
+        )
+        assert len(root) == 6
+        assert len(root) == len(root.children())
+
+
+def test_children_invalidation():
+    root = FastBottle()
+    root.insert(CIDR("192.0.2.0/24"))
+    node = root.get(CIDR("192.0.2.0/24"))
+    assert node.children() == [node]
+    # inserting through the root must invalidate the cached list of the /24
+    root.insert(CIDR("192.0.2.128/25"))
+    assert [child.prefix for child in node.children()] == [
+        CIDR("192.0.2.0/24"),
+        CIDR("192.0.2.128/25"),
+    ]
+    root.delete(CIDR("192.0.2.128/25"))
+    assert node.children() == [node]
+
+
+def test_set_operations():
+    a = FastBottle()
+    b = FastBottle(compressed=True)
+    for prefix, value in [("192.0.2.0/24", "a"), ("198.51.100.0/24", "a")]:
+        a.insert(CIDR(prefix), value)
+    for prefix, value in [("192.0.2.0/24", "b"), ("203.0.113.0/24", "b")]:
+        b.insert(CIDR(prefix), value)
+
+    def prefixes(trie):
+        return [(node.prefix.compressed, node.value) for node in trie.children()]
+
+    assert prefixes(a.union(b)) == [
+        ("192.0.2.0/24", "a"),
+        ("198.51.100.0/24", "a"),
+        ("203.0.113.0/24", "b"),
+    ]
+    assert prefixes(a.intersection(b)) == [("192.0.2.0/24", "a")]
+    assert prefixes(b.intersection(a)) == [("192.0.2.0/24", "b")]
+    assert prefixes(a.difference(b)) == [("198.51.100.0/24", "a")]
+    assert prefixes(a.symmetric_difference(b)) == [
+        ("198.51.100.0/24", "a"),
+        ("203.0.113.0/24", "b"),
+    ]
+    assert type(a.union(b)) is FastBottle
+    assert not a.union(b).compressed
+    with pytest.raises(ValueError):
+        a.union(FastBottle(prefix=CIDR("::/0")))
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_summarize(compressed):
+    root = FastBottle(compressed=compressed)
+    for prefix, value in [
+        ("192.0.2.0/25", "a"),
+        ("192.0.2.128/26", "a"),
+        ("192.0.2.192/26", "a"),
+        ("192.0.3.0/24", "b"),
+        ("198.51.100.0/24", "a"),
+        ("198.51.100.0/25", "a"),
+        ("198.51.100.128/26", "b"),
+    ]:
+        root.insert(CIDR(prefix), value)
+
+    def summary(*args):
+        return [(prefix.compressed, value) for prefix, value in root.summarize(*args)]
+
+    assert summary(lambda a, b: True) == [
+        ("192.0.2.0/23", "a"),
+        ("198.51.100.0/24", "a"),
+    ]
+    assert summary() == [
+        ("192.0.2.0/24", "a"),
+        ("192.0.3.0/24", "b"),
+        ("198.51.100.0/24", "a"),
+        ("198.51.100.128/26", "b"),
+    ]
+    aggregated = root.aggregate()
+    assert [node.prefix.compressed for node in aggregated.children()] == [
+        "192.0.2.0/24",
+        "192.0.3.0/24",
+        "198.51.100.0/24",
+        "198.51.100.128/26",
+    ]
+    assert aggregated.prefix == root.prefix
+    assert aggregated.compressed == compressed
+    assert len(root) == 7
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_ranges(compressed):
+    root = FastBottle(compressed=compressed)
+    for prefix in [
+        "10.0.0.0/8",
+        "192.0.2.0/24",
+        "192.0.2.0/25",
+        "192.0.2.192/26",
+        "198.51.100.0/24",
+    ]:
+        root.insert(CIDR(prefix))
+    # a lookup path that leads to no prefix
+    root.get(CIDR("192.0.2.130/32"))
+
+    def prefixes(nodes):
+        return [node.prefix.compressed for node in nodes]
+
+    start, end = CIDR("192.0.2.100/32"), CIDR("198.51.100.0/25")
+    assert prefixes(root.overlapping(start, end)) == [
+        "192.0.2.0/24",
+        "192.0.2.0/25",
+        "192.0.2.192/26",
+        "198.51.100.0/24",
+    ]
+    assert prefixes(root.iter_range(start, end)) == ["192.0.2.192/26"]
+    assert prefixes(root.iter_range(CIDR("192.0.2.0/24"), CIDR("192.0.2.0/24"))) == [
+        "192.0.2.0/24",
+        "192.0.2.0/25",
+        "192.0.2.192/26",
+    ]
+    assert root.overlapping(CIDR("203.0.113.0/24"), CIDR("203.0.113.0/24")) == []
+    assert root.successor(CIDR("192.0.2.0/24")).prefix == "192.0.2.0/25"
+    assert root.successor(CIDR("192.0.2.128/32")).prefix == "192.0.2.192/26"
+    assert root.successor(CIDR("198.51.100.0/24")) is None
+    assert root.predecessor(CIDR("192.0.2.192/26")).prefix == "192.0.2.0/25"
+    assert root.predecessor(CIDR("192.0.2.0/24")).prefix == "10.0.0.0/8"
+    assert root.predecessor(CIDR("10.0.0.0/8")) is None
+    with pytest.raises(ValueError):
+        root.successor(CIDR("2001:db8::/32"))
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_gaps(compressed):
+    root = FastBottle(compressed=compressed)
+    root.insert(CIDR("198.51.100.0/24"))
+    allocation = root.get(CIDR("198.51.100.0/24"), exact=True)
+    assert allocation.gaps() == [CIDR("198.51.100.0/24")]
+    root.insert(CIDR("198.51.100.0/26"))
+    root.insert(CIDR("198.51.100.64/28"))
+    root.insert(CIDR("198.51.100.192/27"))
+    # neither lookup paths nor a deleted prefix cover anything
+    root.get(CIDR("198.51.100.130/32"))
+    root.insert(CIDR("198.51.100.224/27"))
+    root.delete(CIDR("198.51.100.224/27"))
+    gaps, addresses = allocation.gaps(count=True)
+    assert [prefix.compressed for prefix in gaps] == [
+        "198.51.100.80/28",
+        "198.51.100.96/27",
+        "198.51.100.128/26",
+        "198.51.100.224/27",
+    ]
+    assert addresses == 256 - 64 - 16 - 32
+    assert [
+        prefix.compressed for prefix in allocation.iter_free(min_len=27, max_len=27)
+    ] == [
+        "198.51.100.96/27",
+        "198.51.100.128/27",
+        "198.51.100.160/27",
+        "198.51.100.224/27",
+    ]
+    # the /24 itself covers its gaps
+    assert len(root.gaps()) == 24
+    with pytest.raises(ValueError):
+        list(allocation.iter_free(min_len=28, max_len=27))
+
+
+def test_diff():
+    allocations = FastBottle()
+    announcements = FastBottle()
+    for prefix in ["192.0.2.0/24", "198.51.100.0/24", "203.0.113.0/25", "10.0.0.0/8"]:
+        allocations.insert(CIDR(prefix))
+    for prefix in ["192.0.2.0/24", "198.51.100.128/25", "203.0.113.0/24"]:
+        announcements.insert(CIDR(prefix))
+    result = allocations.diff(announcements)
+    assert [(node.prefix, other.prefix) for node, other in result.exact] == [
+        (CIDR("192.0.2.0/24"), CIDR("192.0.2.0/24"))
+    ]
+    assert [node.prefix for node in result.more_specific] == [CIDR("198.51.100.0/24")]
+    assert [(node.prefix, other.prefix) for node, other in result.covering] == [
+        (CIDR("203.0.113.0/25"), CIDR("203.0.113.0/24"))
+    ]
+    assert [node.prefix for node in result.absent] == [CIDR("10.0.0.0/8")]
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_pickle(compressed):
+    root = FastBottle(prefix=CIDR("::/0"), compressed=compressed)
+    for i in range(64):
+        root.insert(CIDR(f"2001:db8:{i:x}::/48"), {"id": i})
+    root.insert(CIDR("2001:db8::/32"), "covering")
+    for restored in (pickle.loads(pickle.dumps(root)), copy.deepcopy(root)):
+        assert type(restored) is FastBottle
+        assert restored.compressed is compressed
+        assert [
+            (node.prefix, node.passing, node.value) for node in restored.walk()
+        ] == [(node.prefix, node.passing, node.value) for node in root.walk()]
+        assert len(restored) == len(root) == 65
+        node = restored.get(CIDR("2001:db8:3f::/48"), exact=True)
+        assert node.value == {"id": 63}
+        assert node.value is not root.get(CIDR("2001:db8:3f::/48")).value
+        assert (
+            restored.get(CIDR("2001:db8:ffff::/48"), covering=True).value == "covering"
+        )
+    # a sub-trie is copied on its own
+    subtree = pickle.loads(pickle.dumps(root.get(CIDR("2001:db8::/32"))))
+    assert subtree.parent is None
+    assert len(subtree) == 65
+
+
+def test_int_api():
+    root = FastBottle()
+    root.insert_int(4, 0xC0000200, 24, "a")
+    root.insert_int(4, 0xC0000280, 25, "b")
+    assert root.get(CIDR("192.0.2.0/24"), exact=True).value == "a"
+    assert root.get_int(4, 0xC0000201, 32, covering=True).value == "a"
+    assert root.get_int(4, 0xC00002FF, 32, covering=True).value == "b"
+    # host bits are ignored, as with CIDR
+    assert root.get_int(4, 0xC0000201, 24, exact=True).value == "a"
+    assert root.contains_int(4, 0xC0000280, 25, exact=True)
+    assert not root.contains_int(4, 0xC0000300, 24, exact=True)
+    with pytest.raises(KeyError):
+        root.get_int(4, 0xC0000300, 24, exact=True)
+    with pytest.raises(ValueError):
+        root.get_int(6, 0, 0)
+    with pytest.raises(ValueError):
+        root.insert_int(4, 0, 33)
+    with pytest.raises(ValueError):
+        root.insert_int(4, 1 << 32, 32)
+    root6 = FastBottle(prefix=CIDR("::/0"), compressed=True)
+    root6.insert_int(6, 0x20010DB8 << 96, 32, "v6")
+    assert root6.get_int(6, 0x20010DB8 << 96 | 1, 128, covering=True).value == "v6"
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_insert_outside_detached_root(compressed):
+    root = FastBottle(prefix=CIDR("10.0.0.0/8"), compressed=compressed)
+    with pytest.raises(ValueError):
+        root.insert_int(4, 11 << 24, 16, 1)
+    with pytest.raises(ValueError):
+        root.insert(CIDR("11.0.0.0/16"), 1)
+    assert len(root) == 0
@@ -0,0 +1,146 @@
+import random
+import tracemalloc
+
+import pytest
+
+from cidr_man import CIDR
+
+from cidr_bottle import Bottle, FastBottle, FrozenBottle
+
+
+def load(root):
+    with open("tests/data/children_test_data") as f:
+        for i, line in enumerate(f):
+            root.insert(CIDR(line.strip()), i)
+    return root
+
+
+def test_freeze():
+    root = load(FastBottle())
+    frozen = root.freeze()
+    assert isinstance(frozen, FrozenBottle)
+    assert len(frozen) == len(root.children())
+    for query in [
+        "14.99.58.7/32",
+        "1.0.5.0/24",
+        "1.0.131.0/24",
+        "192.0.2.0/24",
+        "1.0.0.0/8",
+    ]:
+        expected = root.get(CIDR(query), covering=True)
+        found = frozen.get(CIDR(query))
+        if expected is None:
+            assert found is None
+            assert not frozen.contains(CIDR(query))
+        else:
+            assert found.prefix == expected.prefix
+            assert found.value == expected.value
+            assert CIDR(query) in frozen
+
+
+def test_freeze_exact():
+    root = FastBottle()
+    root.insert(CIDR("192.0.2.0/24"), 1)
+    root.insert(CIDR("192.0.2.128/26"), 2)
+    frozen = root.freeze()
+    assert frozen.get(CIDR("192.0.2.128/26"), exact=True).value == 2
+    assert frozen.get(CIDR("192.0.2.128/25")).value == 1
+    with pytest.raises(KeyError):
+        frozen.get(CIDR("192.0.2.128/25"), exact=True)
+    assert not frozen.contains(CIDR("192.0.2.128/25"), exact=True)
+    assert frozen.get(CIDR("192.0.0.0/16")) is None
+
+
+def test_freeze_is_immutable():
+    root = FastBottle()
+    root.insert(CIDR("192.0.2.0/24"), 1)
+    frozen = root.freeze()
+    root.insert(CIDR("192.0.2.0/25"), 2)
+    root.get(CIDR("192.0.2.0/24")).value = 3
+    assert frozen.get(CIDR("192.0.2.1/32")).value == 1
+
+
+def test_freeze_detached_root():
+    root = FastBottle(prefix=CIDR("2001:db8::/32"), compressed=True)
+    root.insert(CIDR("2001:db8::/32"), "root")
+    root.insert(CIDR("2001:db8:1::/48"), 1)
+    frozen = root.freeze()
+    assert frozen.get(CIDR("2001:db8:1::1")).value == 1
+    assert frozen.get(CIDR("2001:db8:2::1")).value == "root"
+    assert frozen.get(CIDR("2001:db8::/16")) is None
+    assert frozen.get(CIDR("2001:db9::1")) is None
+
+
+def test_freeze_bottle():
+    root = Bottle(prefix="0.0.0.0/0")
+    root.insert("198.51.100.0/24", 1)
+    frozen = root.freeze()
+    assert frozen.get("198.51.100.7").prefix == "198.51.100.0/24"
+
+
+def test_freeze_strides():
+    root = load(FastBottle())
+    frozen = root.freeze(strides=(8, 6, 6, 6, 6))
+    assert frozen.get(CIDR("14.99.58.7/32")).prefix == CIDR("14.99.58.0/24")
+    with pytest.raises(ValueError):
+        root.freeze(strides=(16, 8))
+    with pytest.raises(ValueError):
+        root.freeze(strides=(16, 8, 8))
+
+
+def test_freeze_v6_memory():
+    rng = random.Random(0)
+    root = FastBottle(prefix=CIDR("::/0"), compressed=True)
+    tracemalloc.start()
+    try:
+        for i in range(2000):
+            prefix_len = rng.randint(48, 64)
+            ip = 0x20010DB8 << 96 | rng.getrandbits(prefix_len - 32) << 128 - prefix_len
+            root.insert(CIDR(ip, 6, prefix_len), i)
+        trie = tracemalloc.get_traced_memory()[0]
+        frozen = root.freeze()
+        size = tracemalloc.get_traced_memory()[0] - trie
+    finally:
+        tracemalloc.stop()
+    for node in root.children():
+        assert frozen.get(node.prefix).value == node.value
+    # the frozen table stays close to the size of the compressed trie
+    assert size < 2 * trie
+
+
+def test_frozen_get_many():
+    np = pytest.importorskip("numpy")
+    root = load(FastBottle())
+    frozen = root.freeze()
+    queries = [CIDR(q) for q in ["14.99.58.7", "1.0.5.1", "192.0.2.1", "1.0.131.0"]]
+    addresses = np.array([query.ip for query in queries], dtype=np.uint32)
+    result = frozen.get_many(addresses)
+    expected = root.get_many(addresses, covering=True)
+    assert list(result.prefix_len) == list(expected.prefix_len)
+    assert list(result.ip) == list(expected.ip)
+    for i, query in enumerate(queries):
+        node = root.get(query, covering=True)
+        if node is None:
+            assert result.index[i] == -1
+        else:
+            assert result.nodes[result.index[i]].value == node.value
+    assert list(frozen.contains_many(addresses, [24, 24, 24, 24], exact=True)) == [
+        frozen.contains(CIDR(query.ip, query.version, 24), exact=True)
+        for query in queries
+    ]
+
+
+@pytest.mark.parametrize("prefix", ["0.0.0.0/0", "10.0.0.0/8", "::/0"])
+def test_frozen_get_many_empty(prefix):
+    np = pytest.importorskip("numpy")
+    frozen = FastBottle(prefix=CIDR(prefix)).freeze()
+    if CIDR(prefix).version == 4:
+        addresses = np.array([1, 10 << 24], dtype=np.uint32)
+    else:
+        addresses = (np.array([1, 2], dtype=np.uint64), np.zeros(2, dtype=np.uint64))
+    result = frozen.get_many(addresses)
+    assert list(result.index) == [-1, -1]
+    assert list(result.prefix_len) == [0, 0]
+    assert not result.exact.any()
+    assert not frozen.contains_many(addresses).any()
+    assert frozen.get(CIDR(prefix)) is None
@@ -0,0 +1,121 @@
+import pytest
+
+from cidr_man import CIDR
+
+from cidr_bottle import Bottle, FastBottle, Journal, Op, PersistentBottle
+
+
+def _content(root):
+    return [(node.prefix, node.value) for node in root.walk() if not node.passing]
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_journal(compressed):
+    root = FastBottle(compressed=compressed)
+    journal = root.enable_journal()
+    root.enable_cache()
+    root.insert(CIDR("192.0.2.0/25"), "a", aggregate=True)
+    root.insert(CIDR("192.0.2.128/25"), "b", aggregate=True)
+    root.delete(CIDR("192.0.2.0/25"))
+    with pytest.raises(KeyError):
+        root.delete(CIDR("198.51.100.0/24"))
+    root.apply_updates(
+        announce=[(CIDR("198.51.100.0/24"), "c"), (CIDR("192.0.2.128/25"), "b")],
+        withdraw=[CIDR("203.0.113.0/24")],
+    )
+    assert journal.seq == 5
+    assert [
+        (entry.seq, entry.op, str(entry.prefix), entry.value) for entry in journal
+    ] == [
+        (1, Op.SET, "192.0.2.0/25", "a"),
+        (2, Op.SET, "192.0.2.128/25", "b"),
+        (3, Op.PROMOTE, "192.0.2.0/24", "b"),
+        (4, Op.DELETE, "192.0.2.0/25", None),
+        (5, Op.SET, "198.51.100.0/24", "c"),
+    ]
+    assert [entry.seq for entry in root.changes_since(3)] == [4, 5]
+    assert root.changes_since(5) == []
+    # the journal and the cache share the root's state, and outlive each other
+    root.disable_cache()
+    assert root.journal is journal
+    assert root.disable_journal() is journal
+    assert root._root_state is None
+    root.insert(CIDR("203.0.113.0/24"))
+    assert journal.seq == 5
+    with pytest.raises(ValueError):
+        root.changes_since(0)
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_replay(compressed):
+    source = Bottle(prefix="0.0.0.0/0", compressed=compressed)
+    source.enable_journal()
+    replica = Bottle(prefix="0.0.0.0/0", compressed=compressed)
+    source.insert("192.0.2.0/25", "a")
+    source.insert("192.0.2.128/25", "b", aggregate=True)
+    source.insert("198.51.100.0/24", "c")
+    changes = replica.replay(source.journal)
+    assert changes.added == [
+        ("192.0.2.0/24", "b"),
+        ("192.0.2.0/25", "a"),
+        ("192.0.2.128/25", "b"),
+        ("198.51.100.0/24", "c"),
+    ]
+    seq = source.journal.seq
+    source.delete("198.51.100.0/24")
+    source.insert("198.51.100.0/24", "d")
+    source.delete("192.0.2.0/25")
+    persistent = PersistentBottle(FastBottle(compressed=compressed))
+    persistent.replay(source.journal)
+    changes = replica.replay(source.changes_since(seq))
+    assert changes.removed == [("192.0.2.0/25", "a")]
+    assert changes.changed == [("198.51.100.0/24", "c", "d")]
+    assert _content(replica) == _content(source) == _content(persistent.snapshot())
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_journal_subnode(compressed):
+    source = FastBottle(compressed=compressed)
+    source.enable_journal()
+    source.insert(CIDR("192.0.2.0/24"), "a")
+    subnode = source.get(CIDR("192.0.2.0/24"))
+    subnode.insert(CIDR("192.0.2.0/26"), "b")
+    subnode.insert(CIDR("192.0.2.64/26"), "c", aggregate=True)
+    subnode.delete(CIDR("192.0.2.0/26"))
+    subnode.apply_updates(announce=[(CIDR("192.0.2.128/25"), "d")])
+    subnode._bulk_insert([(CIDR("192.0.2.192/26"), "e")])
+    assert [entry.op for entry in source.journal] == [
+        Op.SET,
+        Op.SET,
+        Op.SET,
+        Op.PROMOTE,
+        Op.DELETE,
+        Op.SET,
+        Op.SET,
+    ]
+    replica = FastBottle(compressed=compressed)
+    replica.replay(source.journal)
+    assert _content(replica) == _content(source)
+
+
+@pytest.mark.parametrize("bits, version", [(32, 4), (128, 6)])
+def test_encoding(bits, version, tmp_path):
+    subnets = [CIDR(i << bits - 4, version, 4) for i in range(16)]
+    root = FastBottle(prefix=CIDR(0, version, 0))
+    journal = root.enable_journal()
+    for i, subnet in enumerate(subnets):
+        root.insert(subnet, {"origin": i} if i % 2 else None)
+    root.delete(subnets[0])
+    journal.truncate(3)
+    assert journal.start == 3
+    with pytest.raises(ValueError):
+        journal.dumps(2)
+    path = str(tmp_path / "journal.bin")
+    journal.dump(path)
+    loaded = Journal.load(path)
+    assert (loaded.start, loaded.seq) == (journal.start, journal.seq)
+    assert list(loaded) == list(journal)
+    tail = Journal.loads(journal.dumps(10))
+    assert list(tail) == journal.changes_since(10)
+    with pytest.raises(ValueError):
+        Journal.loads(b"XXXX" + journal.dumps()[4:])
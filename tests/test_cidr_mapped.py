@@ -0,0 +1,75 @@
+import pytest
+
+from cidr_man import CIDR
+
+from cidr_bottle import Bottle, FastBottle, MappedBottle
+
+
+def load(root):
+    with open("tests/data/children_test_data") as f:
+        for i, line in enumerate(f):
+            root.insert(CIDR(line.strip()), {"line": i})
+    return root
+
+
+def test_dump_load_mmap(tmp_path):
+    root = load(FastBottle())
+    path = str(tmp_path / "rib.bin")
+    root.dump(path)
+    with FastBottle.load(path) as mapped:
+        assert isinstance(mapped, MappedBottle)
+        assert mapped.prefix == CIDR("0.0.0.0/0")
+        for query in ["14.99.58.7/32", "1.0.5.0/24", "192.0.2.0/24"]:
+            for covering in (False, True):
+                expected = root.get(CIDR(query), covering=covering)
+                found = mapped.get(CIDR(query), covering=covering)
+                if expected is None:
+                    assert found is None
+                else:
+                    assert found.prefix == expected.prefix
+                    assert found.value == expected.value
+                    assert found.passing == expected.passing
+        assert [(node.prefix, node.value) for node in mapped.children()] == [
+            (node.prefix, node.value) for node in root.children()
+        ]
+        node = mapped.get(CIDR("14.99.56.0/21"))
+        assert {child.prefix.compressed for child in node.children()} == {
+            "14.99.56.0/21",
+            "14.99.58.0/24",
+        }
+        assert node.parent.prefix == CIDR("14.99.48.0/20")
+        assert node.left.parent == node
+        assert mapped.contains(CIDR("14.99.58.0/24"), exact=True)
+        assert not mapped.contains(CIDR("14.99.59.0/24"), exact=True)
+
+
+def test_load_rebuild(tmp_path):
+    root = FastBottle(prefix=CIDR("2001:db8::/32"), compressed=True)
+    root.insert(CIDR("2001:db8:1::/48"), "a")
+    root.insert(CIDR("2001:db8:2::/48"), "b")
+    path = str(tmp_path / "rib.bin")
+    root.dump(path)
+    rebuilt = FastBottle.load(path, mmap=False)
+    assert isinstance(rebuilt, FastBottle)
+    assert rebuilt.compressed
+    assert rebuilt.prefix == CIDR("2001:db8::/32")
+    assert rebuilt.get(CIDR("2001:db8:2::1")).value == "b"
+    assert rebuilt.left.parent is rebuilt
+    rebuilt.insert(CIDR("2001:db8:3::/48"), "c")
+    assert len(rebuilt.children()) == 3
+
+
+def test_loads():
+    root = Bottle(prefix="0.0.0.0/0")
+    root.insert("198.51.100.0/24", 1)
+    data = root.dumps()
+    view = MappedBottle(data)
+    assert view.get(CIDR("198.51.100.1/32")).value == 1
+    rebuilt = Bottle.loads(data)
+    assert isinstance(rebuilt, Bottle)
+    assert rebuilt.get("198.51.100.1/32").value == 1
+
+
+def test_load_invalid():
+    with pytest.raises(ValueError):
+        MappedBottle(b"XXXX" + bytes(32))
@@ -0,0 +1,59 @@
+import pytest
+
+from cidr_man import CIDR
+
+from cidr_bottle import FastBottle, ParallelBottle
+
+
+def tables(compressed=False):
+    root = FastBottle(compressed=compressed)
+    for prefix in ["10.0.0.0/7", "10.1.0.0/16", "192.0.2.0/24", "198.51.100.0/25"]:
+        root.insert(CIDR(prefix), prefix)
+    other = FastBottle()
+    for prefix in ["10.1.0.0/16", "192.0.0.0/8", "198.51.100.0/26", "203.0.113.0/24"]:
+        other.insert(CIDR(prefix), prefix)
+    return root, other
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_parallel(compressed):
+    root, other = tables(compressed)
+    queries = [
+        CIDR(prefix)
+        for prefix in [
+            "10.1.2.3/32",
+            "11.0.0.0/8",
+            "192.0.2.0/25",
+            "198.51.100.0/24",
+            "203.0.113.0/24",
+            "0.0.0.0/0",
+        ]
+    ]
+    with ParallelBottle(root, max_workers=2) as parallel:
+        for covering in (False, True):
+            assert parallel.get_many(queries, covering=covering) == [
+                root.get(query, covering=covering) for query in queries
+            ]
+        for exact in (False, True):
+            assert parallel.contains_many(queries, exact=exact) == [
+                root.contains(query, exact) for query in queries
+            ]
+        assert parallel.children() == root.children()
+        assert (
+            parallel.children(CIDR("10.0.0.0/7"))
+            == root.get(CIDR("10.0.0.0/7")).children()
+        )
+        assert (
+            parallel.children(CIDR("192.0.2.0/24"))
+            == root.get(CIDR("192.0.2.0/24")).children()
+        )
+        assert parallel.diff(other) == root.diff(other)
+
+
+def test_parallel_invalid():
+    root, _ = tables()
+    with pytest.raises(ValueError):
+        ParallelBottle(root, shard_len=33)
+    with ParallelBottle(root, shard_len=4, max_workers=1) as parallel:
+        with pytest.raises(ValueError):
+            parallel.get_many([CIDR("::/0")])
@@ -0,0 +1,90 @@
+import pytest
+
+from cidr_man import CIDR
+
+from cidr_bottle import Bottle, FastBottle, PersistentBottle
+
+
+def _shape(root):
+    return [(node.prefix, node.passing, node.value) for node in root.walk()]
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_snapshot(compressed):
+    root = PersistentBottle(compressed=compressed)
+    root.insert(CIDR("192.0.2.0/25"), "a")
+    root.insert(CIDR("198.51.100.0/24"), "b")
+    before = root.snapshot()
+    shape = _shape(before)
+    root.insert(CIDR("192.0.2.128/25"), "c", aggregate=True)
+    root.delete(CIDR("198.51.100.0/24"))
+    after = root.snapshot()
+    assert after is not before
+    assert _shape(before) == shape
+    assert len(before) == 2
+    assert before.get(CIDR("192.0.2.128/25"), covering=True) is None
+    assert before.get(CIDR("198.51.100.7/32")).value == "b"
+    assert after.get(CIDR("192.0.2.0/24"), exact=True).value == "c"
+    assert not root.contains(CIDR("198.51.100.0/24"), exact=True)
+    assert len(root) == 3
+    assert root.snapshot() is after
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_path_copying(compressed):
+    root = PersistentBottle(compressed=compressed)
+    root.insert(CIDR("192.0.2.0/24"))
+    root.insert(CIDR("198.51.100.0/24"))
+    before = {id(node) for node in root.snapshot().walk()}
+    root.insert(CIDR("198.51.100.0/25"))
+    nodes = list(root.snapshot().walk())
+    copied = [node for node in nodes if id(node) not in before]
+    # the root, the nodes down to 198.51.100.0/24 and the new /25
+    ip = CIDR("198.51.100.0/25").ip
+    path = [
+        node
+        for node in nodes
+        if node._prefix_len <= 25
+        and node._ip >> 32 - node._prefix_len == ip >> 32 - node._prefix_len
+    ]
+    assert copied == path
+    # the shared nodes now belong to the current version
+    for node in nodes:
+        for child in (node.left, node.right):
+            assert child is None or child.parent is node
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_apply_updates(compressed):
+    root = PersistentBottle(Bottle(prefix="0.0.0.0/0", compressed=compressed))
+    mutable = Bottle(prefix="0.0.0.0/0", compressed=compressed)
+    for bottle in (root, mutable):
+        bottle.insert("192.0.2.0/24", "a")
+        bottle.insert("198.51.100.0/24", "b")
+    before = root.snapshot()
+    announce = [("203.0.113.0/24", "c"), ("192.0.2.0/24", "d")]
+    withdraw = ["198.51.100.0/24"]
+    assert root.apply_updates(announce, withdraw) == mutable.apply_updates(
+        announce, withdraw
+    )
+    assert _shape(root.snapshot()) == _shape(mutable)
+    assert root.snapshot().children() == ["192.0.2.0/24", "203.0.113.0/24"]
+    assert before.children() == ["192.0.2.0/24", "198.51.100.0/24"]
+    with pytest.raises(ValueError):
+        root.apply_updates(withdraw=["2001:db8::/32"])
+    assert _shape(root.snapshot()) == _shape(mutable)
+
+
+def test_instrumented_snapshot():
+    root = PersistentBottle()
+    root.insert(CIDR("192.0.2.0/24"), "a")
+    before = root.snapshot()
+    root.insert(CIDR("198.51.100.0/24"), "b")
+    counters = FastBottle.enable_instrumentation()
+    try:
+        # the nodes below 192.0.2.0/24's branch are shared, their parents belong to the older version
+        assert root.get(CIDR("192.0.2.7/32"), covering=True).value == "a"
+        assert before.get(CIDR("192.0.2.7/32"), covering=True).value == "a"
+        assert counters.find_visits == 2 * 25
+    finally:
+        FastBottle.disable_instrumentation()
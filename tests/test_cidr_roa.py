@@ -0,0 +1,86 @@
+import pytest
+
+from cidr_man import CIDR
+
+from cidr_bottle import RoaBottle, Roa, Validity
+
+
+def roas(compressed=False):
+    root = RoaBottle(compressed=compressed)
+    root.add(CIDR("192.0.2.0/24"), 64496)
+    root.add(CIDR("198.51.100.0/22"), 64497, 24)
+    root.add(CIDR("198.51.100.0/24"), 64498)
+    root.add(CIDR("203.0.113.0/24"), 0)
+    return root
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_validate(compressed):
+    root = roas(compressed)
+    assert root.validate(CIDR("192.0.2.0/24"), 64496) is Validity.VALID
+    assert root.validate(CIDR("192.0.2.0/24"), 64497) is Validity.INVALID
+    # longer than the max length
+    assert root.validate(CIDR("192.0.2.0/25"), 64496) is Validity.INVALID
+    # covered by two ROAs, either can validate it
+    assert root.validate(CIDR("198.51.100.0/24"), 64497) is Validity.VALID
+    assert root.validate(CIDR("198.51.100.0/24"), 64498) is Validity.VALID
+    assert root.validate(CIDR("198.51.101.0/24"), 64498) is Validity.INVALID
+    assert root.validate(CIDR("198.51.100.0/21"), 64497) is Validity.NOT_FOUND
+    assert root.validate(CIDR("203.0.113.0/24"), 0) is Validity.INVALID
+    assert root.validate(CIDR("203.0.113.0/24"), None) is Validity.INVALID
+    assert root.validate("10.0.0.0/8", 64496) is Validity.NOT_FOUND
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_validate_many(compressed):
+    root = roas(compressed)
+    routes = [
+        (CIDR("198.51.101.0/24"), 64498),
+        (CIDR("192.0.2.0/24"), 64496),
+        ("10.0.0.0/8", 64496),
+        (CIDR("198.51.100.0/24"), 64498),
+        (CIDR("198.51.100.0/23"), 64497),
+    ]
+    assert root.validate_many(routes) == [root.validate(*route) for route in routes]
+    assert root.validate_many(routes) == [
+        Validity.INVALID,
+        Validity.VALID,
+        Validity.NOT_FOUND,
+        Validity.VALID,
+        Validity.VALID,
+    ]
+
+
+def test_covering_roas():
+    root = roas()
+    assert list(root.covering_roas("198.51.100.128/25")) == [
+        (CIDR("198.51.100.0/22"), Roa(64497, 24)),
+        (CIDR("198.51.100.0/24"), Roa(64498, 24)),
+    ]
+
+
+def test_add_remove():
+    root = roas()
+    root.add(CIDR("192.0.2.0/24"), 64499, 25)
+    assert root.validate(CIDR("192.0.2.0/25"), 64499) is Validity.VALID
+    root.remove(CIDR("192.0.2.0/24"), 64499, 25)
+    assert root.validate(CIDR("192.0.2.0/25"), 64499) is Validity.INVALID
+    root.remove(CIDR("192.0.2.0/24"), 64496)
+    assert root.validate(CIDR("192.0.2.0/24"), 64496) is Validity.NOT_FOUND
+    with pytest.raises(KeyError):
+        root.remove(CIDR("198.51.100.0/22"), 64497)
+    with pytest.raises(ValueError):
+        root.add(CIDR("192.0.2.0/24"), 64496, 23)
+
+
+def test_from_roas():
+    root = RoaBottle.from_roas(
+        [
+            ("198.51.100.0/24", 64498, None),
+            ("198.51.100.0/22", 64497, 24),
+            ("198.51.100.0/24", 64499, None),
+        ]
+    )
+    assert len(root) == 2
+    assert root.get(CIDR("198.51.100.0/24")).value == [Roa(64498, 24), Roa(64499, 24)]
+    assert root.validate(CIDR("198.51.100.0/24"), 64499) is Validity.VALID
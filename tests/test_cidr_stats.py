@@ -0,0 +1,58 @@
+import pytest
+
+from cidr_man import CIDR
+
+from cidr_bottle import Bottle, FastBottle
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_stats(compressed):
+    root = FastBottle(compressed=compressed)
+    root.insert(CIDR("192.0.2.0/24"))
+    root.insert(CIDR("192.0.2.128/25"))
+    root.insert(CIDR("198.51.100.0/24"))
+    stats = root.stats()
+    assert stats.non_passing == 3
+    assert stats.nodes == stats.passing + stats.non_passing == len(list(root.walk()))
+    assert sum(stats.depths.values()) == stats.nodes
+    assert stats.bytes > 0
+    if compressed:
+        # the root, the branch point of the two /24s and the prefixes
+        assert stats.nodes == 5
+    else:
+        # 192.0.2.0/24 and 198.51.100.0/24 share their first five bits
+        assert stats.nodes == 1 + 24 + 1 + 24 - 5
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_instrumentation(compressed):
+    exported = []
+    counters = FastBottle.enable_instrumentation(exported.append)
+    try:
+        root = Bottle(compressed=compressed)
+        root.insert("192.0.2.0/25")
+        root.insert("192.0.2.128/25")
+        assert counters.sets == 2
+        assert counters.nodes_created == root.stats().nodes - 1
+        assert root.get("192.0.2.1").prefix == "192.0.2.0/25"
+        assert counters.finds == 3
+        assert root.get("198.51.100.0/24", covering=True) is None
+        root.children()
+        root.children()
+        assert (counters.children_misses, counters.children_hits) == (1, 1)
+        aggregated = FastBottle(compressed=compressed)
+        aggregated.insert(CIDR("192.0.2.0/25"), aggregate=True)
+        aggregated.insert(CIDR("192.0.2.128/25"), aggregate=True)
+        assert counters.aggregates == 2
+        assert counters.aggregate_steps == 1
+        snapshot = counters.export(root.stats())
+        assert exported == [snapshot]
+        assert snapshot["find_visits"] == sum(
+            visits * finds for visits, finds in snapshot["find_depths"].items()
+        )
+        assert snapshot["non_passing"] == 2
+    finally:
+        assert FastBottle.disable_instrumentation() is counters
+    assert FastBottle.instrumentation() is None
+    root.insert("198.51.100.0/24")
+    assert counters.sets == 4